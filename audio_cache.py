@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+
+from file_cache import FileCache
+
+
+class AudioCache(FileCache):
+    """
+    On-disk, content-addressed cache of generated music.
+
+    Every seeded sample is stored as a loudness-normalized WAV master, plus one
+    encoded variant per requested format. A variant can be re-encoded from the
+    master without running MusicGen again. Entries are keyed by the description
+    hash, model name, duration, seed, bulk count and sample index. The bulk count
+    is part of the key because sampling a batch draws from one random stream, so
+    the same seed gives different samples in batches of different sizes. The cache
+    is bounded in size and evicts least recently used files first.
+    """
+
+    def __init__(self, cache_dir="./cache/audio", max_size_mb=2048):
+        """
+        Args:
+            cache_dir (str): Folder to store cached audio in.
+            max_size_mb (float): Maximum total size of the cache in MB.
+        """
+        super().__init__(cache_dir, max_size_mb)
+        self._stats = {"hits": 0, "reencodes": 0, "misses": 0}
+
+    def make_key(
+        self,
+        description,
+        model_name,
+        duration,
+        seed,
+        bulk_count,
+        index,
+        segment_duration=None,
+        context_duration=None,
+    ):
+        """
+        Compute the cache key of one generated sample.
+
+        Args:
+            description (str): Text description the music was generated from.
+            model_name (str): MusicGen model name.
+            duration (float): Length of the music in seconds.
+            seed (int): Random seed of the generation.
+            bulk_count (int): Number of samples generated in the same batch.
+            index (int): Index of the sample in the batch.
+            segment_duration (float): Segment length of segmented generation, `None`
+                if the music was generated at once.
+            context_duration (float): Seconds of context each segment continued
+                from, `None` if the music was generated at once.
+
+        Returns:
+            str: Hex digest identifying the sample.
+        """
+        payload = {
+            "description": hashlib.sha256(description.encode("utf-8")).hexdigest(),
+            "model": model_name,
+            "duration": duration,
+            "seed": seed,
+            "bulk_count": bulk_count,
+            "index": index,
+            "segment_duration": segment_duration,
+            "context_duration": context_duration,
+        }
+        encoded = json.dumps(payload, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def master_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.wav"
+
+    def variant_path(self, key, audio_format):
+        if audio_format == "wav":
+            return self.master_path(key)
+        return self.cache_dir / key[:2] / f"{key}.{audio_format}"
+
+    def lookup(self, key, audio_format):
+        """
+        Find a cached sample.
+
+        Args:
+            key (str): Cache key from `make_key`.
+            audio_format (str): Requested audio format.
+
+        Returns:
+            tuple: (`"variant"`, path) when the format is cached, (`"master"`, path)
+                when only the WAV master is, or `None` on a miss.
+        """
+        for kind, path in (
+            ("variant", self.variant_path(key, audio_format)),
+            ("master", self.master_path(key)),
+        ):
+            try:
+                self._touch(path)
+            except FileNotFoundError:
+                continue
+            return kind, path
+        return None
+
+    def record(self, kind, count=1):
+        """Count sample lookups by result ('hits', 'reencodes' or 'misses')."""
+        with self._lock:
+            self._stats[kind] += count
+
+    def put(self, key, audio_format, source_path):
+        """Copy an encoded file into the cache and evict files over the size bound."""
+        path = self.variant_path(key, audio_format)
+        self._write(path, lambda tmp_path: shutil.copyfile(source_path, tmp_path))
+        return path
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def report(self):
+        stats = self.stats()
+        print(
+            f"Audio cache: hits={stats['hits']} reencodes={stats['reencodes']} "
+            f"misses={stats['misses']}"
+        )
+
+
+audio_cache = AudioCache(
+    cache_dir=os.environ.get("MANGA2MUSIC_CACHE_DIR", "./cache") + "/audio"
+)
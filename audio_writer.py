@@ -0,0 +1,164 @@
+import multiprocessing
+import threading
+import wave
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import torch
+
+
+class AudioWriter:
+    """
+    Background stage that encodes and writes generated audio.
+
+    Loudness normalization, compression and mp3/ogg encoding run in a thread or
+    process pool, so the model can generate the next batch while the previous one
+    is written. At most `max_pending` writes are queued; `submit` blocks beyond
+    that, which keeps finished tensors from piling up in memory.
+    """
+
+    def __init__(self, write_fn, workers=2, max_pending=8, use_processes=False):
+        """
+        Args:
+            write_fn (callable): Function called as `write_fn(audio, sr, output_path, audio_format)`.
+                Must be a module-level function when `use_processes` is set.
+            workers (int): Number of pool workers. 0 writes synchronously in `submit`.
+            max_pending (int): Maximum number of queued or running writes.
+            use_processes (bool): Whether to use a process pool instead of threads.
+        """
+        self.write_fn = write_fn
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._pending = []
+        self._executor = None
+        if workers > 0 and use_processes:
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        elif workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, audio, sr, output_path, audio_format, **kwargs):
+        """
+        Queue one file for writing, blocking while `max_pending` writes are in flight.
+
+        Extra keyword arguments are passed on to `write_fn`.
+        """
+        if self._executor is None:
+            self.write_fn(audio, sr, output_path, audio_format, **kwargs)
+            self._pending.append((str(output_path), None))
+            return
+
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(
+                self.write_fn, audio, sr, output_path, audio_format, **kwargs
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._pending.append((str(output_path), future))
+
+    def wait(self):
+        """
+        Wait until every queued file has been written.
+
+        Returns:
+            list: Paths of the written files, in submission order.
+        """
+        paths = []
+        for output_path, future in self._pending:
+            if future is not None:
+                # Re-raises the first write error
+                future.result()
+            paths.append(output_path)
+        return paths
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def loudness_gain(audio, sr, headroom_db=14, energy_floor=2e-3):
+    """
+    Compute the gain that brings `audio` to `-headroom_db` LUFS.
+
+    This matches the "loudness" strategy of `audio_write`, but returns the gain so
+    it can be fixed once and applied to audio that is written piece by piece.
+
+    Args:
+        audio (torch.Tensor): Audio of shape [C, T].
+        sr (int): Sample rate.
+        headroom_db (float): Target loudness below 0 LUFS.
+        energy_floor (float): RMS below which the audio is left unchanged.
+
+    Returns:
+        float: The linear gain.
+    """
+    if audio.pow(2).mean().sqrt().item() < energy_floor:
+        return 1.0
+    import torchaudio
+
+    loudness = torchaudio.transforms.Loudness(sr)(audio).item()
+    return 10.0 ** ((-headroom_db - loudness) / 20.0)
+
+
+class WavAppender:
+    """
+    16-bit PCM WAV file that grows as audio chunks are appended.
+
+    The header is updated after every chunk, so the file is playable while it is
+    still being written.
+    """
+
+    def __init__(self, output_path, sr, channels, gain=1.0, compressor=True):
+        """
+        Args:
+            output_path (str): Path of the WAV file.
+            sr (int): Sample rate.
+            channels (int): Number of audio channels.
+            gain (float): Gain applied to every chunk.
+            compressor (bool): Whether to soft-clip with tanh after the gain,
+                like `audio_write(loudness_compressor=True)`.
+        """
+        self.output_path = str(output_path)
+        self.gain = gain
+        self.compressor = compressor
+        self._file = wave.open(self.output_path, "wb")
+        self._file.setnchannels(channels)
+        self._file.setsampwidth(2)
+        self._file.setframerate(sr)
+
+    def write(self, audio):
+        """
+        Append a chunk of audio.
+
+        Args:
+            audio (torch.Tensor): Audio of shape [C, T].
+
+        Returns:
+            np.ndarray: The written 16-bit samples, of shape [T, C].
+        """
+        audio = audio.detach().float().cpu() * self.gain
+        if self.compressor:
+            audio = torch.tanh(audio)
+        pcm = (audio.clamp(-1, 1) * 32767).round().to(torch.int16)
+        # WAV frames interleave the channels
+        pcm = pcm.t().contiguous().numpy()
+        self._file.writeframes(pcm.tobytes())
+        return pcm
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
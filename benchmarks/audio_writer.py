@@ -0,0 +1,140 @@
+"""
+Measure the wall-clock savings of overlapping generation with audio writing.
+
+    python -m benchmarks.audio_writer --batches 8 --batch-size 4 --audio-format mp3
+
+By default generation is simulated with a fixed delay per batch, so only the
+writer stage is real. Pass `--model musicgen-small` to run
+`generate_music_from_folder_of_descriptions` end to end instead.
+"""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+from audio_writer import AudioWriter
+from description2music import generate_music_from_folder_of_descriptions, save_audio
+
+SAMPLE_RATE = 32000
+
+
+def run_simulated(
+    batches, batch_size, duration, audio_format, generate_seconds, workers
+):
+    """Run simulated generation followed by real writes, return the wall-clock time."""
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        with AudioWriter(save_audio, workers=workers) as writer:
+            for batch in range(batches):
+                # Stand-in for model.generate
+                time.sleep(generate_seconds)
+                musics = 0.1 * torch.randn(batch_size, 1, int(duration * SAMPLE_RATE))
+                for i, music in enumerate(musics):
+                    output_path = Path(output_dir) / f"{batch}_{i}.{audio_format}"
+                    writer.submit(music, SAMPLE_RATE, output_path, audio_format)
+            writer.wait()
+        return time.perf_counter() - start
+
+
+def run_model(model_name, count, batch_size, duration, audio_format, device, workers):
+    """Generate `count` descriptions with MusicGen, return the wall-clock time."""
+    with tempfile.TemporaryDirectory() as work_dir:
+        description_dir = Path(work_dir) / "descriptions"
+        description_dir.mkdir()
+        for i in range(count):
+            (description_dir / f"{i}.txt").write_text(
+                "A calm lo-fi piece with soft piano and vinyl crackle."
+            )
+        start = time.perf_counter()
+        generate_music_from_folder_of_descriptions(
+            description_dir,
+            Path(work_dir) / "music",
+            model_name,
+            duration,
+            audio_format,
+            device=device,
+            batch_size=batch_size,
+            writer_workers=workers,
+        )
+        return time.perf_counter() - start
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the audio writer stage")
+    parser.add_argument("--batches", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--duration", type=int, default=10)
+    parser.add_argument(
+        "--audio-format",
+        type=str,
+        choices=["wav", "mp3", "ogg", "flac"],
+        default="mp3",
+    )
+    parser.add_argument(
+        "--generate-seconds",
+        type=float,
+        default=2.0,
+        help="Simulated generation time per batch",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[0, 1, 2, 4],
+        help="Writer worker counts to compare (0 is serial writing)",
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=None,
+        help="Run real MusicGen generation with this model instead of simulating it",
+    )
+    parser.add_argument("--device", type=str, default="cuda")
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path to save the results as JSON"
+    )
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.workers:
+        if args.model:
+            elapsed = run_model(
+                args.model,
+                args.batches * args.batch_size,
+                args.batch_size,
+                args.duration,
+                args.audio_format,
+                args.device,
+                workers,
+            )
+        else:
+            elapsed = run_simulated(
+                args.batches,
+                args.batch_size,
+                args.duration,
+                args.audio_format,
+                args.generate_seconds,
+                workers,
+            )
+        results.append({"writer_workers": workers, "wall_clock_s": elapsed})
+        print(f"writer_workers={workers}: {elapsed:.2f}s")
+
+    serial = next((r for r in results if r["writer_workers"] == 0), None)
+    if serial is not None:
+        for result in results:
+            saving = 1 - result["wall_clock_s"] / serial["wall_clock_s"]
+            print(f"writer_workers={result['writer_workers']}: {saving:.0%} saved")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
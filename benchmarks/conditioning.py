@@ -0,0 +1,111 @@
+"""
+Measure text-conditioning time against generation time, with and without the cache.
+
+    python -m benchmarks.conditioning --model musicgen-small --bulk-count 8 --device cuda
+
+The conditioning step is timed in isolation the way `model.generate` runs it
+(descriptions plus the empty classifier-free guidance descriptions), once on the
+stock T5 conditioner, then cold and warm through the conditioning cache.
+"""
+
+import json
+import statistics
+import time
+
+import torch
+
+DESCRIPTION = (
+    "An energetic orchestral piece with driving strings, brass stabs and "
+    "thundering percussion, building tension for a climactic battle."
+)
+
+
+def _synchronize(device):
+    if str(device).startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def time_conditioning(model, descriptions, runs):
+    """Return the mean seconds to tokenize and encode a batch of descriptions."""
+    from audiocraft.modules.conditioners import ClassifierFreeGuidanceDropout
+
+    attributes, _ = model._prepare_tokens_and_attributes(descriptions, None)
+    attributes = attributes + ClassifierFreeGuidanceDropout(p=1.0)(attributes)
+    provider = model.lm.condition_provider
+
+    timings = []
+    for _ in range(runs):
+        _synchronize(model.device)
+        start = time.perf_counter()
+        with torch.no_grad():
+            provider(provider.tokenize(attributes))
+        _synchronize(model.device)
+        timings.append(time.perf_counter() - start)
+    return statistics.mean(timings)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark text conditioning")
+    parser.add_argument(
+        "--model",
+        type=str,
+        choices=["musicgen-small", "musicgen-medium", "musicgen-large"],
+        default="musicgen-small",
+    )
+    parser.add_argument("--bulk-count", type=int, default=8)
+    parser.add_argument("--duration", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--device", type=str, default="cuda")
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path to save the results as JSON"
+    )
+    args = parser.parse_args()
+
+    from audiocraft.models import MusicGen
+
+    from conditioning_cache import ConditioningCache
+
+    model = MusicGen.get_pretrained(f"facebook/{args.model}", device=args.device)
+    model.set_generation_params(duration=args.duration)
+    descriptions = [DESCRIPTION] * args.bulk_count
+
+    uncached_s = time_conditioning(model, descriptions, args.runs)
+
+    cache = ConditioningCache()
+    cache.install(model, args.model)
+    cold_s = time_conditioning(model, descriptions, 1)
+    warm_s = time_conditioning(model, descriptions, args.runs)
+
+    _synchronize(args.device)
+    start = time.perf_counter()
+    model.generate(descriptions)
+    _synchronize(args.device)
+    generate_s = time.perf_counter() - start
+
+    results = {
+        "model": args.model,
+        "bulk_count": args.bulk_count,
+        "duration": args.duration,
+        "conditioning_uncached_s": uncached_s,
+        "conditioning_cold_s": cold_s,
+        "conditioning_warm_s": warm_s,
+        "generate_s": generate_s,
+        "cache": cache.stats(),
+    }
+    print(f"Conditioning, stock:        {uncached_s * 1000:.1f}ms")
+    print(f"Conditioning, cache cold:   {cold_s * 1000:.1f}ms")
+    print(f"Conditioning, cache warm:   {warm_s * 1000:.1f}ms")
+    print(f"Generation ({args.duration}s, cached): {generate_s:.2f}s")
+    print(f"Stock conditioning share of generation: {uncached_s / generate_s:.1%}")
+    cache.report()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Measure CPU inference speed at each optimization level.
+
+    python -m benchmarks.cpu_inference --levels none int8 bf16 --compile
+
+MusicGen is reported as the real-time factor (generation time divided by the
+length of the generated audio, lower is better) and LLaVA as decoded tokens per
+second. Each level loads fresh models, so the results do not share weights.
+"""
+
+import gc
+import json
+import time
+from pathlib import Path
+
+DESCRIPTION = (
+    "An energetic orchestral piece with driving strings, brass stabs and "
+    "thundering percussion, building tension for a climactic battle."
+)
+
+
+def time_musicgen(model_name, duration, runs):
+    """Return the mean real-time factor of MusicGen on CPU."""
+    from description2music import load_model
+
+    model = load_model(model_name, device="cpu")
+    model.set_generation_params(duration=duration)
+    model.generate([DESCRIPTION])  # Warm-up, and compilation when enabled
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.generate([DESCRIPTION])
+        timings.append(time.perf_counter() - start)
+    del model
+    gc.collect()
+    return sum(timings) / len(timings) / duration
+
+
+def time_llava(model_name, image_paths, max_new_tokens, runs):
+    """Return the mean decoded tokens per second of LLaVA on CPU."""
+    from manga2description import LLAVA_MODELS
+    from models.llava import LLAVA
+
+    llava = LLAVA(pretrained_model=LLAVA_MODELS[model_name], device="cpu")
+    params = {"do_sample": False, "max_new_tokens": max_new_tokens}
+    llava.generate_music_description(image_paths, **params)
+    tokens = 0
+    elapsed = 0.0
+    for _ in range(runs):
+        start = time.perf_counter()
+        description = llava.generate_music_description(image_paths, **params)
+        elapsed += time.perf_counter() - start
+        tokens += len(llava.tokenizer(description).input_ids)
+    del llava
+    gc.collect()
+    return tokens / elapsed
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark CPU inference")
+    parser.add_argument(
+        "--levels",
+        type=str,
+        nargs="+",
+        choices=["none", "int8", "bf16"],
+        default=["none", "int8", "bf16"],
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Also run every level with the decoder step compiled",
+    )
+    parser.add_argument("--music-model", type=str, default="musicgen-small")
+    parser.add_argument("--duration", type=int, default=5)
+    parser.add_argument("--llava-model", type=str, default="llava-0.5b")
+    parser.add_argument("--manga-path", type=str, default="./samples")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument(
+        "--skip-llava", action="store_true", help="Only benchmark MusicGen"
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path to save the results as JSON"
+    )
+    args = parser.parse_args()
+
+    from cpu_inference import bf16_supported, cpu_inference
+
+    intra_op, inter_op = cpu_inference.setup_threads()
+    image_paths = sorted(Path(args.manga_path).glob("*.jpg"))[:4]
+    configurations = [(level, False) for level in args.levels]
+    if args.compile:
+        configurations += [(level, True) for level in args.levels]
+
+    runs = []
+    for level, compile in configurations:
+        if level == "bf16" and not bf16_supported():
+            print("Skipping bf16: not supported natively on this CPU")
+            continue
+        cpu_inference.configure(optimization=level, compile=compile)
+        name = cpu_inference.dtype_name()
+        run = {"level": level, "compile": compile}
+        run["musicgen_rtf"] = time_musicgen(args.music_model, args.duration, args.runs)
+        print(f"{name}: {args.music_model} real-time factor {run['musicgen_rtf']:.2f}")
+        if not args.skip_llava:
+            run["llava_tokens_per_s"] = time_llava(
+                args.llava_model, image_paths, args.max_new_tokens, args.runs
+            )
+            print(
+                f"{name}: {args.llava_model} {run['llava_tokens_per_s']:.1f} tokens/s"
+            )
+        runs.append(run)
+
+    results = {
+        "music_model": args.music_model,
+        "duration": args.duration,
+        "llava_model": None if args.skip_llava else args.llava_model,
+        "intra_op_threads": intra_op,
+        "inter_op_threads": inter_op,
+        "bf16_supported": bf16_supported(),
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare end-to-end latency and token usage of the two GPT description modes.
+
+    python -m benchmarks.gpt_modes --manga-path ./samples --model gpt-4o-mini --runs 5
+
+Pass `--mock` to run against the local mock server instead of the OpenAI API.
+"""
+
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
+
+def benchmark_mode(gpt4o, image_paths, mode, runs):
+    """
+    Time `runs` description requests in the given mode.
+
+    Returns:
+        dict: Mean/min/max latency in seconds and mean requests and tokens per run.
+    """
+    latencies = []
+    usage_before = dict(gpt4o.usage)
+    for _ in range(runs):
+        start = time.perf_counter()
+        gpt4o.generate_music_description(image_paths, mode=mode)
+        latencies.append(time.perf_counter() - start)
+
+    usage = {key: gpt4o.usage[key] - usage_before[key] for key in usage_before}
+    return {
+        "mode": mode,
+        "runs": runs,
+        "latency_mean_s": statistics.mean(latencies),
+        "latency_min_s": min(latencies),
+        "latency_max_s": max(latencies),
+        "requests_per_run": usage["requests"] / runs,
+        "prompt_tokens_per_run": usage["prompt_tokens"] / runs,
+        "completion_tokens_per_run": usage["completion_tokens"] / runs,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark GPT description modes")
+    parser.add_argument("--manga-path", type=str, default="./samples")
+    parser.add_argument(
+        "--model", type=str, choices=["gpt-4o", "gpt-4o-mini"], default="gpt-4o-mini"
+    )
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--mock", action="store_true", help="Run against the local mock server"
+    )
+    parser.add_argument(
+        "--mock-latency",
+        type=float,
+        default=1.0,
+        help="Mean latency of the mock server in seconds",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path to save the results as JSON"
+    )
+    args = parser.parse_args()
+
+    if args.mock:
+        from benchmarks.mock_openai_server import start_mock_server
+
+        server = start_mock_server(latency=args.mock_latency)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "mock")
+
+    from models.gpt4o import GPT_MODES, GPT4o
+
+    image_paths = sorted(Path(args.manga_path).glob("*.jpg"))
+    gpt4o = GPT4o(model=args.model)
+
+    results = [
+        benchmark_mode(gpt4o, image_paths, mode, args.runs) for mode in GPT_MODES
+    ]
+
+    print(
+        f"{'mode':<12}{'latency (s)':>14}{'requests':>10}"
+        f"{'prompt tok':>12}{'compl. tok':>12}"
+    )
+    for result in results:
+        print(
+            f"{result['mode']:<12}{result['latency_mean_s']:>14.2f}"
+            f"{result['requests_per_run']:>10.1f}"
+            f"{result['prompt_tokens_per_run']:>12.0f}"
+            f"{result['completion_tokens_per_run']:>12.0f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
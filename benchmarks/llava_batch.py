@@ -0,0 +1,97 @@
+"""
+Compare one-chapter-at-a-time LLaVA decoding with batched decoding.
+
+    python -m benchmarks.llava_batch --library-path ./library --model llava-0.5b --device cpu
+
+Decoding is greedy, so every batched description should match the
+single-sequence one; mismatches are counted and reported.
+"""
+
+import json
+import time
+from pathlib import Path
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark batched LLaVA decoding")
+    parser.add_argument(
+        "--library-path",
+        type=str,
+        required=True,
+        help="Path to folder containing one folder of manga images per chapter",
+    )
+    parser.add_argument(
+        "--model", type=str, choices=["llava-7b", "llava-0.5b"], default="llava-0.5b"
+    )
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path to save the results as JSON"
+    )
+    args = parser.parse_args()
+
+    from manga2description import get_llava, list_chapters
+
+    chapters = [
+        sorted(Path(chapter).glob("*.jpg"))
+        for chapter in list_chapters(args.library_path)
+    ]
+    params = {"do_sample": False, "max_new_tokens": args.max_new_tokens}
+
+    with get_llava(args.model, device=args.device) as llava:
+        start = time.perf_counter()
+        reference = [
+            llava.generate_music_description(image_paths, **params)
+            for image_paths in chapters
+        ]
+        sequential_s = time.perf_counter() - start
+
+        runs = []
+        for batch_size in args.batch_sizes:
+            start = time.perf_counter()
+            descriptions = llava.generate_music_descriptions(
+                chapters, batch_size=batch_size, **params
+            )
+            elapsed = time.perf_counter() - start
+            mismatches = sum(a != b for a, b in zip(descriptions, reference))
+            runs.append(
+                {
+                    "batch_size": batch_size,
+                    "wall_clock_s": elapsed,
+                    "chapters_per_min": len(chapters) / elapsed * 60,
+                    "speedup": sequential_s / elapsed,
+                    "mismatches": mismatches,
+                }
+            )
+
+    results = {
+        "model": args.model,
+        "device": args.device,
+        "chapters": len(chapters),
+        "max_new_tokens": args.max_new_tokens,
+        "sequential_s": sequential_s,
+        "sequential_chapters_per_min": len(chapters) / sequential_s * 60,
+        "batched": runs,
+    }
+    print(
+        f"Sequential: {sequential_s:.1f}s "
+        f"({results['sequential_chapters_per_min']:.2f} chapters/min)"
+    )
+    for run in runs:
+        print(
+            f"Batch size {run['batch_size']}: {run['wall_clock_s']:.1f}s "
+            f"({run['chapters_per_min']:.2f} chapters/min, {run['speedup']:.2f}x), "
+            f"{run['mismatches']}/{len(chapters)} descriptions differ"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Local mock of the OpenAI chat completions API.
+
+Serves `POST /v1/chat/completions` with canned answers after a configurable
+latency, and can inject rate-limit (429) and server (500) errors, so the GPT
+pipelines can be exercised without network access or an API key. The server
+counts requests, errors and the peak number of requests in flight in
+`server.stats`:
+
+    python -m benchmarks.mock_openai_server --port 8000 --latency 1.0 --error-rate 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=mock \\
+        python manga2description.py --library-path ./library --model gpt-4o-mini
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANALYSIS_ANSWER = (
+    "1. Category: drama, action\n"
+    "2. Emotion: tense and suspenseful\n"
+    "3. Focus: visuals\n"
+    "4. Plot: a fisherman is dragged into the sea by a giant fish."
+)
+DESCRIPTION_ANSWER = (
+    "A tense orchestral piece with pulsing low strings, distant brass swells and "
+    "sparse percussion, building a dark, suspenseful atmosphere at a moderate tempo."
+)
+
+STRUCTURED_ANSWER = {
+    "category": ["drama", "action"],
+    "emotion": "tense and suspenseful",
+    "focus": "visuals",
+    "plot": "a fisherman is dragged into the sea by a giant fish.",
+    "music_description": DESCRIPTION_ANSWER,
+}
+
+
+def _count_tokens(messages):
+    prompt_tokens = 0
+    for message in messages:
+        content = message["content"]
+        parts = [content] if isinstance(content, str) else content
+        for part in parts:
+            if isinstance(part, str):
+                prompt_tokens += len(part) // 4
+            elif part.get("type") == "text":
+                prompt_tokens += len(part["text"]) // 4
+            else:
+                prompt_tokens += 765
+    return prompt_tokens
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    latency = 0.5
+    jitter = 0.1
+    error_rate = 0.0
+    fail_first = 0
+    token_interval = 0.02
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _answer(self, request):
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            return json.dumps(STRUCTURED_ANSWER)
+        messages = request["messages"]
+        content = messages[-1]["content"]
+        has_images = not isinstance(content, str)
+        return ANALYSIS_ANSWER if has_images else DESCRIPTION_ANSWER
+
+    def _stream(self, request, answer, prompt_tokens, completion_tokens):
+        """Send the answer word by word as server-sent events."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        words = answer.split(" ")
+        chunks = []
+        for i, word in enumerate(words):
+            content = word if i == len(words) - 1 else f"{word} "
+            chunks.append(
+                {"index": 0, "delta": {"content": content}, "finish_reason": None}
+            )
+        chunks.append({"index": 0, "delta": {}, "finish_reason": "stop"})
+
+        for choice in chunks:
+            self._send_event(request, completion_id, [choice])
+            time.sleep(self.token_interval)
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._send_event(
+                request,
+                completion_id,
+                [],
+                usage={
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            )
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, request, completion_id, choices, usage=None):
+        event = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4o"),
+            "choices": choices,
+            "usage": usage,
+        }
+        self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length))
+
+        stats = self.server.stats
+        with self.server.stats_lock:
+            stats["requests"] += 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            rate_limited = stats["requests"] <= self.fail_first
+        # A request stops counting as in flight before its response is sent, so
+        # a client that sends its next request right away is never counted twice
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter * self.latency)))
+        with self.server.stats_lock:
+            stats["in_flight"] -= 1
+
+        if rate_limited or random.random() < self.error_rate:
+            if rate_limited or random.random() < 0.5:
+                with self.server.stats_lock:
+                    stats["rate_limited"] += 1
+                self._send_json(
+                    429,
+                    {"error": {"message": "Rate limit reached", "type": "requests"}},
+                    headers={"retry-after": "0.5"},
+                )
+            else:
+                with self.server.stats_lock:
+                    stats["server_errors"] += 1
+                self._send_json(500, {"error": {"message": "Internal error"}})
+            return
+
+        answer = self._answer(request)
+        prompt_tokens = _count_tokens(request["messages"])
+        completion_tokens = len(answer) // 4
+        if request.get("stream"):
+            self._stream(request, answer, prompt_tokens, completion_tokens)
+            return
+        self._send_json(
+            200,
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+        )
+
+
+def start_mock_server(
+    host="127.0.0.1", port=0, latency=0.5, jitter=0.1, error_rate=0.0, fail_first=0
+):
+    """
+    Start the mock server in a background thread.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind (0 picks a free port).
+        latency (float): Mean response latency in seconds.
+        jitter (float): Standard deviation of the latency, relative to its mean.
+        error_rate (float): Fraction of requests answered with a 429 or 500 error.
+        fail_first (int): Number of requests answered with a 429 before any other.
+
+    Returns:
+        ThreadingHTTPServer: The running server. Its base URL is
+            `http://{host}:{server.server_port}/v1`.
+    """
+    handler = type(
+        "ConfiguredMockOpenAIHandler",
+        (MockOpenAIHandler,),
+        {
+            "latency": latency,
+            "jitter": jitter,
+            "error_rate": error_rate,
+            "fail_first": fail_first,
+        },
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.stats = {
+        "requests": 0,
+        "in_flight": 0,
+        "max_in_flight": 0,
+        "rate_limited": 0,
+        "server_errors": 0,
+    }
+    server.stats_lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible server")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--latency", type=float, default=0.5, help="Mean response latency in seconds"
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.1,
+        help="Standard deviation of the latency, relative to its mean",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests answered with a 429 or 500 error",
+    )
+    args = parser.parse_args()
+
+    server = start_mock_server(
+        args.host, args.port, args.latency, args.jitter, args.error_rate
+    )
+    print(f"Mock OpenAI server running at http://{args.host}:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
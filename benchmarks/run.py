@@ -0,0 +1,432 @@
+"""
+Reproducible benchmark suite of the description and music pipelines.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --output new.json --compare results.json
+
+Each case times one pipeline entry point over a sweep of its parameters:
+
+- `describe-gpt`: `generate_descriptions_from_manga` with a GPT model, by pages.
+- `describe-llava`: `generate_descriptions_from_manga` with LLaVA, by pages.
+- `music-text`: `generate_music_from_text`, by bulk count, duration and format.
+- `music-folder`: `generate_music_from_folder_of_descriptions`, by number of
+  descriptions, duration and format.
+
+By default everything runs offline on CPU: GPT requests go to the local mock
+server with a fixed latency, and MusicGen and LLaVA are replaced by tiny
+randomly initialized stand-ins (`benchmarks.standins`). `--gpt-backend openai`
+and `--model-backend real` use the real services and models instead. Pages are
+drawn from a seeded generator, and caches live in a temporary folder, so runs
+are comparable across commits. Each case reports p50/p99 latency, throughput and
+the peak resident memory of the process while it ran. `--compare` prints the
+change against an earlier results file and exits with status 1 when a p50
+latency regressed by more than `--threshold`.
+"""
+
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from itertools import product
+from pathlib import Path
+
+CASES = ["describe-gpt", "describe-llava", "music-text", "music-folder"]
+
+DESCRIPTION = (
+    "An energetic orchestral piece with driving strings, brass stabs and "
+    "thundering percussion, building tension for a climactic battle."
+)
+
+
+class MemorySampler:
+    """Sample the resident set size of the process in a background thread."""
+
+    def __init__(self, interval=0.01):
+        import psutil
+
+        self.interval = interval
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self.peak_bytes = 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self._process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_bytes = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values, q):
+    """Return the `q`-th percentile of `values`, linearly interpolated."""
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def make_pages(folder, count, seed=0):
+    """Draw `count` manga-like pages of random panels into `folder`."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        page = Image.new("L", (1000, 1400), 255)
+        draw = ImageDraw.Draw(page)
+        for _ in range(rng.randint(3, 6)):
+            x, y = rng.randint(20, 700), rng.randint(20, 1100)
+            w, h = rng.randint(200, 960 - x), rng.randint(200, 1360 - y)
+            draw.rectangle((x, y, x + w, y + h), outline=0, width=6)
+            for _ in range(rng.randint(5, 20)):
+                cx, cy = rng.randint(x, x + w), rng.randint(y, y + h)
+                r = rng.randint(5, 80)
+                draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=rng.randint(0, 255))
+        page.convert("RGB").save(folder / f"{i:03d}.jpg", quality=90)
+    return folder
+
+
+def make_descriptions(folder, count):
+    """Write `count` description files into `folder`."""
+    folder.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        with open(folder / f"{i:03d}.txt", "w") as f:
+            f.write(f"{DESCRIPTION} Variation {i}.")
+    return folder
+
+
+def time_case(run, runs, warmup=1):
+    """
+    Time `run` after `warmup` untimed calls.
+
+    Returns:
+        dict: Latencies in seconds and the peak RSS in MB while timing.
+    """
+    for _ in range(warmup):
+        run()
+    latencies = []
+    with MemorySampler() as memory:
+        for _ in range(runs):
+            start = time.perf_counter()
+            run()
+            latencies.append(time.perf_counter() - start)
+    return {
+        "latency_s": latencies,
+        "p50_s": percentile(latencies, 50),
+        "p99_s": percentile(latencies, 99),
+        "mean_s": sum(latencies) / len(latencies),
+        "peak_rss_mb": memory.peak_bytes / 1024**2,
+    }
+
+
+def case_id(case, params):
+    """Return the key a case is matched by across results files."""
+    return case + "/" + ",".join(f"{k}={v}" for k, v in sorted(params.items()))
+
+
+def benchmark_describe(case, pages, args, work_dir):
+    """Benchmark `generate_descriptions_from_manga` on a folder of `pages` pages."""
+    from manga2description import generate_descriptions_from_manga
+
+    model = args.gpt_model if case == "describe-gpt" else args.llava_model
+    manga_path = make_pages(work_dir / f"pages-{pages}", pages, seed=args.seed)
+
+    def run():
+        generate_descriptions_from_manga(
+            str(manga_path),
+            str(work_dir / "descriptions"),
+            model,
+            device=args.device,
+            use_cache=False,
+            max_new_tokens=args.max_new_tokens,
+        )
+
+    result = time_case(run, args.runs)
+    result["throughput"] = pages / result["p50_s"]
+    result["throughput_unit"] = "pages/s"
+    return result
+
+
+def benchmark_music_text(bulk_count, duration, audio_format, args, work_dir):
+    """Benchmark `generate_music_from_text` for one bulk request."""
+    from description2music import generate_music_from_text
+
+    def run():
+        generate_music_from_text(
+            DESCRIPTION,
+            str(work_dir / "music-text"),
+            args.music_model,
+            duration,
+            audio_format,
+            bulk_count=bulk_count,
+            device=args.device,
+            seed=args.seed,
+            use_cache=False,
+        )
+
+    result = time_case(run, args.runs)
+    result["throughput"] = bulk_count * duration / result["p50_s"]
+    result["throughput_unit"] = "audio_s/s"
+    return result
+
+
+def benchmark_music_folder(count, duration, audio_format, args, work_dir):
+    """Benchmark `generate_music_from_folder_of_descriptions` on `count` descriptions."""
+    from description2music import generate_music_from_folder_of_descriptions
+
+    description_path = make_descriptions(work_dir / f"descriptions-{count}", count)
+
+    def run():
+        generate_music_from_folder_of_descriptions(
+            str(description_path),
+            str(work_dir / "music-folder"),
+            args.music_model,
+            duration,
+            audio_format,
+            device=args.device,
+            seed=args.seed,
+        )
+
+    result = time_case(run, args.runs)
+    result["throughput"] = count * duration / result["p50_s"]
+    result["throughput_unit"] = "audio_s/s"
+    return result
+
+
+def environment():
+    """Describe the commit and machine the results were measured on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    import torch
+
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the change of every case against `baseline`.
+
+    Returns:
+        list: IDs of the cases whose p50 latency grew by more than `threshold`.
+    """
+    previous = {case["id"]: case for case in baseline["cases"]}
+    regressions = []
+    print(f"Compared with {baseline['environment'].get('commit')}:")
+    for case in results["cases"]:
+        before = previous.get(case["id"])
+        if before is None:
+            print(f"  {case['id']}: new")
+            continue
+        change = case["p50_s"] / before["p50_s"] - 1
+        memory_change = case["peak_rss_mb"] - before["peak_rss_mb"]
+        flag = ""
+        if change > threshold:
+            regressions.append(case["id"])
+            flag = " REGRESSION"
+        print(
+            f"  {case['id']}: p50 {before['p50_s']:.3f}s -> {case['p50_s']:.3f}s "
+            f"({change:+.1%}), peak RSS {memory_change:+.0f}MB{flag}"
+        )
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--cases", type=str, nargs="+", choices=CASES, default=CASES)
+    parser.add_argument(
+        "--folder-sizes",
+        type=int,
+        nargs="+",
+        default=[2, 8],
+        help="Pages per manga folder, and descriptions per description folder",
+    )
+    parser.add_argument("--bulk-counts", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--durations", type=int, nargs="+", default=[1, 4])
+    parser.add_argument(
+        "--formats",
+        type=str,
+        nargs="+",
+        choices=["wav", "mp3", "ogg", "flac"],
+        default=["wav", "mp3"],
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--gpt-backend",
+        type=str,
+        choices=["mock", "openai"],
+        default="mock",
+        help="Serve GPT requests from the local mock server or the OpenAI API",
+    )
+    parser.add_argument(
+        "--mock-latency",
+        type=float,
+        default=0.2,
+        help="Latency of the mock server in seconds",
+    )
+    parser.add_argument(
+        "--model-backend",
+        type=str,
+        choices=["tiny", "real"],
+        default="tiny",
+        help="Run tiny randomly initialized models or the real checkpoints",
+    )
+    parser.add_argument("--gpt-model", type=str, default="gpt-4o-mini")
+    parser.add_argument("--llava-model", type=str, default="llava-0.5b")
+    parser.add_argument("--music-model", type=str, default="musicgen-small")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path to save the results as JSON"
+    )
+    parser.add_argument(
+        "--compare", type=str, default=None, help="Results JSON to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative p50 latency increase reported as a regression",
+    )
+    args = parser.parse_args()
+
+    work = tempfile.TemporaryDirectory(prefix="manga2music-bench-")
+    work_dir = Path(work.name)
+    # Caches must start empty and stay out of the real cache folder; set before
+    # the pipeline modules create their singletons
+    os.environ["MANGA2MUSIC_CACHE_DIR"] = str(work_dir / "cache")
+    os.environ.pop("MANGA2MUSIC_MODEL_MEMORY_GB", None)
+    if args.gpt_backend == "mock":
+        from benchmarks.mock_openai_server import start_mock_server
+
+        server = start_mock_server(latency=args.mock_latency, jitter=0.0)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "mock")
+
+    from cpu_inference import cpu_inference
+
+    # Optimizations depend on the CPU, keep the stand-ins comparable everywhere
+    if args.model_backend == "tiny":
+        cpu_inference.configure(optimization="none")
+    if args.device == "cpu":
+        cpu_inference.setup_threads()
+    if args.model_backend == "tiny":
+        from benchmarks.standins import install_standins
+
+        install_standins(
+            music_models=[args.music_model],
+            llava_models=[args.llava_model],
+            device=args.device,
+        )
+
+    sweeps = {
+        "describe-gpt": [{"pages": n} for n in args.folder_sizes],
+        "describe-llava": [{"pages": n} for n in args.folder_sizes],
+        "music-text": [
+            {"bulk_count": b, "duration": d, "format": f}
+            for b, d, f in product(args.bulk_counts, args.durations, args.formats)
+        ],
+        "music-folder": [
+            {"descriptions": n, "duration": d, "format": f}
+            for n, d, f in product(args.folder_sizes, args.durations, args.formats)
+        ],
+    }
+    cases = []
+    try:
+        for case in args.cases:
+            for params in sweeps[case]:
+                random.seed(args.seed)
+                if case.startswith("describe"):
+                    result = benchmark_describe(case, params["pages"], args, work_dir)
+                elif case == "music-text":
+                    result = benchmark_music_text(
+                        params["bulk_count"],
+                        params["duration"],
+                        params["format"],
+                        args,
+                        work_dir,
+                    )
+                else:
+                    result = benchmark_music_folder(
+                        params["descriptions"],
+                        params["duration"],
+                        params["format"],
+                        args,
+                        work_dir,
+                    )
+                result = {"id": case_id(case, params), "case": case, **params, **result}
+                cases.append(result)
+                print(
+                    f"{result['id']}: p50 {result['p50_s']:.3f}s, "
+                    f"p99 {result['p99_s']:.3f}s, "
+                    f"{result['throughput']:.2f} {result['throughput_unit']}, "
+                    f"peak RSS {result['peak_rss_mb']:.0f}MB"
+                )
+    finally:
+        work.cleanup()
+
+    results = {
+        "environment": environment(),
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "compare", "threshold")
+        },
+        "cases": cases,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(
+                f"{len(regressions)} cases regressed by more than {args.threshold:.0%}"
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Simulate concurrent GUI users to measure what request batching buys.
+
+    python -m benchmarks.scheduler --users 32 --max-batch-size 16 --max-wait 0.5
+
+Generation is replaced by a fake model whose batch time is a fixed cost plus a
+smaller cost per sample, which is how MusicGen behaves on a GPU. Everything else
+goes through the real `BatchScheduler`, so this runs on CPU in seconds.
+"""
+
+import json
+import random
+import statistics
+import threading
+import time
+
+from scheduler import BatchScheduler
+
+
+def fake_generate(batch_seconds, sample_seconds):
+    """Return a `run_batch` function that sleeps like a batched model would."""
+
+    def run_batch(key, payloads):
+        samples = sum(len(payload) for payload in payloads)
+        time.sleep(batch_seconds + sample_seconds * samples)
+        return [
+            [f"{key}:{description}" for description in payload] for payload in payloads
+        ]
+
+    return run_batch
+
+
+def simulate(scheduler, users, bulk_count, arrival_window, keys):
+    """Submit one job per user at random times, return the per-job latencies."""
+    latencies = []
+    lock = threading.Lock()
+
+    def user(index):
+        time.sleep(random.uniform(0, arrival_window))
+        start = time.perf_counter()
+        key = keys[index % len(keys)]
+        job = scheduler.submit(key, [f"user {index}"] * bulk_count, size=bulk_count)
+        job.result()
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def run(
+    users, bulk_count, max_batch_size, max_wait, arrival_window, keys, batch_s, sample_s
+):
+    scheduler = BatchScheduler(
+        fake_generate(batch_s, sample_s),
+        max_batch_size=max_batch_size,
+        max_wait=max_wait,
+        name=f"max_batch_size={max_batch_size}",
+    )
+    start = time.perf_counter()
+    latencies = simulate(scheduler, users, bulk_count, arrival_window, keys)
+    elapsed = time.perf_counter() - start
+    scheduler.close()
+    scheduler.report()
+    latencies.sort()
+    return {
+        "max_batch_size": max_batch_size,
+        "max_wait_s": max_wait,
+        "wall_clock_s": elapsed,
+        "latency_p50_s": statistics.median(latencies),
+        "latency_p99_s": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+        **scheduler.stats(),
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the batch scheduler")
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--bulk-count", type=int, default=1)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait", type=float, default=0.5)
+    parser.add_argument(
+        "--arrival-window",
+        type=float,
+        default=2.0,
+        help="Users submit at random times within this many seconds",
+    )
+    parser.add_argument(
+        "--keys",
+        type=int,
+        default=1,
+        help="Number of distinct (model, duration) combinations requested",
+    )
+    parser.add_argument(
+        "--batch-seconds", type=float, default=1.0, help="Fixed cost of one batch"
+    )
+    parser.add_argument(
+        "--sample-seconds", type=float, default=0.1, help="Cost per sample in a batch"
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path to save the results as JSON"
+    )
+    args = parser.parse_args()
+
+    keys = [("musicgen-medium", 10 + 10 * i, "cuda") for i in range(args.keys)]
+    results = [
+        # One request per generate call, like the GUI without the scheduler
+        run(
+            args.users,
+            args.bulk_count,
+            args.bulk_count,
+            0.0,
+            args.arrival_window,
+            keys,
+            args.batch_seconds,
+            args.sample_seconds,
+        ),
+        run(
+            args.users,
+            args.bulk_count,
+            args.max_batch_size,
+            args.max_wait,
+            args.arrival_window,
+            keys,
+            args.batch_seconds,
+            args.sample_seconds,
+        ),
+    ]
+
+    print(f"{'max batch':>10}{'wall (s)':>10}{'p50 (s)':>10}{'p99 (s)':>10}{'fill':>8}")
+    for result in results:
+        print(
+            f"{result['max_batch_size']:>10}{result['wall_clock_s']:>10.2f}"
+            f"{result['latency_p50_s']:>10.2f}{result['latency_p99_s']:>10.2f}"
+            f"{result['batch_fill']:>8.0%}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Sweep the semantic cache threshold and measure lookup latency.
+
+    python -m benchmarks.semantic_cache --pairs pairs.jsonl --index-size 10000
+
+Each pair is two descriptions and whether music for one should be served for the
+other (`{"a": ..., "b": ..., "same": true}` per line, built-in pairs by default).
+For every threshold, the hit rate is the share of `same` pairs that would be
+served from the cache and the false-hit rate is the share of different pairs
+that would be. Lookup latency is measured against a synthetic index of the given
+size in a temporary folder.
+"""
+
+import json
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+PAIRS = [
+    (
+        "A tense orchestral piece with low strings and pounding drums for a chase.",
+        "Tense orchestral music with deep strings and pounding percussion for a chase scene.",
+        True,
+    ),
+    (
+        "A gentle piano melody, calm and nostalgic, for a quiet evening by the sea.",
+        "Soft, nostalgic piano music for a calm evening at the seaside.",
+        True,
+    ),
+    (
+        "Upbeat j-pop with bright synths and a catchy beat for a school festival.",
+        "Cheerful j-pop with bright synthesizers and a catchy rhythm at a school festival.",
+        True,
+    ),
+    (
+        "Dark ambient drones with distant bells, eerie and unsettling.",
+        "Eerie, unsettling dark ambient drones with faraway bells.",
+        True,
+    ),
+    (
+        "A tense orchestral piece with low strings and pounding drums for a chase.",
+        "A gentle piano melody, calm and nostalgic, for a quiet evening by the sea.",
+        False,
+    ),
+    (
+        "Upbeat j-pop with bright synths and a catchy beat for a school festival.",
+        "Dark ambient drones with distant bells, eerie and unsettling.",
+        False,
+    ),
+    (
+        "Heroic brass fanfare with timpani as the hero arrives.",
+        "Melancholic solo violin as the hero mourns a fallen friend.",
+        False,
+    ),
+    (
+        "Lo-fi hip hop with vinyl crackle for studying late at night.",
+        "Fast heavy metal with distorted guitars for a brutal fight.",
+        False,
+    ),
+]
+
+
+def load_pairs(path):
+    with open(path, "r") as f:
+        return [
+            (pair["a"], pair["b"], bool(pair["same"]))
+            for pair in map(json.loads, f)
+            if pair
+        ]
+
+
+def sweep(cache, pairs, thresholds):
+    """Return the hit and false-hit rates of each threshold."""
+    similarities = []
+    for a, b, same in pairs:
+        similarity = float(cache.embed(a) @ cache.embed(b))
+        similarities.append((similarity, same))
+
+    results = []
+    for threshold in thresholds:
+        same = [s >= threshold for s, is_same in similarities if is_same]
+        different = [s >= threshold for s, is_same in similarities if not is_same]
+        results.append(
+            {
+                "threshold": threshold,
+                "hit_rate": sum(same) / len(same) if same else 0.0,
+                "false_hit_rate": sum(different) / len(different) if different else 0.0,
+            }
+        )
+    return results
+
+
+def time_lookups(cache, index_size, runs):
+    """Return lookup latencies in seconds against a synthetic index."""
+    from semantic_cache import SemanticCache
+
+    dim = cache.embed(PAIRS[0][0]).shape[0]
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        synthetic = SemanticCache(cache_dir, cache.encoder_name)
+        synthetic._index_dir.mkdir(parents=True)
+        vectors = rng.standard_normal((index_size, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors.tofile(synthetic._index_dir / "index.f32")
+        with open(synthetic._index_dir / "meta.jsonl", "w") as f:
+            for i in range(index_size):
+                entry = {
+                    "id": i,
+                    "description": "",
+                    "model_name": "",
+                    "duration": 0,
+                    "files": [],
+                    "dim": dim,
+                }
+                f.write(json.dumps(entry) + "\n")
+
+        synthetic.lookup(PAIRS[0][0], "musicgen-small", 10)
+        timings = []
+        for i in range(runs):
+            start = time.perf_counter()
+            synthetic.lookup(PAIRS[i % len(PAIRS)][0], "musicgen-small", 10)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the semantic cache")
+    parser.add_argument(
+        "--pairs", type=str, default=None, help="JSONL file of description pairs"
+    )
+    parser.add_argument("--encoder", type=str, default="t5-base")
+    parser.add_argument(
+        "--thresholds",
+        type=float,
+        nargs="+",
+        default=[0.9, 0.93, 0.95, 0.97, 0.98, 0.99],
+    )
+    parser.add_argument("--index-size", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path to save the results as JSON"
+    )
+    args = parser.parse_args()
+
+    from semantic_cache import SemanticCache
+
+    pairs = load_pairs(args.pairs) if args.pairs else PAIRS
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = SemanticCache(cache_dir, args.encoder)
+        sweep_results = sweep(cache, pairs, args.thresholds)
+        timings = time_lookups(cache, args.index_size, args.runs)
+
+    results = {
+        "encoder": args.encoder,
+        "pairs": len(pairs),
+        "sweep": sweep_results,
+        "index_size": args.index_size,
+        "lookup_mean_ms": 1000 * statistics.mean(timings),
+        "lookup_p50_ms": 1000 * statistics.median(timings),
+    }
+    for row in sweep_results:
+        print(
+            f"Threshold {row['threshold']:.2f}: hit rate {row['hit_rate']:.0%}, "
+            f"false-hit rate {row['false_hit_rate']:.0%}"
+        )
+    print(
+        f"Lookup over {args.index_size} entries: "
+        f"mean {results['lookup_mean_ms']:.1f}ms, p50 {results['lookup_p50_ms']:.1f}ms"
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
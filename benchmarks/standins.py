@@ -0,0 +1,164 @@
+"""
+Tiny randomly initialized stand-ins for MusicGen and LLaVA.
+
+They run on CPU in seconds and need no downloads, so the pipelines can be
+benchmarked without a GPU. `install_standins` loads them into the model
+registry under the real model names, so `get_model` and `get_llava` return
+them and the rest of the pipeline runs unchanged. Their outputs are noise and
+arbitrary words; only the cost of the surrounding code is meaningful.
+"""
+
+WORDS = [
+    "a",
+    "calm",
+    "tense",
+    "bright",
+    "dark",
+    "orchestral",
+    "piano",
+    "strings",
+    "brass",
+    "drums",
+    "synth",
+    "melody",
+    "ambient",
+    "slow",
+    "fast",
+    "building",
+    "with",
+    "and",
+    "soft",
+    "heroic",
+]
+
+
+def load_tiny_musicgen(model_name, device="cpu"):
+    """
+    Load audiocraft's debug MusicGen (a two-layer LM and a small codec).
+
+    Args:
+        model_name (str): Name the model is cached under in the conditioning cache.
+        device (str): Device to load the model on.
+
+    Returns:
+        MusicGen: The randomly initialized model.
+    """
+    from audiocraft.models import MusicGen
+
+    from conditioning_cache import conditioning_cache
+
+    model = MusicGen.get_pretrained("debug", device=device)
+    conditioning_cache.install(model, model_name)
+    return model
+
+
+class TinyLLAVA:
+    """
+    Randomly initialized stand-in for the `LLAVA` wrapper.
+
+    Pages are decoded and resized like real inputs, embedded by a patch
+    convolution (the vision tower) and a linear projector, and decoded
+    greedily by a small randomly initialized Qwen2 language model. Decoding
+    never stops early, so every description is `max_new_tokens` words long and
+    timings are reproducible.
+    """
+
+    def __init__(self, device="cpu", image_size=384, patch_size=32, dim=64, seed=0):
+        """
+        Args:
+            device (str): Device to run on.
+            image_size (int): Side length pages are resized to.
+            patch_size (int): Side length of one vision patch.
+            dim (int): Hidden size of the vision tower and language model.
+            seed (int): Seed of the random weights.
+        """
+        import torch
+        from transformers import Qwen2Config, Qwen2ForCausalLM
+
+        torch.manual_seed(seed)
+        self.device = device
+        self.image_size = image_size
+        self.vision_tower = torch.nn.Conv2d(3, dim, patch_size, stride=patch_size)
+        self.projector = torch.nn.Linear(dim, dim)
+        config = Qwen2Config(
+            vocab_size=len(WORDS),
+            hidden_size=dim,
+            intermediate_size=dim * 2,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+            max_position_embeddings=32768,
+        )
+        self.model = Qwen2ForCausalLM(config).eval()
+        for module in (self.vision_tower, self.projector, self.model):
+            module.to(device)
+
+    def _embed_pages(self, image_paths):
+        import numpy as np
+        import torch
+        from PIL import Image
+
+        pixels = [
+            np.asarray(
+                Image.open(path)
+                .convert("RGB")
+                .resize((self.image_size, self.image_size))
+            )
+            for path in image_paths
+        ]
+        images = torch.from_numpy(np.stack(pixels)).permute(0, 3, 1, 2).float() / 255
+        patches = self.vision_tower(images.to(self.device))
+        # [pages, dim, h, w] -> [pages * h * w, dim]
+        patches = patches.flatten(2).transpose(1, 2).reshape(-1, patches.shape[1])
+        return self.projector(patches)
+
+    def generate_music_description(self, image_paths, max_new_tokens=64, **params):
+        import torch
+
+        with torch.no_grad():
+            embeds = self._embed_pages(image_paths)[None]
+            tokens = self.model.generate(
+                inputs_embeds=embeds,
+                attention_mask=torch.ones(embeds.shape[:2], device=self.device),
+                max_new_tokens=max_new_tokens,
+                min_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=0,
+            )
+        return " ".join(WORDS[token] for token in tokens[0].tolist())
+
+    def generate_music_descriptions(
+        self, image_path_lists, batch_size=4, max_new_tokens=64, **params
+    ):
+        return [
+            self.generate_music_description(image_paths, max_new_tokens)
+            for image_paths in image_path_lists
+        ]
+
+    def stream_music_description(self, image_paths, max_new_tokens=64, **params):
+        for word in self.generate_music_description(image_paths, max_new_tokens).split(
+            " "
+        ):
+            yield f"{word} "
+
+
+def install_standins(music_models=(), llava_models=(), device="cpu"):
+    """
+    Load stand-ins into the model registry under the given model names.
+
+    Args:
+        music_models (list): MusicGen names to serve with the tiny MusicGen.
+        llava_models (list): LLaVA names to serve with `TinyLLAVA`.
+        device (str): Device the pipelines will request.
+    """
+    from cpu_inference import cpu_inference
+    from model_registry import registry
+
+    # Same key as `get_model` and `get_llava`
+    dtype = cpu_inference.dtype_name() if device == "cpu" else "float16"
+    for model_name in music_models:
+        registry.get(
+            model_name, device, dtype, lambda: load_tiny_musicgen(model_name, device)
+        )
+    for model_name in llava_models:
+        registry.get(model_name, device, dtype, lambda: TinyLLAVA(device))
@@ -0,0 +1,131 @@
+"""
+Measure the cold start of the GUI server.
+
+    python -m benchmarks.startup --model musicgen-small --runs 3 --warmup
+
+Each run starts `gui.py` in a fresh process and reports the time until its port
+accepts connections and the time until the first music request returns, both
+counted from process start. With `--warmup` the runs are repeated with the
+model warmed up in the background (`MANGA2MUSIC_WARMUP`). With
+`--clear-weight-cache`, the converted safetensors weights are removed before
+the first run, so that run also includes the one-time conversion.
+"""
+
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+DESCRIPTION = (
+    "An energetic orchestral piece with driving strings, brass stabs and "
+    "thundering percussion, building tension for a climactic battle."
+)
+
+
+def wait_for_port(port, process, timeout):
+    """Block until `port` accepts connections, or raise if the server exits."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Port {port} did not open within {timeout}s")
+
+
+def time_startup(port, model_name, duration, warmup, timeout):
+    """Start the server once and return its time to port open and first result."""
+    from gradio_client import Client
+
+    env = dict(os.environ, GRADIO_SERVER_PORT=str(port))
+    env["MANGA2MUSIC_WARMUP"] = model_name if warmup else ""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "gui.py"], env=env)
+    try:
+        wait_for_port(port, process, timeout)
+        port_open_s = time.perf_counter() - start
+        client = Client(f"http://127.0.0.1:{port}/", verbose=False)
+        client.predict(
+            DESCRIPTION,
+            model_name,
+            duration,
+            "wav",
+            1,
+            False,
+            None,
+            False,
+            api_name="/music_desc_to_music",
+        )
+        first_result_s = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+    return port_open_s, first_result_s
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark GUI cold start")
+    parser.add_argument("--model", type=str, default="musicgen-small")
+    parser.add_argument("--duration", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help="Also run with the model warmed up in the background",
+    )
+    parser.add_argument(
+        "--clear-weight-cache",
+        action="store_true",
+        help="Remove the converted weights before the first run",
+    )
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path to save the results as JSON"
+    )
+    args = parser.parse_args()
+
+    if args.clear_weight_cache:
+        from weight_cache import weight_cache
+
+        weight_cache.clear()
+
+    results = {"model": args.model, "duration": args.duration, "runs": []}
+    for warmup in [False, True] if args.warmup else [False]:
+        port_open, first_result = [], []
+        for _ in range(args.runs):
+            port_open_s, first_result_s = time_startup(
+                args.port, args.model, args.duration, warmup, args.timeout
+            )
+            port_open.append(port_open_s)
+            first_result.append(first_result_s)
+        run = {
+            "warmup": warmup,
+            "port_open_s": port_open,
+            "first_result_s": first_result,
+            "median_port_open_s": statistics.median(port_open),
+            "median_first_result_s": statistics.median(first_result),
+        }
+        results["runs"].append(run)
+        print(
+            f"{'Warm-up' if warmup else 'No warm-up'}: port open in "
+            f"{run['median_port_open_s']:.1f}s, first result in "
+            f"{run['median_first_result_s']:.1f}s (median of {args.runs})"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
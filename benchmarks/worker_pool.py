@@ -0,0 +1,98 @@
+"""
+Measure how CPU music generation scales with the number of worker processes.
+
+    python -m benchmarks.worker_pool --workers 1 2 4 8 --descriptions 16
+
+Each run starts a fresh pool and generates the same descriptions. Throughput is
+reported in seconds of audio per second, and memory as the resident set size of
+the parent plus the workers, so the saving of the shared weights is visible.
+"""
+
+import json
+import time
+
+DESCRIPTIONS = [
+    "An energetic orchestral piece with driving strings, brass stabs and "
+    "thundering percussion, building tension for a climactic battle.",
+    "A calm piano melody with soft pads, evoking a quiet evening after a long day.",
+    "A mysterious ambient track with low drones and distant chimes.",
+    "An upbeat j-pop tune with bright synths and a bouncy bass line.",
+]
+
+
+def resident_memory_mb(pids):
+    """Return the summed resident set size of the given processes in MB."""
+    import psutil
+
+    total = 0
+    for pid in pids:
+        try:
+            total += psutil.Process(pid).memory_info().rss
+        except psutil.NoSuchProcess:
+            continue
+    return total / 1024**2
+
+
+def main():
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="Benchmark the CPU worker pool")
+    parser.add_argument("--model", type=str, default="musicgen-small")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--descriptions", type=int, default=8)
+    parser.add_argument("--duration", type=int, default=5)
+    parser.add_argument("--shard-size", type=int, default=1)
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path to save the results as JSON"
+    )
+    args = parser.parse_args()
+
+    from worker_pool import MusicWorkerPool
+
+    descriptions = [
+        DESCRIPTIONS[i % len(DESCRIPTIONS)] for i in range(args.descriptions)
+    ]
+    audio_s = len(descriptions) * args.duration
+
+    runs = []
+    for workers in args.workers:
+        with MusicWorkerPool(args.model, workers) as pool:
+            # Warm up every worker before timing
+            list(pool.map(descriptions[:workers], 1))
+            start = time.perf_counter()
+            list(pool.map(descriptions, args.duration, shard_size=args.shard_size))
+            elapsed = time.perf_counter() - start
+            pids = [os.getpid()] + [p.pid for p in pool._processes]
+            memory_mb = resident_memory_mb(pids)
+        run = {
+            "workers": workers,
+            "cores_per_worker": len(pool.cores[0]),
+            "wall_clock_s": elapsed,
+            "audio_s_per_s": audio_s / elapsed,
+            "rtf": elapsed / audio_s,
+            "resident_memory_mb": memory_mb,
+        }
+        runs.append(run)
+        print(
+            f"{workers} workers: {elapsed:.1f}s, {run['audio_s_per_s']:.2f}s of audio/s, "
+            f"{memory_mb:.0f}MB resident"
+        )
+
+    for run in runs:
+        run["speedup"] = runs[0]["wall_clock_s"] / run["wall_clock_s"]
+    results = {
+        "model": args.model,
+        "descriptions": len(descriptions),
+        "duration": args.duration,
+        "shard_size": args.shard_size,
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
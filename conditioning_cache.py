@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ConditioningCache:
+    """
+    In-memory LRU cache of MusicGen text-conditioning tensors.
+
+    MusicGen encodes every description in a batch with T5, including the empty
+    descriptions used for classifier-free guidance, so a bulk request encodes the
+    same text `bulk_count` times. Once installed on a model, the description
+    conditioner encodes each distinct text once, broadcasts it across the batch
+    and keeps the result for later requests. Entries are keyed by (model, device,
+    description text).
+    """
+
+    def __init__(self, max_entries=256):
+        """
+        Args:
+            max_entries (int): Maximum number of cached descriptions.
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "encode_s": 0.0}
+
+    def install(self, model, model_name, attribute="description"):
+        """
+        Route a MusicGen model's text conditioner through the cache.
+
+        Args:
+            model: The loaded MusicGen model.
+            model_name (str): Model name used in the cache keys.
+            attribute (str): Name of the text conditioner to cache.
+        """
+        conditioners = model.lm.condition_provider.conditioners
+        if attribute not in conditioners:
+            return
+        conditioner = conditioners[attribute]
+        if getattr(conditioner, "_conditioning_cache", None) is self:
+            return
+
+        prefix = (model_name, str(model.device))
+        tokenize = conditioner.tokenize
+        forward = conditioner.forward
+
+        def cached_tokenize(texts):
+            # Defer tokenization to `cached_forward`, which only encodes misses
+            return [text or "" for text in texts]
+
+        def cached_forward(texts):
+            return self._encode(prefix, texts, tokenize, forward)
+
+        conditioner.tokenize = cached_tokenize
+        conditioner.forward = cached_forward
+        conditioner._conditioning_cache = self
+
+    def _encode(self, prefix, texts, tokenize, forward):
+        import torch
+
+        cached = {}
+        with self._lock:
+            for text in dict.fromkeys(texts):
+                entry = self._entries.get(prefix + (text,))
+                if entry is not None:
+                    self._entries.move_to_end(prefix + (text,))
+                    cached[text] = entry
+
+        # Encode each distinct missing text once, duplicates count as hits
+        misses = [text for text in dict.fromkeys(texts) if text not in cached]
+        with self._lock:
+            self._stats["hits"] += len(texts) - len(misses)
+            self._stats["misses"] += len(misses)
+        if misses:
+            start = time.perf_counter()
+            embeds, mask = forward(tokenize(misses))
+            encode_s = time.perf_counter() - start
+            with self._lock:
+                self._stats["encode_s"] += encode_s
+                for i, text in enumerate(misses):
+                    # Empty texts have an all-zero mask but still one position
+                    length = max(1, int(mask[i].sum()))
+                    entry = (embeds[i, :length].detach(), mask[i, :length])
+                    cached[text] = entry
+                    self._entries[prefix + (text,)] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        # Pad to the longest text, like the tokenizer does for a batch
+        length = max(cached[text][0].shape[0] for text in texts)
+        embeds = []
+        masks = []
+        for text in texts:
+            embed, mask = cached[text]
+            padding = length - embed.shape[0]
+            embeds.append(torch.nn.functional.pad(embed, (0, 0, 0, padding)))
+            masks.append(torch.nn.functional.pad(mask, (0, padding)))
+        return torch.stack(embeds), torch.stack(masks)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters, hit rate, number of entries and total encoding time.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["encode_s"] = round(stats["encode_s"], 3)
+        return stats
+
+    def report(self):
+        stats = self.stats()
+        print(
+            f"Conditioning cache: hits={stats['hits']} misses={stats['misses']} "
+            f"hit_rate={stats['hit_rate']:.0%} entries={stats['entries']} "
+            f"encode={stats['encode_s']}s"
+        )
+
+
+conditioning_cache = ConditioningCache()
@@ -0,0 +1,188 @@
+import os
+import threading
+
+OPTIMIZATION_LEVELS = ["none", "int8", "bf16", "auto"]
+
+
+def resolve_device(device="auto"):
+    """
+    Return the device to run models on.
+
+    Args:
+        device (str): 'cuda', 'cpu', or 'auto' to use CUDA when it is available.
+
+    Returns:
+        str: The device name.
+    """
+    if device != "auto":
+        return device
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def physical_cores():
+    """Return the number of physical cores available to the process."""
+    try:
+        import psutil
+
+        cores = psutil.cpu_count(logical=False)
+    except ImportError:
+        cores = None
+    if hasattr(os, "sched_getaffinity"):
+        available = len(os.sched_getaffinity(0))
+    else:
+        available = os.cpu_count() or 1
+    # Hyper-threads slow down matrix kernels, but respect a restricted affinity mask
+    return max(1, min(cores or available, available))
+
+
+def bf16_supported():
+    """Whether the CPU has native bfloat16 matrix instructions (AVX512-BF16 or AMX)."""
+    import torch
+
+    check = getattr(torch.ops.mkldnn, "_is_mkldnn_bf16_supported", None)
+    try:
+        return bool(check()) if check is not None else False
+    except RuntimeError:
+        return False
+
+
+class CPUInference:
+    """
+    CPU inference settings shared by the MusicGen and LLaVA loaders.
+
+    Thread pools are sized to the physical cores available to the process, and
+    the language-model weights are optimized at one of these levels:
+
+    - 'none': float32 weights.
+    - 'int8': dynamic int8 quantization of the linear layers.
+    - 'bf16': bfloat16 compute, only where the CPU supports it natively.
+    - 'auto': 'bf16' when supported, 'int8' otherwise.
+    """
+
+    def __init__(self, optimization="auto", compile=False):
+        """
+        Args:
+            optimization (str): Optimization level ('none', 'int8', 'bf16', 'auto').
+            compile (bool): Whether to compile the decoder step with `torch.compile`.
+        """
+        self.optimization = optimization
+        self.compile = compile
+        self._threads = None
+        self._lock = threading.Lock()
+
+    def configure(self, optimization=None, compile=None):
+        """Change the optimization level or compilation of models loaded afterwards."""
+        if optimization is not None:
+            self.optimization = optimization
+        if compile is not None:
+            self.compile = compile
+
+    @property
+    def level(self):
+        """The effective optimization level, with 'auto' resolved."""
+        if self.optimization == "auto":
+            return "bf16" if bf16_supported() else "int8"
+        if self.optimization == "bf16" and not bf16_supported():
+            print("bfloat16 is not supported natively on this CPU, using int8")
+            return "int8"
+        return self.optimization
+
+    def setup_threads(self, intra_op=None, inter_op=None):
+        """
+        Size the torch thread pools once per process.
+
+        Args:
+            intra_op (int): Threads per operator (default: physical cores).
+            inter_op (int): Operators run concurrently (default: 1, since decoding
+                runs one operator after another).
+
+        Returns:
+            tuple: The intra-op and inter-op thread counts.
+        """
+        import torch
+
+        with self._lock:
+            if self._threads is None:
+                intra_op = intra_op or physical_cores()
+                inter_op = inter_op or 1
+                torch.set_num_threads(intra_op)
+                try:
+                    torch.set_num_interop_threads(inter_op)
+                except RuntimeError:
+                    # Only possible before the first parallel operator ran
+                    inter_op = torch.get_num_interop_threads()
+                self._threads = (intra_op, inter_op)
+                print(f"CPU threads: {intra_op} intra-op, {inter_op} inter-op")
+            return self._threads
+
+    def dtype_name(self):
+        """Registry dtype key of models loaded with the current settings."""
+        level = self.level
+        name = {"none": "float32", "int8": "int8", "bf16": "bfloat16"}[level]
+        return f"{name}+compile" if self.compile else name
+
+    def quantize(self, module, names=None):
+        """
+        Apply dynamic int8 quantization to the linear layers of `module`.
+
+        Args:
+            module (torch.nn.Module): Module to quantize in place.
+            names (list): Only quantize the sub-modules with these names.
+        """
+        import torch
+
+        spec = {torch.nn.Linear}
+        if names is not None:
+            qconfig = torch.ao.quantization.default_dynamic_qconfig
+            spec = {name: qconfig for name in names}
+        return torch.ao.quantization.quantize_dynamic(
+            module, spec, dtype=torch.qint8, inplace=True
+        )
+
+    def optimize_musicgen(self, model):
+        """
+        Optimize a MusicGen model loaded on CPU.
+
+        int8 quantizes the transformer LM. bf16 runs generation under CPU
+        bfloat16 autocast, the way MusicGen uses float16 autocast on GPU.
+        """
+        import torch
+        from audiocraft.utils.autocast import TorchAutocast
+
+        self.setup_threads()
+        level = self.level
+        if level == "int8":
+            self.quantize(model.lm)
+        elif level == "bf16":
+            model.autocast = TorchAutocast(
+                enabled=True, device_type="cpu", dtype=torch.bfloat16
+            )
+        if self.compile:
+            # One decoding step is one LM forward over the last token
+            model.lm.forward = torch.compile(model.lm.forward, dynamic=True)
+        print(f"MusicGen CPU optimization: {self.dtype_name()}")
+        return model
+
+    def optimize_llava(self, model):
+        """
+        Optimize the language model of a LLaVA model loaded on CPU.
+
+        The vision tower and projector are left untouched, so cached vision
+        embeddings stay valid. bf16 is applied at load time through the dtype.
+        """
+        import torch
+
+        self.setup_threads()
+        if self.level == "int8":
+            self.quantize(model, names=["model.layers", "lm_head"])
+        if self.compile:
+            model.model.forward = torch.compile(model.model.forward, dynamic=True)
+        print(f"LLaVA CPU optimization: {self.dtype_name()}")
+        return model
+
+
+cpu_inference = CPUInference(
+    optimization=os.environ.get("MANGA2MUSIC_CPU_OPTIMIZATION", "auto")
+)
@@ -1,15 +1,31 @@
 from pathlib import Path
-from audiocraft.models import MusicGen
-from audiocraft.data.audio import audio_write
+from audiocraft.data.audio import audio_read, audio_write
 import numpy as np
 import json
+import random
+import shutil
+import time
 import torch
+from audio_cache import audio_cache
+from audio_writer import AudioWriter, WavAppender, loudness_gain
+from conditioning_cache import conditioning_cache
+from cpu_inference import cpu_inference, resolve_device
+from model_registry import registry
+from worker_pool import MusicWorkerPool
+from semantic_cache import semantic_cache
+from telemetry import telemetry
+from weight_cache import weight_cache
 
 
 def load_model(model_name, device="cuda"):
     """
     Load the MusicGen model.
 
+    The text conditioner is routed through the conditioning cache, so each distinct
+    description is encoded once per batch and reused across requests. On CPU the
+    model is optimized with the `cpu_inference` settings. Weights are memory-mapped
+    from the safetensors copies in the weight cache.
+
     Args:
         model_name (str): Model name ('musicgen-small', 'musicgen-medium', 'musicgen-large').
         device (str): Device to run the model on ('cuda' or 'cpu').
@@ -18,10 +34,60 @@ def load_model(model_name, device="cuda"):
         model: The loaded MusicGen model.
     """
     print(f"Loading model: {model_name} on {device}")
-    model = MusicGen.get_pretrained(f"facebook/{model_name}", device=device)
+    model = weight_cache.load_musicgen(model_name, device=device)
+    if device == "cpu":
+        cpu_inference.optimize_musicgen(model)
+    conditioning_cache.install(model, model_name)
     return model
 
 
+def get_model(model_name, device="cuda"):
+    """
+    Get a resident MusicGen model from the model registry, loading it on a miss.
+
+    Args:
+        model_name (str): Model name ('musicgen-small', 'musicgen-medium', 'musicgen-large').
+        device (str): Device to run the model on ('cuda' or 'cpu').
+
+    Returns:
+        contextmanager: Yields the MusicGen model for exclusive use.
+    """
+    # MusicGen runs under float16 autocast on GPU and as optimized for CPU.
+    dtype = cpu_inference.dtype_name() if device == "cpu" else "float16"
+    return registry.use(
+        model_name, device, dtype, lambda: load_model(model_name, device=device)
+    )
+
+
+def generate(model, descriptions, progress=True):
+    """
+    Run `model.generate` in a telemetry span recording its real-time factor.
+
+    Args:
+        model: The loaded MusicGen model, with its generation duration set.
+        descriptions (list): Text descriptions, one sample each.
+        progress (bool): Whether to display generation progress.
+
+    Returns:
+        torch.Tensor: The [B, C, T] generated audio.
+    """
+    with telemetry.span(
+        "music.generate",
+        model=model.name,
+        samples=len(descriptions),
+        duration=model.duration,
+    ) as span:
+        start = time.perf_counter()
+        musics = model.generate(descriptions, progress=progress)
+        # Seconds of compute per second of audio; the batch shares the time
+        span.set(rtf=(time.perf_counter() - start) / model.duration)
+    telemetry.count(
+        "audio_seconds", len(descriptions) * model.duration, model=model.name
+    )
+    return musics
+
+
+@telemetry.traced("audio.write")
 def save_audio(audio, sr, output_path, audio_format):
     """
     Save audio to a file.
@@ -32,6 +98,7 @@ def save_audio(audio, sr, output_path, audio_format):
         output_path (str): Path to save the audio file.
         audio_format (str): Audio format ('wav', 'mp3', 'ogg', 'flac').
     """
+    telemetry.annotate(format=audio_format, seconds=audio.shape[-1] / sr)
     audio_write(
         output_path,
         audio,
@@ -43,6 +110,387 @@ def save_audio(audio, sr, output_path, audio_format):
     )
 
 
+def iter_music_segments(
+    model,
+    descriptions,
+    duration,
+    segment_duration=20,
+    context_duration=5,
+    crossfade=1.0,
+    progress=False,
+):
+    """
+    Generate long music segment by segment with MusicGen's continuation API.
+
+    Each segment is conditioned on the last `context_duration` seconds of the
+    previous one and crossfaded over its last `crossfade` seconds. Only one segment
+    is held in memory at a time, so peak memory does not grow with `duration`.
+
+    Args:
+        model: The loaded MusicGen model.
+        descriptions (list): Text descriptions, one per generated sample.
+        duration (float): Total length of the generated music in seconds.
+        segment_duration (float): Length of each `model.generate` call in seconds,
+            including the context. Capped at the model's maximum duration.
+        context_duration (float): Seconds of the previous segment each segment
+            continues from.
+        crossfade (float): Seconds over which consecutive segments are blended.
+        progress (bool): Whether to display generation progress.
+
+    Yields:
+        torch.Tensor: Final audio of shape [B, C, T] in order. Concatenating the
+            chunks along the last dimension gives `duration` seconds of music.
+    """
+    segment_duration = min(segment_duration, model.max_duration)
+    if not 0 < crossfade <= context_duration < segment_duration:
+        raise ValueError(
+            "Expected 0 < crossfade <= context_duration < segment_duration, got "
+            f"{crossfade}, {context_duration} and {segment_duration}."
+        )
+
+    sr = model.sample_rate
+    total_samples = int(duration * sr)
+    context_samples = int(context_duration * sr)
+    crossfade_samples = int(crossfade * sr)
+
+    model.set_generation_params(duration=min(duration, segment_duration))
+    audio = generate(model, descriptions, progress=progress)
+    tail = audio[..., -context_samples:]
+    generated = audio.shape[-1]
+    emitted = 0
+    # Stop when less than one token frame is missing
+    frame_samples = sr / model.frame_rate
+    while total_samples - generated >= frame_samples:
+        new_duration = min(
+            segment_duration - context_duration, (total_samples - generated) / sr
+        )
+        model.set_generation_params(duration=context_duration + new_duration)
+        with telemetry.span(
+            "music.continue", model=model.name, duration=model.duration
+        ):
+            segment = model.generate_continuation(
+                tail, sr, descriptions, progress=progress
+            )
+
+        # Everything before the crossfade region is final
+        yield audio[..., :-crossfade_samples]
+        emitted += audio.shape[-1] - crossfade_samples
+
+        # The segment starts with its own rendering of the context, blend the
+        # previous ending into it
+        fade_in = torch.linspace(0, 1, crossfade_samples, device=audio.device)
+        overlap = (
+            audio[..., -crossfade_samples:] * (1 - fade_in)
+            + segment[..., context_samples - crossfade_samples : context_samples]
+            * fade_in
+        )
+        audio = torch.cat([overlap, segment[..., context_samples:]], dim=-1)
+        tail = segment[..., -context_samples:]
+        generated += segment.shape[-1] - context_samples
+
+    yield audio[..., : total_samples - emitted]
+
+
+@telemetry.traced("audio.transcode")
+def transcode_audio(wav_path, output_path, audio_format):
+    """Convert an already normalized WAV file to `audio_format`."""
+    audio, sr = audio_read(wav_path)
+    audio_write(
+        output_path,
+        audio,
+        sr,
+        format=audio_format,
+        strategy="clip",
+        add_suffix=False,
+    )
+
+
+def stream_segmented_music(
+    model,
+    descriptions,
+    output_files,
+    duration,
+    audio_format,
+    segment_duration=20,
+    context_duration=5,
+    crossfade=1.0,
+    keep_wav=False,
+):
+    """
+    Generate long music with `iter_music_segments` and append it to disk as it is produced.
+
+    Segments are written to a WAV file with a fixed loudness gain taken from the
+    first segment. Other formats are transcoded from that WAV file at the end.
+
+    Args:
+        model: The loaded MusicGen model.
+        descriptions (list): Text descriptions, one per output file.
+        output_files (list): Paths to save the generated music.
+        duration (float): Length of the generated music in seconds.
+        audio_format (str): Audio format to save the music ('wav', 'mp3', 'ogg', 'flac').
+        segment_duration (float): Length of each generated segment in seconds.
+        context_duration (float): Seconds of the previous segment each segment continues from.
+        crossfade (float): Seconds over which consecutive segments are blended.
+        keep_wav (bool): Whether to keep the intermediate WAV files of other formats
+            (saved next to each output file with a `.part.wav` suffix).
+
+    Yields:
+        list: The 16-bit samples of shape [T, C] just written to each output file.
+    """
+    output_files = [Path(output_file) for output_file in output_files]
+    wav_files = [
+        (output_file if audio_format == "wav" else output_file.with_suffix(".part.wav"))
+        for output_file in output_files
+    ]
+
+    appenders = None
+    try:
+        for chunk in iter_music_segments(
+            model,
+            descriptions,
+            duration,
+            segment_duration=segment_duration,
+            context_duration=context_duration,
+            crossfade=crossfade,
+            progress=True,
+        ):
+            chunk = chunk.cpu()
+            if appenders is None:
+                appenders = [
+                    WavAppender(
+                        wav_file,
+                        model.sample_rate,
+                        model.audio_channels,
+                        gain=loudness_gain(audio, model.sample_rate),
+                    )
+                    for wav_file, audio in zip(wav_files, chunk)
+                ]
+            yield [appender.write(audio) for appender, audio in zip(appenders, chunk)]
+    finally:
+        for appender in appenders or []:
+            appender.close()
+
+    if audio_format != "wav":
+        for wav_file, output_file in zip(wav_files, output_files):
+            transcode_audio(wav_file, output_file, audio_format)
+            if not keep_wav:
+                wav_file.unlink()
+
+
+def generate_segmented_music(model, descriptions, output_files, *args, **kwargs):
+    """
+    Like `stream_segmented_music`, but only return the paths once every file is written.
+
+    Returns:
+        list: List of paths to the generated music files.
+    """
+    for _ in stream_segmented_music(model, descriptions, output_files, *args, **kwargs):
+        pass
+    return [str(output_file) for output_file in output_files]
+
+
+def _save_metadata(output_folder, metadata):
+    metadata_path = Path(output_folder) / "data.json"
+    with open(metadata_path, "w") as metadata_file:
+        json.dump(metadata, metadata_file, indent=4)
+    print(f"Metadata saved at: {metadata_path}")
+
+
+def seed_generation(seed):
+    """
+    Seed MusicGen sampling.
+
+    Args:
+        seed (int): Random seed, `None` to draw one.
+
+    Returns:
+        int: The seed used.
+    """
+    if seed is None:
+        seed = random.randrange(2**31)
+    torch.manual_seed(seed)
+    return seed
+
+
+def save_cached_audio(audio, sr, output_path, audio_format, cache_key):
+    """
+    Save audio through the audio cache.
+
+    The WAV master is stored in the cache first and the requested format is
+    encoded from it, so fresh and cached results are the same file.
+
+    Args:
+        audio (torch.Tensor): Audio of shape [C, T].
+        sr (int): Sample rate.
+        output_path (str): Path to save the audio file.
+        audio_format (str): Audio format ('wav', 'mp3', 'ogg', 'flac').
+        cache_key (str): Audio cache key of the sample.
+    """
+    master_file = Path(output_path).with_suffix(".master.wav")
+    save_audio(audio, sr, master_file, "wav")
+    master_path = audio_cache.put(cache_key, "wav", master_file)
+    if audio_format == "wav":
+        master_file.replace(output_path)
+        return
+    master_file.unlink()
+    transcode_audio(master_path, output_path, audio_format)
+    audio_cache.put(cache_key, audio_format, output_path)
+
+
+def audio_cache_keys(
+    description, model_name, duration, seed, bulk_count, segments=None
+):
+    """
+    Return the audio cache key of each sample of a request.
+
+    Args:
+        description (str): Text description of the request.
+        model_name (str): MusicGen model name.
+        duration (float): Length of the music in seconds.
+        seed (int): Random seed given with the request.
+        bulk_count (int): Number of samples generated together.
+        segments (tuple): Segment and context duration of segmented generation,
+            `None` if the music is generated at once.
+
+    Returns:
+        list: One key per sample.
+    """
+    segment_duration, context_duration = segments or (None, None)
+    return [
+        audio_cache.make_key(
+            description,
+            model_name,
+            duration,
+            seed,
+            bulk_count,
+            i,
+            segment_duration=segment_duration,
+            context_duration=context_duration,
+        )
+        for i in range(bulk_count)
+    ]
+
+
+def load_cached_music(cache_keys, output_paths, audio_format):
+    """
+    Copy cached samples to `output_paths`, re-encoding WAV masters when needed.
+
+    Args:
+        cache_keys (list): Audio cache key of each sample.
+        output_paths (list): Paths to save the music files.
+        audio_format (str): Audio format ('wav', 'mp3', 'ogg', 'flac').
+
+    Returns:
+        list: The output paths, or `None` unless every sample is cached.
+    """
+    entries = [audio_cache.lookup(key, audio_format) for key in cache_keys]
+    if any(entry is None for entry in entries):
+        audio_cache.record("misses", len(cache_keys))
+        return None
+
+    for key, (kind, path), output_path in zip(cache_keys, entries, output_paths):
+        if kind == "variant":
+            shutil.copyfile(path, output_path)
+            audio_cache.record("hits")
+        else:
+            transcode_audio(path, output_path, audio_format)
+            audio_cache.put(key, audio_format, output_path)
+            audio_cache.record("reencodes")
+    print(f"Loaded {len(output_paths)} cached samples")
+    return [str(output_path) for output_path in output_paths]
+
+
+def cache_segmented_music(cache_keys, output_paths, audio_format):
+    """
+    Store the files of `stream_segmented_music(keep_wav=True)` in the audio cache.
+
+    Args:
+        cache_keys (list): Audio cache key of each sample.
+        output_paths (list): Paths of the music files.
+        audio_format (str): Audio format ('wav', 'mp3', 'ogg', 'flac').
+    """
+    for key, output_path in zip(cache_keys, output_paths):
+        if audio_format != "wav":
+            wav_file = Path(output_path).with_suffix(".part.wav")
+            audio_cache.put(key, "wav", wav_file)
+            wav_file.unlink()
+        audio_cache.put(key, audio_format, output_path)
+
+
+def load_semantic_music(match, output_paths, audio_format):
+    """
+    Copy the music of a semantic cache entry to `output_paths`.
+
+    Args:
+        match (dict): Entry returned by `semantic_cache.lookup`.
+        output_paths (list): Paths to save the music files.
+        audio_format (str): Audio format ('wav', 'mp3', 'ogg', 'flac').
+
+    Returns:
+        list: The output paths.
+    """
+    for stored_path, output_path in zip(match["files"], output_paths):
+        if Path(stored_path).suffix == f".{audio_format}":
+            shutil.copyfile(stored_path, output_path)
+        else:
+            transcode_audio(stored_path, output_path, audio_format)
+    return [str(output_path) for output_path in output_paths]
+
+
+def flag_semantic_match(output_folder):
+    """
+    Report that the music in `output_folder` was a bad semantic cache match.
+
+    Args:
+        output_folder (str): Folder written by `generate_music_from_text`.
+
+    Returns:
+        dict: The flagged match recorded in `data.json`.
+    """
+    with open(Path(output_folder) / "data.json", "r") as metadata_file:
+        metadata = json.load(metadata_file)
+    match = metadata.get("semantic_match")
+    if match is None:
+        raise ValueError(f"{output_folder} was not served from the semantic cache")
+    semantic_cache.flag_false_hit(match["id"], metadata["description"])
+    print(f"Flagged semantic cache entry {match['id']} as a false hit")
+    return match
+
+
+def generate_music_batch(key, payloads):
+    """
+    Generate the music of several requests in one `model.generate` call.
+
+    This is the `run_batch` function of a `BatchScheduler` coalescing requests
+    that share a model, duration and device.
+
+    Args:
+        key (tuple): Model name, duration and device of the batch.
+        payloads (list): One list of descriptions per request.
+
+    Returns:
+        list of tuple: The sample rate and a [B, C, T] audio tensor for each request.
+    """
+    model_name, duration, device = key
+    descriptions = [description for payload in payloads for description in payload]
+    with get_model(model_name, device=device) as model:
+        model.set_generation_params(duration=duration)
+        print(
+            f"Generating music for {len(payloads)} requests "
+            f"({len(descriptions)} samples)..."
+        )
+        musics = generate(model, descriptions).cpu()
+        sr = model.sample_rate
+
+    results = []
+    start = 0
+    for payload in payloads:
+        results.append((sr, musics[start : start + len(payload)]))
+        start += len(payload)
+    return results
+
+
+@telemetry.traced("stage.music")
 def generate_music_from_text(
     description,
     output_folder,
@@ -51,10 +499,23 @@ def generate_music_from_text(
     audio_format,
     bulk_count=1,
     device="cuda",
+    writer_workers=2,
+    segment_duration=None,
+    context_duration=5,
+    scheduler=None,
+    seed=None,
+    use_cache=True,
+    use_semantic_cache=False,
 ):
     """
     Generate music from a text description.
 
+    Generation is reproducible for a given `seed`. Results of requests with a
+    seed are stored in the audio cache, and a repeated request is served from it
+    without running the model. A seed drawn for a request without one is only
+    recorded, since no later request asks for it. Unseeded requests can also be served with the music of a
+    previously generated description with the same meaning (see `SemanticCache`).
+
     Args:
         description (str): Text description for music generation.
         output_folder (str): Folder path to save the generated music.
@@ -63,70 +524,305 @@ def generate_music_from_text(
         audio_format (str): Audio format to save the music ('wav', 'mp3', 'ogg', 'flac').
         bulk_count (int): Number of music samples to generate.
         device (str): Device to run the model on ('cuda' or 'cpu').
+        writer_workers (int): Number of background workers encoding and writing audio (0 to write serially).
+        segment_duration (int): Generate music longer than this many seconds in segments
+            that are appended to the output files as they are produced (`None` to
+            generate the whole clip at once).
+        context_duration (int): Seconds of the previous segment each segment
+            continues from.
+        scheduler (BatchScheduler): Scheduler running `generate_music_batch`. When
+            given and no `seed` is set, the request is batched with concurrent
+            requests for the same model and duration. Such batches depend on the
+            other requests, so they are neither seeded nor cached.
+        seed (int): Random seed (`None` to draw one). Stored in `data.json`.
+        use_cache (bool): Whether to look up and store the results of a given
+            `seed` in the audio cache.
+        use_semantic_cache (bool): Whether to serve and store unseeded results
+            through the semantic cache.
 
     Returns:
-        list of tuple: List of tuples containing the sample rate and audio tensor of each generated music.
+        list: List of paths to the generated music files.
     """
-    try:
-        # Load the MusicGen model
-        model = load_model(model_name, device=device)
-        model.set_generation_params(duration=duration)
+    # Create the output folder if it doesn't exist
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+    descriptions = [description] * bulk_count
+    output_paths = [f"{output_folder}/{i}.{audio_format}" for i in range(bulk_count)]
+    segmented = segment_duration is not None and duration > segment_duration
 
-        descriptions = [description] * bulk_count
+    generated_files_path = None
+    semantic_match = embedding = None
+    if use_semantic_cache and seed is None:
+        semantic_match, embedding = semantic_cache.lookup(
+            description, model_name, duration, bulk_count
+        )
+        if semantic_match is not None:
+            generated_files_path = load_semantic_music(
+                semantic_match, output_paths, audio_format
+            )
 
-        # Generate music from the description
-        print("Generating music...")
-        musics = model.generate(descriptions, progress=True)
-        sr = model.sample_rate
+    cache_keys = None
+    if generated_files_path is None and use_cache and seed is not None:
+        cache_keys = audio_cache_keys(
+            description,
+            model_name,
+            duration,
+            seed,
+            bulk_count,
+            (segment_duration, context_duration) if segmented else None,
+        )
+        generated_files_path = load_cached_music(cache_keys, output_paths, audio_format)
 
-        # Create the output folder if it doesn't exist
-        Path(output_folder).mkdir(parents=True, exist_ok=True)
+    scheduled = scheduler is not None and seed is None and not segmented
+    if generated_files_path is None and not scheduled and seed is None:
+        seed = random.randrange(2**31)
+
+    if generated_files_path is None and segmented:
+        with get_model(model_name, device=device) as model:
+            print(f"Generating music in segments of {segment_duration}s...")
+            seed_generation(seed)
+            generated_files_path = generate_segmented_music(
+                model,
+                descriptions,
+                output_paths,
+                duration,
+                audio_format,
+                segment_duration=segment_duration,
+                context_duration=context_duration,
+                keep_wav=cache_keys is not None,
+            )
+        if cache_keys is not None:
+            cache_segmented_music(cache_keys, generated_files_path, audio_format)
+    elif generated_files_path is None:
+        if scheduled:
+            job = scheduler.submit(
+                (model_name, duration, device), descriptions, size=bulk_count
+            )
+            sr, musics = job.result()
+        else:
+            with get_model(model_name, device=device) as model:
+                model.set_generation_params(duration=duration)
+
+                # Generate music from the description
+                print(f"Generating music with seed {seed}...")
+                seed_generation(seed)
+                musics = generate(model, descriptions)
+                sr = model.sample_rate
 
         # Save the generated music
         print("Saving generated music...")
-        generated_files_path = []
-        for i, music in enumerate(musics):
-            output_path = f"{output_folder}/{i}.{audio_format}"
-            save_audio(
-                music.cpu(),
-                sr,
-                output_path,
+        write_fn = save_audio if cache_keys is None else save_cached_audio
+        with AudioWriter(write_fn, workers=writer_workers) as writer:
+            for i, (music, output_path) in enumerate(zip(musics, output_paths)):
+                kwargs = {} if cache_keys is None else {"cache_key": cache_keys[i]}
+                writer.submit(music.cpu(), sr, output_path, audio_format, **kwargs)
+            # Wait for every file to land before writing the metadata
+            generated_files_path = writer.wait()
+    if embedding is not None and semantic_match is None:
+        semantic_cache.add(
+            embedding, description, model_name, duration, generated_files_path
+        )
+    for output_path in generated_files_path:
+        print(f"Generated music saved at: {output_path}")
+
+    # Save metadata to data.json
+    metadata = {
+        "description": description,
+        "model_name": model_name,
+        "duration": duration,
+        "bulk_count": bulk_count,
+        "audio_format": audio_format,
+        "segment_duration": segment_duration if segmented else None,
+        "seed": seed,
+        "semantic_match": (
+            None
+            if semantic_match is None
+            else {
+                "id": semantic_match["id"],
+                "description": semantic_match["description"],
+                "similarity": semantic_match["similarity"],
+            }
+        ),
+        "generated_files": generated_files_path,
+    }
+    _save_metadata(output_folder, metadata)
+
+    return generated_files_path
+
+
+def stream_music_from_text(
+    description,
+    output_folder,
+    model_name,
+    duration,
+    audio_format,
+    bulk_count=1,
+    device="cuda",
+    segment_duration=10,
+    context_duration=3,
+    seed=None,
+    use_cache=True,
+):
+    """
+    Generate music from a text description, yielding the audio as it is produced.
+
+    The music is generated in segments of `segment_duration` seconds (see
+    `iter_music_segments`), so the first audio is available after one segment
+    instead of the whole clip. All `bulk_count` samples are generated and saved
+    like `generate_music_from_text`, but only the first one is yielded. Requests
+    with a seed share the audio cache with `generate_music_from_text`; a cached
+    result is yielded as a single chunk.
+
+    Args:
+        description (str): Text description for music generation.
+        output_folder (str): Folder path to save the generated music.
+        model_name (str): Size of the MusicGen model ('musicgen-small', 'musicgen-medium', 'musicgen-large').
+        duration (int): Length of the generated music in seconds.
+        audio_format (str): Audio format to save the music ('wav', 'mp3', 'ogg', 'flac').
+        bulk_count (int): Number of music samples to generate.
+        device (str): Device to run the model on ('cuda' or 'cpu').
+        segment_duration (int): Length of each generated segment in seconds.
+        context_duration (int): Seconds of the previous segment each segment continues from.
+        seed (int): Random seed (`None` to draw one). Stored in `data.json`.
+        use_cache (bool): Whether to look up and store the results of a given
+            `seed` in the audio cache.
+
+    Yields:
+        tuple: The sample rate and the next 16-bit chunk of the first sample, of shape [T, C].
+
+    Returns:
+        list: List of paths to the generated music files.
+    """
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+    descriptions = [description] * bulk_count
+    output_paths = [f"{output_folder}/{i}.{audio_format}" for i in range(bulk_count)]
+
+    cache_keys = generated_files_path = None
+    if use_cache and seed is not None:
+        cache_keys = audio_cache_keys(
+            description,
+            model_name,
+            duration,
+            seed,
+            bulk_count,
+            (segment_duration, context_duration),
+        )
+        generated_files_path = load_cached_music(cache_keys, output_paths, audio_format)
+
+    if generated_files_path is not None:
+        audio, sr = audio_read(generated_files_path[0])
+        pcm = (audio.clamp(-1, 1) * 32767).round().to(torch.int16)
+        yield sr, pcm.t().contiguous().numpy()
+    else:
+        with get_model(model_name, device=device) as model:
+            print(f"Streaming music in segments of {segment_duration}s...")
+            seed = seed_generation(seed)
+            sr = model.sample_rate
+            for chunks in stream_segmented_music(
+                model,
+                descriptions,
+                output_paths,
+                duration,
                 audio_format,
-            )
-            print(f"Generated music saved at: {output_path}")
-            generated_files_path.append(output_path)
-
-        # Save metadata to data.json
-        metadata = {
-            "description": description,
-            "model_name": model_name,
-            "duration": duration,
-            "bulk_count": bulk_count,
-            "audio_format": audio_format,
-            "generated_files": generated_files_path,
-        }
-        metadata_path = Path(output_folder) / "data.json"
-        with open(metadata_path, "w") as metadata_file:
-            json.dump(metadata, metadata_file, indent=4)
-        print(f"Metadata saved at: {metadata_path}")
-
-        return generated_files_path
+                segment_duration=segment_duration,
+                context_duration=context_duration,
+                keep_wav=cache_keys is not None,
+            ):
+                yield sr, chunks[0]
+        if cache_keys is not None:
+            cache_segmented_music(cache_keys, output_paths, audio_format)
+
+    for output_path in output_paths:
+        print(f"Generated music saved at: {output_path}")
+
+    metadata = {
+        "description": description,
+        "model_name": model_name,
+        "duration": duration,
+        "bulk_count": bulk_count,
+        "audio_format": audio_format,
+        "segment_duration": segment_duration if duration > segment_duration else None,
+        "seed": seed,
+        "generated_files": output_paths,
+    }
+    _save_metadata(output_folder, metadata)
+
+    return output_paths
+
+
+def _available_memory(device):
+    """Return the memory in bytes currently available on the device."""
+    if str(device).startswith("cuda"):
+        free, _ = torch.cuda.mem_get_info(torch.device(device))
+        return free
+    import psutil
+
+    return psutil.virtual_memory().available
 
-    finally:
-        # Cleanup: Release VRAM
-        print("Releasing GPU resources...")
-        del model  # Delete the model
-        torch.cuda.empty_cache()  # Clear PyTorch GPU cache
-        torch.cuda.synchronize()  # Synchronize to ensure all operations are complete
-        print("GPU resources released.")
 
+def _per_sample_memory(model, duration):
+    """Estimate the peak memory in bytes one sample adds to a `model.generate` batch."""
+    lm = model.lm
+    frames = int(min(duration, model.max_duration) * model.frame_rate)
+    element_size = 4 if model.device.type == "cpu" else 2
+    # Classifier-free guidance doubles the batch, and every transformer layer
+    # caches keys and values for every frame.
+    kv_cache = 2 * 2 * len(lm.transformer.layers) * frames * lm.dim * element_size
+    # The compression model decodes the whole clip at once, its activations are
+    # roughly a hundred times the size of the output waveform.
+    samples = int(duration * model.sample_rate) * model.audio_channels
+    decoder = samples * 4 * 100
+    return int(1.5 * kv_cache + decoder)
 
+
+def estimate_batch_size(model, duration, max_batch_size=64, memory_fraction=0.8):
+    """
+    Choose how many descriptions to generate per `model.generate` call.
+
+    Args:
+        model: The loaded MusicGen model.
+        duration (int): Length of the generated music in seconds.
+        max_batch_size (int): Upper bound on the batch size.
+        memory_fraction (float): Fraction of the available memory to plan for.
+
+    Returns:
+        int: The batch size.
+    """
+    available = _available_memory(model.device) * memory_fraction
+    batch_size = int(available // _per_sample_memory(model, duration))
+    return max(1, min(max_batch_size, batch_size))
+
+
+def _is_out_of_memory(error):
+    message = str(error).lower()
+    return isinstance(error, torch.cuda.OutOfMemoryError) or (
+        "out of memory" in message or "can't allocate memory" in message
+    )
+
+
+@telemetry.traced("stage.music")
 def generate_music_from_folder_of_descriptions(
-    description_path, output_path, model_name, duration, audio_format, device="cuda"
+    description_path,
+    output_path,
+    model_name,
+    duration,
+    audio_format,
+    device="cuda",
+    batch_size=None,
+    writer_workers=2,
+    segment_duration=None,
+    seed=None,
+    use_semantic_cache=False,
+    workers=None,
 ):
     """
     Generate music from descriptions using MusicGen.
 
+    Descriptions are generated in micro-batches. Each finished batch is handed to a
+    background writer, so it is encoded and saved while the next batch generates.
+    When `batch_size` is not given it is estimated from the available memory, the
+    model size and `duration`; the batch size is halved and the batch retried when
+    generation runs out of memory.
+
     Args:
         description_path (str): Path to folder containing description files.
         output_path (str): Path to folder to save generated music.
@@ -134,11 +830,28 @@ def generate_music_from_folder_of_descriptions(
         duration (int): Length of the generated music in seconds.
         audio_format (str): Audio format to save the music ('wav', 'mp3', 'ogg', 'flac').
         device (str): Device to run the model on ('cuda' or 'cpu').
+        batch_size (int): Number of descriptions per generation batch (`None` to estimate it).
+        writer_workers (int): Number of background workers encoding and writing audio (0 to write serially).
+        segment_duration (int): Generate music longer than this many seconds in segments
+            that are appended to the output files as they are produced (`None` to
+            generate each clip at once).
+        seed (int): Random seed (`None` for unseeded). Each batch is seeded with
+            `seed` plus the index of its first description, so results are
+            reproducible for the same batch size.
+        use_semantic_cache (bool): Whether to serve descriptions with the music of a
+            previously generated description with the same meaning, and store new
+            music in the semantic cache. Ignored when `seed` is set.
+        workers (int): Number of CPU worker processes sharing one copy of the model
+            (`None` to generate in this process). Each worker generates shards of
+            `batch_size` descriptions (default: 1). CPU only.
 
     Returns:
         list: List of paths to the generated music files.
     """
-    description_paths = list(Path(description_path).glob("*.txt"))
+    if workers and (device != "cpu" or segment_duration is not None):
+        raise ValueError("Worker processes need --device cpu and no segmentation")
+
+    description_paths = sorted(Path(description_path).glob("*.txt"))
     if not description_paths:
         raise ValueError(f"No description files found in {description_path}!")
 
@@ -147,32 +860,113 @@ def generate_music_from_folder_of_descriptions(
         with open(description_file, "r") as f:
             descriptions.append(f.read())
 
-    # Load the MusicGen model
-    model = load_model(model_name, device=device)
-    model.set_generation_params(duration=duration)
-
-    # Generate music from descriptions
-    print("Generating music...")
-    musics = model.generate(descriptions, progress=True)
-
-    # Save generated music files
     output_dir = Path(output_path)
     output_dir.mkdir(parents=True, exist_ok=True)
+    segmented = segment_duration is not None and duration > segment_duration
     generated_files = []
-    for music, description_file in zip(musics, description_paths):
-        output_file = output_dir / f"{description_file.stem}.{audio_format}"
-        audio_write(
-            output_file,
-            music.cpu(),
-            model.sample_rate,
-            format=audio_format,
-            strategy="loudness",
-            loudness_compressor=True,
-            add_suffix=False,
-        )
-        generated_files.append(str(output_file))
-        print(f"Generated music saved at: {output_file}")
 
+    embeddings = {}
+    if use_semantic_cache and seed is None:
+        # Serve near-duplicates from the cache and only generate the rest
+        misses = []
+        for description, description_file in zip(descriptions, description_paths):
+            output_file = output_dir / f"{description_file.stem}.{audio_format}"
+            match, embedding = semantic_cache.lookup(description, model_name, duration)
+            if match is not None:
+                generated_files += load_semantic_music(
+                    match, [output_file], audio_format
+                )
+            else:
+                embeddings[str(output_file)] = (embedding, description)
+                misses.append((description, description_file))
+        if not misses:
+            return generated_files
+        descriptions, description_paths = map(list, zip(*misses))
+
+    with AudioWriter(save_audio, workers=writer_workers) as writer:
+        if workers:
+            # Shards run in parallel processes sharing one copy of the weights
+            output_files = [
+                output_dir / f"{description_file.stem}.{audio_format}"
+                for description_file in description_paths
+            ]
+            with MusicWorkerPool(model_name, workers) as pool:
+                musics = pool.map(
+                    descriptions, duration, shard_size=batch_size or 1, seed=seed
+                )
+                for music, output_file in zip(musics, output_files):
+                    writer.submit(
+                        torch.from_numpy(music),
+                        pool.sample_rate,
+                        output_file,
+                        audio_format,
+                    )
+        else:
+            with get_model(model_name, device=device) as model:
+                model.set_generation_params(duration=duration)
+                sr = model.sample_rate
+
+                if batch_size is None:
+                    # Segmented generation only holds one segment in memory
+                    batch_size = estimate_batch_size(
+                        model,
+                        min(duration, segment_duration) if segmented else duration,
+                    )
+                print(f"Generating music in batches of {batch_size}...")
+
+                start = 0
+                while start < len(descriptions):
+                    batch = descriptions[start : start + batch_size]
+                    output_files = [
+                        output_dir / f"{description_file.stem}.{audio_format}"
+                        for description_file in description_paths[
+                            start : start + len(batch)
+                        ]
+                    ]
+                    if seed is not None:
+                        seed_generation(seed + start)
+                    try:
+                        if segmented:
+                            # Segments are appended to the files as they are produced
+                            generated_files += generate_segmented_music(
+                                model,
+                                batch,
+                                output_files,
+                                duration,
+                                audio_format,
+                                segment_duration=segment_duration,
+                            )
+                            start += len(batch)
+                            continue
+                        musics = generate(model, batch)
+                    except RuntimeError as e:
+                        if not _is_out_of_memory(e) or batch_size == 1:
+                            raise
+                        batch_size //= 2
+                        print(
+                            f"Out of memory, retrying with batch size {batch_size}..."
+                        )
+                        if str(device).startswith("cuda"):
+                            torch.cuda.empty_cache()
+                        continue
+
+                    # Hand the batch to the writer and move on to the next one
+                    for music, output_file in zip(musics, output_files):
+                        writer.submit(music.cpu(), sr, output_file, audio_format)
+                    start += len(batch)
+
+        # Release the model first, then wait for the remaining writes
+        generated_files += writer.wait()
+
+    for output_file in generated_files:
+        if str(output_file) in embeddings:
+            embedding, description = embeddings[str(output_file)]
+            semantic_cache.add(
+                embedding, description, model_name, duration, [output_file]
+            )
+
+    for output_file in generated_files:
+        print(f"Generated music saved at: {output_file}")
     return generated_files
 
 
@@ -209,15 +1003,101 @@ def main():
         help="Audio format to save the music",
     )
     parser.add_argument(
-        "--device", type=str, default="cuda", help="Device to run the model on"
+        "--device",
+        type=str,
+        default="auto",
+        help="Device to run the model on ('cuda', 'cpu', or 'auto' to use CUDA when available)",
+    )
+    parser.add_argument(
+        "--cpu-optimization",
+        type=str,
+        choices=["none", "int8", "bf16", "auto"],
+        default=None,
+        help="Weight optimization on CPU (default: auto, bf16 where supported, otherwise int8)",
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Compile the decoder step with torch.compile on CPU",
+    )
+    parser.add_argument(
+        "--telemetry",
+        type=str,
+        default=None,
+        help="Append timing, token and memory spans of each stage to this JSON lines file",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Number of descriptions per generation batch (default: estimated from available memory)",
+    )
+    parser.add_argument(
+        "--segment-duration",
+        type=int,
+        default=None,
+        help="Generate music longer than this many seconds in segments appended to the output as they are produced",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed for reproducible generation (default: unseeded)",
+    )
+    parser.add_argument(
+        "--semantic-cache",
+        action="store_true",
+        help="Reuse the music of previously generated descriptions with the same meaning",
+    )
+    parser.add_argument(
+        "--semantic-threshold",
+        type=float,
+        default=None,
+        help="Minimum cosine similarity for a semantic cache hit (default: 0.97)",
+    )
+    parser.add_argument(
+        "--flag-false-hit",
+        type=str,
+        default=None,
+        metavar="OUTPUT_FOLDER",
+        help="Report the semantic cache match recorded in OUTPUT_FOLDER/data.json as a bad match, then exit",
+    )
+    parser.add_argument(
+        "--writer-workers",
+        type=int,
+        default=2,
+        help="Number of background workers encoding and writing audio (0 to write serially)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of CPU worker processes sharing one copy of the model (default: off)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        help="Memory budget in GB for resident models (default: unlimited)",
     )
     parser.add_argument(
         "--debug", action="store_true", help="Enable debug mode for verbose output"
     )
     args = parser.parse_args()
 
+    args.device = resolve_device(args.device)
+    cpu_inference.configure(optimization=args.cpu_optimization, compile=args.compile)
+    if args.telemetry is not None:
+        telemetry.configure(path=args.telemetry)
+    if args.memory_budget is not None:
+        registry.configure(memory_budget_gb=args.memory_budget)
+    if args.semantic_threshold is not None:
+        semantic_cache.threshold = args.semantic_threshold
+
     try:
-        if args.debug:
+        if args.flag_false_hit is not None:
+            flag_semantic_match(args.flag_false_hit)
+        elif args.debug:
             result = generate_music_from_text(
                 description="A cool Jazz music.",
                 output_folder="./output/debug",
@@ -225,7 +1105,8 @@ def main():
                 duration=5,
                 audio_format="wav",
                 bulk_count=10,
-                device="cuda",
+                device=args.device,
+                seed=args.seed,
             )
             print(result)
         else:
@@ -236,9 +1117,21 @@ def main():
                 args.duration,
                 args.audio_format,
                 args.device,
+                batch_size=args.batch_size,
+                writer_workers=args.writer_workers,
+                segment_duration=args.segment_duration,
+                seed=args.seed,
+                use_semantic_cache=args.semantic_cache,
+                workers=args.workers,
             )
     except ValueError as e:
         print(f"Error: {e}")
+    finally:
+        registry.report()
+        conditioning_cache.report()
+        audio_cache.report()
+        semantic_cache.report()
+        telemetry.report()
 
 
 if __name__ == "__main__":
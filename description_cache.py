@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+
+from file_cache import FileCache
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DescriptionCache(FileCache):
+    """
+    On-disk, content-addressed cache of manga→description results.
+
+    Entries are keyed by the content hashes of the input images, the model name,
+    the prompt entries the model uses and its generation parameters, so editing a
+    prompt or swapping a page only invalidates the chapters that actually changed.
+    The cache is bounded in size and evicts least recently used entries first.
+    """
+
+    pattern = "*/*.json"
+
+    def __init__(self, cache_dir="./cache/descriptions", max_size_mb=256):
+        """
+        Args:
+            cache_dir (str): Folder to store cache entries in.
+            max_size_mb (float): Maximum total size of the cache in MB.
+        """
+        super().__init__(cache_dir, max_size_mb)
+
+    def make_key(self, image_paths, model, prompts, params=None):
+        """
+        Compute the cache key of a description request.
+
+        Args:
+            image_paths (list): Paths of the input images, in the order sent to the model.
+            model (str): Model name.
+            prompts (dict): The `prompt.json` entries used by the model.
+            params (dict): Generation parameters that affect the output.
+
+        Returns:
+            str: Hex digest identifying the request.
+        """
+        payload = {
+            "images": [hash_file(path) for path in image_paths],
+            "model": model,
+            "prompts": prompts,
+            "params": params or {},
+        }
+        encoded = json.dumps(payload, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _entry_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        """Return the cached description for `key`, or `None` on a miss."""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        self._touch(entry_path)
+        return entry["description"]
+
+    def put(self, key, description, metadata=None):
+        """Store a description under `key` and evict entries over the size bound."""
+        entry = {"description": description, "metadata": metadata or {}}
+
+        def write(tmp_path):
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f, indent=4)
+
+        self._write(self._entry_path(key), write)
+
+
+description_cache = DescriptionCache(
+    cache_dir=os.environ.get("MANGA2MUSIC_CACHE_DIR", "./cache") + "/descriptions"
+)
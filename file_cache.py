@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+
+def _file_size(path):
+    """Return the size of a file in bytes, 0 if it does not exist."""
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+class FileCache:
+    """
+    Base class of the on-disk caches, bounded in size and evicting least recently
+    used files first.
+
+    Cache files live under `cache_dir` and match `pattern`. Their total size is
+    counted on the first write and kept up to date from then on. The files are
+    only listed when the bound is exceeded, and eviction frees a tenth of the
+    bound, so the listing runs once per many writes instead of on every write.
+    """
+
+    pattern = "*/*"
+
+    def __init__(self, cache_dir, max_size_mb):
+        """
+        Args:
+            cache_dir (str): Folder to store cache files in.
+            max_size_mb (float): Maximum total size of the cache in MB.
+        """
+        self._lock = threading.Lock()
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @cache_dir.setter
+    def cache_dir(self, cache_dir):
+        with self._lock:
+            self._cache_dir = Path(cache_dir)
+            # Counted again on the next write
+            self._size = None
+
+    def _touch(self, path):
+        # Touch the file so eviction is least recently used rather than oldest.
+        now = time.time()
+        os.utime(path, (now, now))
+
+    def _write(self, path, write):
+        """
+        Atomically create or replace a cache file and evict files over the bound.
+
+        Args:
+            path (Path): Cache file to write.
+            write (callable): Writes the contents to the temporary path it is given.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        write(tmp_path)
+        added_bytes = tmp_path.stat().st_size - _file_size(path)
+        os.replace(tmp_path, path)
+        self._added(added_bytes)
+
+    def _scan(self):
+        """Return (mtime, size, path) of every cache file, least recently used first."""
+        entries = []
+        for path in self.cache_dir.glob(self.pattern):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def _added(self, added_bytes):
+        """Account for `added_bytes` new bytes and evict files over the size bound."""
+        max_bytes = self.max_size_mb * 1024**2
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            else:
+                self._size += added_bytes
+            if self._size <= max_bytes:
+                return
+            entries = self._scan()
+            # Resync with the disk, other processes may share the cache
+            self._size = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if self._size <= 0.9 * max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                self._size -= size
+
+    def clear(self):
+        """Remove every cache file."""
+        for _, _, path in self._scan():
+            path.unlink(missing_ok=True)
+        with self._lock:
+            self._size = None
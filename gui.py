@@ -1,76 +1,246 @@
+import functools
 import gradio as gr
-import numpy as np
+import os
 import pytz
+import queue
+import threading
+import time
 from datetime import datetime
-from manga2description import generate_descriptions_from_manga
+from audio_cache import audio_cache
+from conditioning_cache import conditioning_cache
+from cpu_inference import resolve_device
+from model_registry import registry
+from semantic_cache import semantic_cache
+from telemetry import telemetry
+from vision_cache import vision_cache
+from scheduler import BatchScheduler
 
-# from description2music import generate_music_from_descriptions
-from description2music import generate_music_from_text
+# The pipelines (and torch, audiocraft, llava and openai with them) are imported
+# on first use, so the server binds its port without waiting for them.
 
+# Models loaded in the background once the server is up, e.g. "musicgen-medium,llava-0.5b".
+WARMUP_MODELS = [
+    name for name in os.environ.get("MANGA2MUSIC_WARMUP", "").split(",") if name
+]
 
-def image_to_music_desc(images_folder, model_choice):
+# Port of the Prometheus metrics endpoint (unset to disable telemetry).
+METRICS_PORT = os.environ.get("MANGA2MUSIC_METRICS_PORT")
+
+
+@functools.lru_cache(maxsize=None)
+def _device():
+    # Device the local models run on; CUDA when available unless overridden.
+    return resolve_device(os.environ.get("MANGA2MUSIC_DEVICE", "auto"))
+
+
+def _generate_music_batch(key, payloads):
+    from description2music import generate_music_batch
+
+    return generate_music_batch(key, payloads)
+
+
+def _generate_descriptions_batch(key, payloads):
+    from manga2description import generate_descriptions_batch
+
+    return generate_descriptions_batch(key, payloads)
+
+
+def warm_up(model_names):
+    """
+    Import the pipelines and load the given models into the model registry.
+
+    MusicGen models also generate one second of music, so the first request does
+    not pay for the first-call setup of the kernels and the conditioning cache.
+
+    Args:
+        model_names (list): Model names from the dropdowns ('musicgen-medium', 'llava-0.5b', 'gpt-4o-mini', ...).
+    """
+    for model_name in model_names:
+        start = time.perf_counter()
+        try:
+            if model_name.startswith("musicgen"):
+                from description2music import get_model
+
+                with get_model(model_name, device=_device()) as model:
+                    model.set_generation_params(duration=1)
+                    model.generate(["warm-up"])
+            elif model_name.startswith("llava"):
+                from manga2description import get_llava
+
+                with get_llava(model_name, device=_device()):
+                    pass
+            else:
+                # API models only need their client imported
+                import models.gpt4o  # noqa: F401
+        except Exception as e:
+            print(f"Warm-up of {model_name} failed: {e}")
+            continue
+        print(f"Warmed up {model_name} in {time.perf_counter() - start:.1f}s")
+
+
+# Maximum number of requests the app handles at once. Concurrent requests are
+# coalesced into shared batches by the schedulers below.
+MAX_CONCURRENT_REQUESTS = 16
+
+# Music requests sharing a model and duration run in one `model.generate` call;
+# the batch size counts samples, so bulk generations take several slots.
+music_scheduler = BatchScheduler(
+    _generate_music_batch, max_batch_size=16, max_wait=0.5, name="Music scheduler"
+)
+description_scheduler = BatchScheduler(
+    _generate_descriptions_batch,
+    max_batch_size=8,
+    max_wait=0.5,
+    name="Description scheduler",
+)
+
+
+def image_to_music_desc(images_folder, model_choice, gpt_mode="two-step"):
     timestamp = datetime.now(pytz.timezone("Asia/Taipei")).strftime("%Y%m%d_%H%M%S")
     output_path = f"./output/descriptions/{timestamp}"
     try:
-        # Call the manga description generator
-        description_file = generate_descriptions_from_manga(
-            manga_path=images_folder,
-            output_path=output_path,
-            model=model_choice,
+        # Decoded together with concurrent requests; LLaVA text is pushed to the
+        # textbox step by step, GPT text once it is complete
+        updates = queue.Queue()
+        job = description_scheduler.submit(
+            (model_choice, gpt_mode, _device()),
+            (images_folder, output_path, updates.put),
         )
-        with open(description_file, "r") as f:
+        while not job.done():
+            try:
+                descriptions = updates.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            # Skip to the latest text when the textbox falls behind
+            while not updates.empty():
+                descriptions = updates.get()
+            yield descriptions, gr.update(interactive=False)
+        with open(job.result(), "r") as f:
             descriptions = f.read()
-        return descriptions, gr.update(interactive=True)
+        yield descriptions, gr.update(interactive=True)
     except Exception as e:
-        return f"Error: {e}", gr.update(interactive=True)
+        yield f"Error: {e}", gr.update(interactive=True)
+    finally:
+        registry.report()
+        description_scheduler.report()
+        vision_cache.report()
+        telemetry.report()
+
+
+def _parse_seed(seed):
+    # An empty seed box means a random seed
+    return None if seed is None or seed == "" else int(seed)
 
 
-def music_desc_to_music(music_desc, model_choice, duration, audio_format, bulk_count):
+def music_desc_to_music(
+    music_desc,
+    model_choice,
+    duration,
+    audio_format,
+    bulk_count,
+    stream=False,
+    seed=None,
+    use_semantic_cache=False,
+):
+    from description2music import generate_music_from_text, stream_music_from_text
+
     timestamp = datetime.now(pytz.timezone("Asia/Taipei")).strftime("%Y%m%d_%H%M%S")
     output_folder = f"./output/musics/{timestamp}"
     try:
-        # Call the music generator
-        generated_files_paths = generate_music_from_text(
-            description=music_desc,
-            output_folder=output_folder,
-            model_name=model_choice,
-            duration=duration,
-            audio_format=audio_format,
-            bulk_count=bulk_count,
-            device="cuda",
-        )
+        if stream:
+            # Push the first sample to the live player segment by segment
+            chunks = stream_music_from_text(
+                description=music_desc,
+                output_folder=output_folder,
+                model_name=model_choice,
+                duration=duration,
+                audio_format=audio_format,
+                bulk_count=bulk_count,
+                device=_device(),
+                seed=_parse_seed(seed),
+            )
+            while True:
+                try:
+                    chunk = next(chunks)
+                except StopIteration as stop:
+                    generated_files_paths = stop.value
+                    break
+                yield [], chunk, gr.update(), gr.update()
+        else:
+            # Call the music generator
+            generated_files_paths = generate_music_from_text(
+                description=music_desc,
+                output_folder=output_folder,
+                model_name=model_choice,
+                duration=duration,
+                audio_format=audio_format,
+                bulk_count=bulk_count,
+                device=_device(),
+                scheduler=music_scheduler,
+                seed=_parse_seed(seed),
+                use_semantic_cache=use_semantic_cache,
+            )
 
-        return (
+        yield (
             generated_files_paths,
+            None,
             gr.update(value="", visible=False),
             gr.update(interactive=True),
         )
 
     except Exception as e:
-        return (
+        yield (
             f"Error: {e}",
+            None,
             gr.update(value="", visible=False),
             gr.update(interactive=True),
         )
+    finally:
+        registry.report()
+        music_scheduler.report()
+        conditioning_cache.report()
+        audio_cache.report()
+        semantic_cache.report()
+        telemetry.report()
 
 
 def single_stage(
     images_folder,
     img_to_desc_model,
+    gpt_mode,
     desc_to_music_model,
     duration,
     audio_format,
     bulk_count,
+    stream=False,
+    seed=None,
+    use_semantic_cache=False,
 ):
     try:
         # Combines Stage 1 and Stage 2
-        music_desc, _ = image_to_music_desc(images_folder, img_to_desc_model)
-        return music_desc_to_music(
-            music_desc, desc_to_music_model, duration, audio_format, bulk_count
+        timestamp = datetime.now(pytz.timezone("Asia/Taipei")).strftime("%Y%m%d_%H%M%S")
+        job = description_scheduler.submit(
+            (img_to_desc_model, gpt_mode, _device()),
+            (images_folder, f"./output/descriptions/{timestamp}", None),
+        )
+        description_file = job.result()
+        description_scheduler.report()
+        with open(description_file, "r") as f:
+            music_desc = f.read()
+        yield from music_desc_to_music(
+            music_desc,
+            desc_to_music_model,
+            duration,
+            audio_format,
+            bulk_count,
+            stream,
+            seed,
+            use_semantic_cache,
         )
     except Exception as e:
-        return (
+        yield (
             f"Error: {e}",
+            None,
             gr.update(value="", visible=False),
             gr.update(interactive=True),
         )
@@ -90,6 +260,11 @@ with gr.Blocks() as image_to_music_gui:
             choices=["gpt-4o", "gpt-4o-mini", "llava-7b", "llava-0.5b"],
             label="Choose Model for Image to Music Description",
         )
+        gpt_mode_choice = gr.Dropdown(
+            value="two-step",
+            choices=["two-step", "structured"],
+            label="GPT Mode (two requests, or one with structured output)",
+        )
     with gr.Row():
         music_desc_output = gr.Textbox(
             label="Generated Music Description",
@@ -114,7 +289,7 @@ with gr.Blocks() as image_to_music_gui:
 
     gen_desc_button.click(
         image_to_music_desc,
-        inputs=[images_folder_input, img_to_desc_model_choice],
+        inputs=[images_folder_input, img_to_desc_model_choice, gpt_mode_choice],
         outputs=[music_desc_output, gen_desc_button],
     )
 
@@ -143,6 +318,17 @@ with gr.Blocks() as music_desc_to_music_gui:
         bulk_count_input = gr.Slider(
             value=3, minimum=1, maximum=10, step=1, label="Bulk Generation"
         )
+        stream_input = gr.Checkbox(
+            value=False, label="Stream the first sample while generating"
+        )
+        seed_input = gr.Number(value=None, precision=0, label="Seed (empty for random)")
+        semantic_cache_input = gr.Checkbox(
+            value=False, label="Reuse music of similar descriptions"
+        )
+    with gr.Row():
+        live_audio = gr.Audio(
+            label="Live Preview", streaming=True, autoplay=True, visible=False
+        )
     with gr.Row():
         progress_bar = gr.Textbox(value="", visible=False, label="generating...")
     with gr.Row():
@@ -157,6 +343,12 @@ with gr.Blocks() as music_desc_to_music_gui:
         outputs=[gen_music_button],
     )
 
+    stream_input.change(
+        lambda stream: gr.update(visible=stream),
+        inputs=[stream_input],
+        outputs=[live_audio],
+    )
+
     # Show progress bar during generation
     gen_music_button.click(
         lambda: (
@@ -177,8 +369,11 @@ with gr.Blocks() as music_desc_to_music_gui:
             duration_input,
             audio_format_choice,
             bulk_count_input,
+            stream_input,
+            seed_input,
+            semantic_cache_input,
         ],
-        outputs=[audio_paths, progress_bar, gen_music_button],
+        outputs=[audio_paths, live_audio, progress_bar, gen_music_button],
     )
 
     @gr.render(inputs=audio_paths)
@@ -206,6 +401,11 @@ with gr.Blocks() as single_stage_gui:
             choices=["gpt-4o", "gpt-4o-mini", "llava-7b", "llava-0.5b"],
             label="Choose Model for Image to Music Description",
         )
+        gpt_mode_choice_single = gr.Dropdown(
+            value="two-step",
+            choices=["two-step", "structured"],
+            label="GPT Mode (two requests, or one with structured output)",
+        )
         desc_to_music_model_choice_single = gr.Dropdown(
             value="musicgen-medium",
             choices=["musicgen-small", "musicgen-medium", "musicgen-large"],
@@ -221,6 +421,19 @@ with gr.Blocks() as single_stage_gui:
         bulk_count_input_single = gr.Slider(
             value=3, minimum=1, maximum=10, step=1, label="Bulk Generation"
         )
+        stream_input_single = gr.Checkbox(
+            value=False, label="Stream the first sample while generating"
+        )
+        seed_input_single = gr.Number(
+            value=None, precision=0, label="Seed (empty for random)"
+        )
+        semantic_cache_input_single = gr.Checkbox(
+            value=False, label="Reuse music of similar descriptions"
+        )
+    with gr.Row():
+        live_audio_single = gr.Audio(
+            label="Live Preview", streaming=True, autoplay=True, visible=False
+        )
     with gr.Row():
         progress_bar_single = gr.Textbox(value="", visible=False, label="generating...")
     with gr.Row():
@@ -235,6 +448,12 @@ with gr.Blocks() as single_stage_gui:
         outputs=[gen_single_stage_button],
     )
 
+    stream_input_single.change(
+        lambda stream: gr.update(visible=stream),
+        inputs=[stream_input_single],
+        outputs=[live_audio_single],
+    )
+
     # Show progress bar during generation
     gen_single_stage_button.click(
         lambda: (
@@ -251,12 +470,21 @@ with gr.Blocks() as single_stage_gui:
         inputs=[
             images_folder_input_single,
             img_to_desc_model_choice_single,
+            gpt_mode_choice_single,
             desc_to_music_model_choice_single,
             duration_input_single,
             audio_format_choice_single,
             bulk_count_input_single,
+            stream_input_single,
+            seed_input_single,
+            semantic_cache_input_single,
+        ],
+        outputs=[
+            audio_paths_single,
+            live_audio_single,
+            progress_bar_single,
+            gen_single_stage_button,
         ],
-        outputs=[audio_paths_single, progress_bar_single, gen_single_stage_button],
     )
 
     @gr.render(inputs=audio_paths_single)
@@ -279,4 +507,12 @@ with gr.Blocks() as app:
         single_stage_gui.render()
 
 if __name__ == "__main__":
-    app.launch()
+    if METRICS_PORT:
+        telemetry.serve(int(METRICS_PORT))
+    app.queue(default_concurrency_limit=MAX_CONCURRENT_REQUESTS).launch(
+        prevent_thread_lock=True
+    )
+    if WARMUP_MODELS:
+        # Requests are served while the models load
+        threading.Thread(target=warm_up, args=(WARMUP_MODELS,), daemon=True).start()
+    app.block_thread()
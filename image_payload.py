@@ -0,0 +1,155 @@
+import io
+import math
+from PIL import Image, ImageChops, ImageOps
+
+# Vision models tile "high" detail images into 512px squares after fitting them in
+# 2048x2048 and scaling the shortest side down to 768px. "low" detail sees 512x512.
+HIGH_DETAIL_MAX_SIDE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+LOW_DETAIL_SIDE = 512
+TILE_SIZE = 512
+BASE_TOKENS = 85
+TILE_TOKENS = 170
+
+
+def _model_resolution(width, height, detail):
+    """Return the resolution the vision model downsizes an image to."""
+    if detail == "low":
+        scale = min(1.0, LOW_DETAIL_SIDE / max(width, height))
+    else:
+        scale = min(1.0, HIGH_DETAIL_MAX_SIDE / max(width, height))
+        scale *= min(1.0, HIGH_DETAIL_SHORT_SIDE / (min(width, height) * scale))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def estimate_image_tokens(width, height, detail="high"):
+    """
+    Estimate the image tokens a page costs at the given detail level.
+
+    Args:
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+        detail (str): Detail level ('low', 'high', 'auto'). 'auto' is counted as 'high'.
+
+    Returns:
+        int: Estimated number of input tokens.
+    """
+    if detail == "low":
+        return BASE_TOKENS
+    width, height = _model_resolution(width, height, detail)
+    tiles = math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+    return BASE_TOKENS + TILE_TOKENS * tiles
+
+
+def is_monochrome(image, tolerance=16, fraction=0.995):
+    """
+    Check whether an image is (nearly) grayscale.
+
+    Args:
+        image (PIL.Image.Image): Image to check.
+        tolerance (int): Maximum channel difference for a pixel to count as gray.
+        fraction (float): Fraction of gray pixels required.
+
+    Returns:
+        bool: Whether the image is monochrome.
+    """
+    if image.mode in ("1", "L", "LA", "I", "F"):
+        return True
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((256, 256))
+    r, g, b = thumbnail.split()
+    spread = ImageChops.lighter(
+        ImageChops.lighter(ImageChops.difference(r, g), ImageChops.difference(g, b)),
+        ImageChops.difference(r, b),
+    )
+    histogram = spread.histogram()
+    gray_pixels = sum(histogram[: tolerance + 1])
+    return gray_pixels >= fraction * sum(histogram)
+
+
+def trim_margins(image, threshold=24, padding=8):
+    """
+    Crop uniform margins around the page content.
+
+    The margin color is taken from the image corners, so both white and black
+    scan borders are trimmed.
+
+    Args:
+        image (PIL.Image.Image): Image to trim.
+        threshold (int): Minimum difference from the margin color that counts as content.
+        padding (int): Pixels of margin kept around the content.
+
+    Returns:
+        PIL.Image.Image: The trimmed image (the input image if nothing can be trimmed).
+    """
+    gray = image.convert("L")
+    width, height = gray.size
+    corners = [
+        gray.getpixel((0, 0)),
+        gray.getpixel((width - 1, 0)),
+        gray.getpixel((0, height - 1)),
+        gray.getpixel((width - 1, height - 1)),
+    ]
+    background = max(set(corners), key=corners.count)
+    diff = ImageChops.difference(gray, Image.new("L", gray.size, background))
+    bbox = diff.point(lambda p: 255 if p > threshold else 0).getbbox()
+    if bbox is None:
+        return image
+    left, top, right, bottom = bbox
+    bbox = (
+        max(0, left - padding),
+        max(0, top - padding),
+        min(width, right + padding),
+        min(height, bottom + padding),
+    )
+    if bbox == (0, 0, width, height):
+        return image
+    return image.crop(bbox)
+
+
+def optimize_image(image_path, detail="high", quality=85, grayscale=True, trim=True):
+    """
+    Shrink a page to the payload the vision model actually uses.
+
+    The page is trimmed of blank margins, downsized to the model's resolution for
+    the detail level, converted to grayscale when monochrome and recompressed.
+
+    Args:
+        image_path (str): Path to the image.
+        detail (str): Detail level the image will be sent with ('low', 'high', 'auto').
+        quality (int): JPEG quality of the recompressed image.
+        grayscale (bool): Whether to convert monochrome pages to grayscale.
+        trim (bool): Whether to trim blank margins.
+
+    Returns:
+        tuple: The JPEG bytes and a dict of payload stats (bytes and estimated
+            tokens before and after).
+    """
+    with open(image_path, "rb") as image_file:
+        raw = image_file.read()
+
+    image = Image.open(io.BytesIO(raw))
+    image = ImageOps.exif_transpose(image)
+    original_size = image.size
+
+    if trim:
+        image = trim_margins(image)
+    image = image.resize(
+        _model_resolution(*image.size, detail), Image.Resampling.LANCZOS
+    )
+    if grayscale and is_monochrome(image):
+        image = image.convert("L")
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    data = buffer.getvalue()
+
+    stats = {
+        "bytes_before": len(raw),
+        "bytes_after": len(data),
+        "tokens_before": estimate_image_tokens(*original_size, detail),
+        "tokens_after": estimate_image_tokens(*image.size, detail),
+    }
+    return data, stats
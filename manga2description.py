@@ -1,9 +1,217 @@
 from pathlib import Path
-import torch
+import asyncio
+import json
+import time
+from description_cache import description_cache
+from cpu_inference import cpu_inference, resolve_device
+from model_registry import registry
+from page_dedup import dedup_pages
+from rate_limit import RateLimiter
+from telemetry import telemetry
+from vision_cache import vision_cache
 
+GPT_MODELS = ["gpt-4o", "gpt-4o-mini"]
 
+LLAVA_MODELS = {
+    "llava-7b": "lmms-lab/llava-next-interleave-qwen-7b",
+    "llava-0.5b": "lmms-lab/llava-next-interleave-qwen-0.5b",
+}
+
+LLAVA_GENERATION_PARAMS = {
+    "do_sample": True,
+    "temperature": 0.7,
+    "max_new_tokens": 4096,
+}
+
+
+def _get_prompts(model, gpt_mode="two-step", prompt_path="prompt.json"):
+    """Return the `prompt.json` entries used by the given model."""
+    with open(prompt_path, "r") as prompt_file:
+        data = json.load(prompt_file)
+
+    if model in GPT_MODELS and gpt_mode == "structured":
+        keys = ["gpt_structured_prompt"]
+    elif model in GPT_MODELS:
+        keys = ["gpt_first_prompt", "gpt_second_prompt"]
+    else:
+        keys = ["llava_prompt"]
+    return {key: data[key] for key in keys}
+
+
+def get_llava(model, device="cuda"):
+    """
+    Get a resident LLaVA model from the model registry, loading it on a miss.
+
+    Args:
+        model (str): Model name ('llava-7b', 'llava-0.5b').
+        device (str): Device to run the model on ('cuda' or 'cpu').
+
+    Returns:
+        contextmanager: Yields the LLAVA wrapper for exclusive use.
+    """
+    from models.llava import LLAVA
+
+    dtype = cpu_inference.dtype_name() if device == "cpu" else "float16"
+    return registry.use(
+        model,
+        device,
+        dtype,
+        lambda: LLAVA(pretrained_model=LLAVA_MODELS[model], device=device),
+    )
+
+
+def _llava_params(max_new_tokens):
+    """Return the LLaVA generation parameters with the given token budget."""
+    return {**LLAVA_GENERATION_PARAMS, "max_new_tokens": max_new_tokens}
+
+
+def _gpt_params(gpt_mode, image_detail, jpeg_quality, optimize_images):
+    """Return the GPT request parameters that affect the generated description."""
+    params = {
+        "gpt_mode": gpt_mode,
+        "image_detail": image_detail,
+        "optimize_images": optimize_images,
+    }
+    if optimize_images:
+        params["jpeg_quality"] = jpeg_quality
+    return params
+
+
+def _gpt_client_kwargs(params):
+    return {
+        "detail": params["image_detail"],
+        "jpeg_quality": params.get("jpeg_quality", 85),
+        "optimize_images": params["optimize_images"],
+    }
+
+
+def _list_images(manga_path, dedup=True):
+    # Sort pages so the model sees them in reading order and cache keys are stable.
+    image_paths = sorted(Path(manga_path).glob("*.jpg"))
+    if not image_paths:
+        raise ValueError(f"No images found in {manga_path}!")
+    if dedup:
+        image_paths = dedup_pages(image_paths)
+    return image_paths
+
+
+def list_chapters(library_path):
+    """Return the sorted chapter folders of a library that contain images."""
+    chapters = sorted(
+        path
+        for path in Path(library_path).iterdir()
+        if path.is_dir() and any(path.glob("*.jpg"))
+    )
+    if not chapters:
+        raise ValueError(f"No chapter folders with images found in {library_path}!")
+    return chapters
+
+
+def _lookup_cache(manga_path, image_paths, model, params, refresh_cache):
+    """Return the cache key of a request and the cached description, if any."""
+    cache_key = description_cache.make_key(
+        image_paths, model, _get_prompts(model, params.get("gpt_mode")), params
+    )
+    descriptions = None
+    if not refresh_cache:
+        descriptions = description_cache.get(cache_key)
+        if descriptions is not None:
+            print(f"Cache hit for {manga_path} ({cache_key[:12]})")
+    return cache_key, descriptions
+
+
+def _prepare_chapter(manga_path, dedup, use_cache, model, params, refresh_cache):
+    """Return the pages of a chapter, its cache key and the cached description."""
+    image_paths = _list_images(manga_path, dedup)
+    cache_key, descriptions = None, None
+    if use_cache:
+        cache_key, descriptions = _lookup_cache(
+            manga_path, image_paths, model, params, refresh_cache
+        )
+    return image_paths, cache_key, descriptions
+
+
+def _save_descriptions(descriptions, manga_path, output_path, model):
+    Path(output_path).mkdir(parents=True, exist_ok=True)
+    file_name = f"{Path(manga_path).name}_{model}.txt"
+    output_file = Path(output_path) / file_name
+    with open(output_file, "w") as f:
+        f.write(descriptions)
+
+    print(f"Descriptions saved to {output_file}")
+    return str(output_file)
+
+
+def describe_images(
+    image_paths,
+    model,
+    name,
+    save_gpt_artifact=False,
+    device="cuda",
+    use_cache=True,
+    refresh_cache=False,
+    gpt_mode="two-step",
+    image_detail="high",
+    jpeg_quality=85,
+    optimize_images=True,
+    max_new_tokens=4096,
+):
+    """
+    Generate a music description from a list of manga pages.
+
+    Takes the same arguments as `generate_descriptions_from_manga`, with the pages
+    and a name used in logs instead of a folder.
+
+    Returns:
+        str: The generated description.
+    """
+    if model in LLAVA_MODELS:
+        params = _llava_params(max_new_tokens)
+    else:
+        params = _gpt_params(gpt_mode, image_detail, jpeg_quality, optimize_images)
+    descriptions = None
+    if use_cache:
+        cache_key, descriptions = _lookup_cache(
+            name, image_paths, model, params, refresh_cache
+        )
+
+    if descriptions is None:
+        if model in GPT_MODELS:
+            from models.gpt4o import GPT4o
+
+            gpt4o = GPT4o(model=model, **_gpt_client_kwargs(params))
+            descriptions = gpt4o.generate_music_description(
+                image_paths, save_gpt_artifact, mode=gpt_mode
+            )
+
+        elif model in LLAVA_MODELS:
+            with get_llava(model, device=device) as llava:
+                descriptions = llava.generate_music_description(image_paths, **params)
+
+        if use_cache:
+            description_cache.put(
+                cache_key,
+                descriptions,
+                {"manga_path": str(name), "model": model},
+            )
+    return descriptions
+
+
+@telemetry.traced("stage.describe")
 def generate_descriptions_from_manga(
-    manga_path, output_path, model, save_gpt_artifact=False
+    manga_path,
+    output_path,
+    model,
+    save_gpt_artifact=False,
+    device="cuda",
+    use_cache=True,
+    refresh_cache=False,
+    gpt_mode="two-step",
+    image_detail="high",
+    jpeg_quality=85,
+    optimize_images=True,
+    dedup=True,
+    max_new_tokens=4096,
 ):
     """
     Generate music descriptions from manga images.
@@ -13,52 +221,480 @@ def generate_descriptions_from_manga(
         output_path (str): Path to the output folder.
         model (str): Model to use for generation ('gpt-4o', 'gpt-4o-mini', 'llava-7b', 'llava-0.5b').
         save_gpt_artifact (bool): Whether to save GPT artifacts (only for 'gpt-4o' or 'gpt-4o-mini').
+        device (str): Device to run LLaVA on ('cuda' or 'cpu').
+        use_cache (bool): Whether to look up and store results in the description cache.
+        refresh_cache (bool): Whether to ignore cached results and regenerate them.
+        gpt_mode (str): GPT pipeline ('two-step', or 'structured' for a single request).
+        image_detail (str): Detail level pages are sent to GPT with ('low', 'high', 'auto').
+        jpeg_quality (int): JPEG quality of the downsized pages sent to GPT.
+        optimize_images (bool): Whether to downsize, trim and recompress pages sent to GPT.
+        dedup (bool): Whether to skip duplicate and blank pages.
+        max_new_tokens (int): Maximum length of a LLaVA description in tokens.
 
     Returns:
         str: The path to the saved description file.
     """
-    try:
-        image_paths = list(Path(manga_path).glob("*.jpg"))
-        if not image_paths:
-            raise ValueError(f"No images found in {manga_path}!")
+    image_paths = _list_images(manga_path, dedup)
 
-        print(f"Using model: {model}")
+    print(f"Using model: {model}")
 
-        if model in ["gpt-4o", "gpt-4o-mini"]:
+    descriptions = describe_images(
+        image_paths,
+        model,
+        manga_path,
+        save_gpt_artifact,
+        device,
+        use_cache,
+        refresh_cache,
+        gpt_mode,
+        image_detail,
+        jpeg_quality,
+        optimize_images,
+        max_new_tokens,
+    )
+    return _save_descriptions(descriptions, manga_path, output_path, model)
+
+
+def stream_descriptions_from_manga(
+    manga_path,
+    output_path,
+    model,
+    save_gpt_artifact=False,
+    device="cuda",
+    use_cache=True,
+    refresh_cache=False,
+    gpt_mode="two-step",
+    image_detail="high",
+    jpeg_quality=85,
+    optimize_images=True,
+    dedup=True,
+    max_new_tokens=4096,
+):
+    """
+    Generate music descriptions from manga images, yielding the text as it is generated.
+
+    Takes the same arguments as `generate_descriptions_from_manga`. The description
+    file is written once generation completes, and the time to first token is
+    printed.
+
+    Yields:
+        str: The description generated so far.
+
+    Returns:
+        str: The path to the saved description file.
+    """
+    start = time.perf_counter()
+    image_paths = _list_images(manga_path, dedup)
+
+    print(f"Using model: {model}")
+
+    if model in LLAVA_MODELS:
+        params = _llava_params(max_new_tokens)
+    else:
+        params = _gpt_params(gpt_mode, image_detail, jpeg_quality, optimize_images)
+    descriptions = None
+    if use_cache:
+        cache_key, descriptions = _lookup_cache(
+            manga_path, image_paths, model, params, refresh_cache
+        )
+
+    if descriptions is not None:
+        print(f"Time to first token: {time.perf_counter() - start:.2f}s (cached)")
+        yield descriptions
+    else:
+        descriptions = ""
+        if model in GPT_MODELS:
             from models.gpt4o import GPT4o
 
-            gpt4o = GPT4o(model=model)
-            descriptions = gpt4o.generate_music_description(
-                image_paths, save_gpt_artifact
+            gpt4o = GPT4o(model=model, **_gpt_client_kwargs(params))
+            chunks = gpt4o.stream_music_description(
+                image_paths, save_gpt_artifact, mode=gpt_mode
             )
+            for chunk in chunks:
+                if not descriptions:
+                    ttft = time.perf_counter() - start
+                    print(f"Time to first token: {ttft:.2f}s")
+                descriptions += chunk
+                yield descriptions
 
-        elif model in ["llava-7b", "llava-0.5b"]:
-            from models.llava import LLAVA
+        elif model in LLAVA_MODELS:
+            with get_llava(model, device=device) as llava:
+                for chunk in llava.stream_music_description(image_paths, **params):
+                    if not descriptions:
+                        ttft = time.perf_counter() - start
+                        print(f"Time to first token: {ttft:.2f}s")
+                    descriptions += chunk
+                    yield descriptions
 
-            llava_model = (
-                "lmms-lab/llava-next-interleave-qwen-7b"
-                if model == "llava-7b"
-                else "lmms-lab/llava-next-interleave-qwen-0.5b"
+        if use_cache:
+            description_cache.put(
+                cache_key,
+                descriptions,
+                {"manga_path": str(manga_path), "model": model},
             )
-            llava = LLAVA(pretrained_model=llava_model)
-            descriptions = llava.generate_music_description(image_paths)
-
-        # Save the descriptions to output path
-        Path(output_path).mkdir(parents=True, exist_ok=True)
-        file_name = f"{Path(manga_path).name}_{model}.txt"
-        output_file = Path(output_path) / file_name
-        with open(output_file, "w") as f:
-            f.write(descriptions)
-
-        print(f"Descriptions saved to {output_file}")
-        return str(output_file)
-    finally:
-        if model in ["llava-7b", "llava-0.5b"]:
-            print("Releasing GPU memory...")
-            del llava
-            torch.cuda.empty_cache()
-            torch.cuda.synchronize()
-            print("GPU memory released.")
+
+    return _save_descriptions(descriptions, manga_path, output_path, model)
+
+
+async def _describe_chapter_async(
+    gpt4o,
+    semaphore,
+    manga_path,
+    output_path,
+    save_gpt_artifact,
+    use_cache,
+    refresh_cache,
+    params,
+    dedup=True,
+):
+    # Listing, deduplicating and hashing pages, and the cache lookup, read every
+    # page from disk, so keep them off the event loop
+    image_paths, cache_key, descriptions = await asyncio.to_thread(
+        _prepare_chapter,
+        manga_path,
+        dedup,
+        use_cache,
+        gpt4o.model,
+        params,
+        refresh_cache,
+    )
+
+    if descriptions is None:
+        async with semaphore:
+            print(f"Describing {manga_path}...")
+            descriptions = await gpt4o.generate_music_description(
+                image_paths,
+                save_gpt_artifact,
+                name=Path(manga_path).name,
+                mode=params["gpt_mode"],
+            )
+
+        if use_cache:
+            await asyncio.to_thread(
+                description_cache.put,
+                cache_key,
+                descriptions,
+                {"manga_path": str(manga_path), "model": gpt4o.model},
+            )
+
+    return await asyncio.to_thread(
+        _save_descriptions, descriptions, manga_path, output_path, gpt4o.model
+    )
+
+
+async def _describe_library_async(
+    chapters,
+    output_paths,
+    model,
+    save_gpt_artifact,
+    use_cache,
+    refresh_cache,
+    max_in_flight,
+    requests_per_minute,
+    tokens_per_minute,
+    params,
+    dedup=True,
+):
+    from models.gpt4o import AsyncGPT4o
+
+    rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    async with AsyncGPT4o(
+        model=model, rate_limiter=rate_limiter, **_gpt_client_kwargs(params)
+    ) as gpt4o:
+        return await asyncio.gather(
+            *[
+                _describe_chapter_async(
+                    gpt4o,
+                    semaphore,
+                    chapter,
+                    output_path,
+                    save_gpt_artifact,
+                    use_cache,
+                    refresh_cache,
+                    params,
+                    dedup,
+                )
+                for chapter, output_path in zip(chapters, output_paths)
+            ],
+            return_exceptions=True,
+        )
+
+
+def describe_image_lists_llava(
+    image_path_lists,
+    model,
+    names,
+    device="cuda",
+    use_cache=True,
+    refresh_cache=False,
+    batch_size=4,
+    max_new_tokens=4096,
+):
+    """
+    Like `describe_images` for several lists of pages, decoding the uncached ones
+    together with LLaVA.
+
+    Args:
+        image_path_lists (list): One list of page paths per description.
+        model (str): LLaVA model ('llava-7b', 'llava-0.5b').
+        names (list): Name of each list of pages, used in logs and cache metadata.
+        device (str): Device to run LLaVA on ('cuda' or 'cpu').
+        use_cache (bool): Whether to look up and store results in the description cache.
+        refresh_cache (bool): Whether to ignore cached results and regenerate them.
+        batch_size (int): Maximum number of descriptions decoded together.
+        max_new_tokens (int): Maximum length of a description in tokens.
+
+    Returns:
+        list: The description of each list of pages, in input order.
+    """
+    params = _llava_params(max_new_tokens)
+    descriptions = [None] * len(image_path_lists)
+    cache_keys = [None] * len(image_path_lists)
+    if use_cache:
+        for i, (image_paths, name) in enumerate(zip(image_path_lists, names)):
+            cache_keys[i], descriptions[i] = _lookup_cache(
+                name, image_paths, model, params, refresh_cache
+            )
+
+    pending = [i for i, description in enumerate(descriptions) if description is None]
+    if pending:
+        with get_llava(model, device=device) as llava:
+            texts = llava.generate_music_descriptions(
+                [image_path_lists[i] for i in pending],
+                batch_size=batch_size,
+                **params,
+            )
+        for i, text in zip(pending, texts):
+            descriptions[i] = text
+            if use_cache:
+                description_cache.put(
+                    cache_keys[i], text, {"manga_path": str(names[i]), "model": model}
+                )
+    return descriptions
+
+
+def _describe_chapters_llava(
+    chapters,
+    output_paths,
+    model,
+    device="cuda",
+    use_cache=True,
+    refresh_cache=False,
+    dedup=True,
+    batch_size=4,
+    max_new_tokens=4096,
+    on_text=None,
+):
+    """
+    Describe several chapters with LLaVA, decoding the uncached ones in batches.
+
+    `on_text`, if given, is called as `on_text(i, text)` with the description of
+    chapter `i` decoded so far.
+
+    Returns:
+        list: The description file path, or the raised exception, of each chapter.
+    """
+    params = _llava_params(max_new_tokens)
+    results = [None] * len(chapters)
+    pending = []
+    for i, chapter in enumerate(chapters):
+        try:
+            image_paths = _list_images(chapter, dedup)
+            cache_key = descriptions = None
+            if use_cache:
+                cache_key, descriptions = _lookup_cache(
+                    chapter, image_paths, model, params, refresh_cache
+                )
+        except Exception as e:
+            results[i] = e
+            continue
+        if descriptions is not None:
+            results[i] = _save_descriptions(
+                descriptions, chapter, output_paths[i], model
+            )
+        else:
+            pending.append((i, image_paths, cache_key))
+
+    if pending:
+        try:
+            with get_llava(model, device=device) as llava:
+                texts = llava.generate_music_descriptions(
+                    [image_paths for _, image_paths, _ in pending],
+                    batch_size=batch_size,
+                    on_text=(
+                        None
+                        if on_text is None
+                        else lambda j, text: on_text(pending[j][0], text)
+                    ),
+                    **params,
+                )
+        except Exception as e:
+            texts = [e] * len(pending)
+        for (i, _, cache_key), descriptions in zip(pending, texts):
+            if isinstance(descriptions, Exception):
+                results[i] = descriptions
+                continue
+            if use_cache:
+                description_cache.put(
+                    cache_key,
+                    descriptions,
+                    {"manga_path": str(chapters[i]), "model": model},
+                )
+            results[i] = _save_descriptions(
+                descriptions, chapters[i], output_paths[i], model
+            )
+    return results
+
+
+def generate_descriptions_batch(key, payloads):
+    """
+    Describe several manga folders submitted by concurrent requests together.
+
+    This is the `run_batch` function of a `BatchScheduler` coalescing requests
+    that share a model and GPT mode. GPT requests run concurrently on one async
+    client; LLaVA requests are decoded together on the resident model.
+
+    The optional callback of a request receives its LLaVA description decoded so
+    far after every step of the shared batch. GPT requests are not streamed.
+
+    Args:
+        key (tuple): Model, GPT mode and device of the batch.
+        payloads (list): One (manga path, output path, callback or `None`) tuple
+            per request.
+
+    Returns:
+        list: The description file path, or the raised exception, of each request.
+    """
+    model, gpt_mode, device = key
+    if model in GPT_MODELS:
+        return asyncio.run(
+            _describe_library_async(
+                [manga_path for manga_path, _, _ in payloads],
+                [output_path for _, output_path, _ in payloads],
+                model,
+                save_gpt_artifact=False,
+                use_cache=True,
+                refresh_cache=False,
+                max_in_flight=len(payloads),
+                requests_per_minute=None,
+                tokens_per_minute=None,
+                params=_gpt_params(gpt_mode, "high", 85, True),
+            )
+        )
+
+    def on_text(i, text):
+        callback = payloads[i][2]
+        if callback is not None:
+            callback(text)
+
+    return _describe_chapters_llava(
+        [manga_path for manga_path, _, _ in payloads],
+        [output_path for _, output_path, _ in payloads],
+        model,
+        device=device,
+        batch_size=len(payloads),
+        on_text=on_text,
+    )
+
+
+def generate_descriptions_from_library(
+    library_path,
+    output_path,
+    model,
+    save_gpt_artifact=False,
+    device="cuda",
+    use_cache=True,
+    refresh_cache=False,
+    max_in_flight=4,
+    requests_per_minute=None,
+    tokens_per_minute=None,
+    gpt_mode="two-step",
+    image_detail="high",
+    jpeg_quality=85,
+    optimize_images=True,
+    dedup=True,
+    llava_batch_size=4,
+    max_new_tokens=4096,
+):
+    """
+    Generate music descriptions for every chapter folder in a manga library.
+
+    GPT chapters run concurrently on an async client, bounded by `max_in_flight`
+    and the request/token rate limits. LLaVA chapters are decoded in batches of
+    `llava_batch_size` on the resident model.
+
+    Args:
+        library_path (str): Path to the folder containing one sub-folder of images per chapter.
+        output_path (str): Path to the output folder.
+        model (str): Model to use for generation ('gpt-4o', 'gpt-4o-mini', 'llava-7b', 'llava-0.5b').
+        save_gpt_artifact (bool): Whether to save GPT artifacts (only for 'gpt-4o' or 'gpt-4o-mini').
+        device (str): Device to run LLaVA on ('cuda' or 'cpu').
+        use_cache (bool): Whether to look up and store results in the description cache.
+        refresh_cache (bool): Whether to ignore cached results and regenerate them.
+        max_in_flight (int): Maximum number of chapters described concurrently.
+        requests_per_minute (float): API request limit per minute (`None` for no limit).
+        tokens_per_minute (float): API token limit per minute (`None` for no limit).
+        gpt_mode (str): GPT pipeline ('two-step', or 'structured' for a single request).
+        image_detail (str): Detail level pages are sent to GPT with ('low', 'high', 'auto').
+        jpeg_quality (int): JPEG quality of the downsized pages sent to GPT.
+        optimize_images (bool): Whether to downsize, trim and recompress pages sent to GPT.
+        dedup (bool): Whether to skip duplicate and blank pages.
+        llava_batch_size (int): Maximum number of chapters decoded together by LLaVA.
+        max_new_tokens (int): Maximum length of a LLaVA description in tokens.
+
+    Returns:
+        list: Paths to the saved description files.
+    """
+    chapters = list_chapters(library_path)
+
+    print(f"Using model: {model}")
+    print(f"Found {len(chapters)} chapters in {library_path}")
+
+    start = time.perf_counter()
+    if model in GPT_MODELS:
+        results = asyncio.run(
+            _describe_library_async(
+                chapters,
+                [output_path] * len(chapters),
+                model,
+                save_gpt_artifact,
+                use_cache,
+                refresh_cache,
+                max_in_flight,
+                requests_per_minute,
+                tokens_per_minute,
+                _gpt_params(gpt_mode, image_detail, jpeg_quality, optimize_images),
+                dedup,
+            )
+        )
+    else:
+        results = _describe_chapters_llava(
+            chapters,
+            [output_path] * len(chapters),
+            model,
+            device=device,
+            use_cache=use_cache,
+            refresh_cache=refresh_cache,
+            dedup=dedup,
+            batch_size=llava_batch_size,
+            max_new_tokens=max_new_tokens,
+        )
+    elapsed = time.perf_counter() - start
+
+    output_files = []
+    for chapter, result in zip(chapters, results):
+        if isinstance(result, Exception):
+            print(f"Failed to describe {chapter}: {result}")
+        else:
+            output_files.append(result)
+
+    throughput = len(output_files) / elapsed * 60 if elapsed > 0 else float("inf")
+    print(
+        f"Described {len(output_files)}/{len(chapters)} chapters in {elapsed:.1f}s "
+        f"({throughput:.2f} chapters/min)"
+    )
+    return output_files
 
 
 def main():
@@ -74,6 +710,12 @@ def main():
     parser.add_argument(
         "--output-path", type=str, default="./output", help="Path to output folder"
     )
+    parser.add_argument(
+        "--library-path",
+        type=str,
+        default=None,
+        help="Path to folder containing one folder of manga images per chapter (batch mode)",
+    )
     parser.add_argument(
         "--model",
         type=str,
@@ -85,14 +727,172 @@ def main():
         action="store_true",
         help="Save GPT artifacts (only for gpt-4o or gpt-4o-mini)",
     )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="auto",
+        help="Device to run LLaVA on ('cuda', 'cpu', or 'auto' to use CUDA when available)",
+    )
+    parser.add_argument(
+        "--cpu-optimization",
+        type=str,
+        choices=["none", "int8", "bf16", "auto"],
+        default=None,
+        help="Weight optimization on CPU (default: auto, bf16 where supported, otherwise int8)",
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Compile the decoder step with torch.compile on CPU",
+    )
+    parser.add_argument(
+        "--telemetry",
+        type=str,
+        default=None,
+        help="Append timing, token and memory spans of each stage to this JSON lines file",
+    )
+    parser.add_argument(
+        "--gpt-mode",
+        type=str,
+        choices=["two-step", "structured"],
+        default="two-step",
+        help="GPT pipeline: two requests, or one request with structured output",
+    )
+    parser.add_argument(
+        "--image-detail",
+        type=str,
+        choices=["low", "high", "auto"],
+        default="high",
+        help="Detail level pages are sent to GPT with",
+    )
+    parser.add_argument(
+        "--jpeg-quality",
+        type=int,
+        default=85,
+        help="JPEG quality of the downsized pages sent to GPT",
+    )
+    parser.add_argument(
+        "--raw-images",
+        action="store_true",
+        help="Send pages to GPT as-is instead of downsizing and recompressing them",
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Send every page, including duplicate and blank ones",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=4,
+        help="Maximum number of chapters described concurrently in batch mode",
+    )
+    parser.add_argument(
+        "--max-new-tokens",
+        type=int,
+        default=4096,
+        help="Maximum length of a LLaVA description in tokens",
+    )
+    parser.add_argument(
+        "--llava-batch-size",
+        type=int,
+        default=4,
+        help="Maximum number of chapters decoded together by LLaVA in batch mode",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=None,
+        help="API request limit per minute in batch mode (default: unlimited)",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=float,
+        default=None,
+        help="API token limit per minute in batch mode (default: unlimited)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        help="Memory budget in GB for resident models (default: unlimited)",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Disable the description cache"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached descriptions and regenerate them",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Path to the description cache folder (default: ./cache/descriptions)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=float,
+        default=None,
+        help="Maximum size of the description cache in MB (default: 256)",
+    )
     args = parser.parse_args()
 
+    args.device = resolve_device(args.device)
+    cpu_inference.configure(optimization=args.cpu_optimization, compile=args.compile)
+    if args.telemetry is not None:
+        telemetry.configure(path=args.telemetry)
+    if args.memory_budget is not None:
+        registry.configure(memory_budget_gb=args.memory_budget)
+    if args.cache_dir is not None:
+        description_cache.cache_dir = Path(args.cache_dir)
+    if args.cache_size is not None:
+        description_cache.max_size_mb = args.cache_size
+
     try:
-        generate_descriptions_from_manga(
-            args.manga_path, args.output_path, args.model, args.save_gpt_artifact
-        )
+        if args.library_path is not None:
+            generate_descriptions_from_library(
+                args.library_path,
+                args.output_path,
+                args.model,
+                args.save_gpt_artifact,
+                args.device,
+                use_cache=not args.no_cache,
+                refresh_cache=args.refresh,
+                max_in_flight=args.max_in_flight,
+                requests_per_minute=args.rpm,
+                tokens_per_minute=args.tpm,
+                llava_batch_size=args.llava_batch_size,
+                gpt_mode=args.gpt_mode,
+                image_detail=args.image_detail,
+                jpeg_quality=args.jpeg_quality,
+                optimize_images=not args.raw_images,
+                dedup=not args.no_dedup,
+                max_new_tokens=args.max_new_tokens,
+            )
+        else:
+            generate_descriptions_from_manga(
+                args.manga_path,
+                args.output_path,
+                args.model,
+                args.save_gpt_artifact,
+                args.device,
+                use_cache=not args.no_cache,
+                refresh_cache=args.refresh,
+                gpt_mode=args.gpt_mode,
+                image_detail=args.image_detail,
+                jpeg_quality=args.jpeg_quality,
+                optimize_images=not args.raw_images,
+                dedup=not args.no_dedup,
+                max_new_tokens=args.max_new_tokens,
+            )
     except ValueError as e:
         print(f"Error: {e}")
+    finally:
+        registry.report()
+        vision_cache.report()
+        telemetry.report()
 
 
 if __name__ == "__main__":
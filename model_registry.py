@@ -0,0 +1,263 @@
+import gc
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from telemetry import telemetry
+
+# Approximate parameter counts of the weights a loaded model holds, used to make
+# room before its first load. Later loads use the size measured last time.
+_ESTIMATED_PARAMS = {
+    "musicgen-small": 0.4e9,
+    "musicgen-medium": 1.6e9,
+    "musicgen-large": 3.4e9,
+    "llava-0.5b": 0.9e9,
+    "llava-7b": 8.0e9,
+}
+
+
+def _estimate_model_bytes(model):
+    """
+    Estimate the memory held by a loaded model.
+
+    Args:
+        model: The loaded model. Either a torch module, or a wrapper exposing its
+            modules as attributes (e.g. MusicGen's `lm`/`compression_model`, LLAVA's `model`).
+
+    Returns:
+        int: Estimated size in bytes of the model parameters and buffers.
+    """
+    modules = []
+    if hasattr(model, "parameters"):
+        modules.append(model)
+    else:
+        for attr in ("lm", "compression_model", "model"):
+            module = getattr(model, attr, None)
+            if module is not None and hasattr(module, "parameters"):
+                modules.append(module)
+
+    total = 0
+    seen = set()
+    for module in modules:
+        tensors = list(module.parameters()) + list(module.buffers())
+        for tensor in tensors:
+            if tensor.data_ptr() in seen:
+                continue
+            seen.add(tensor.data_ptr())
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def _release(devices):
+    """Collect dropped models and return their memory to the devices."""
+    gc.collect()
+    if any(str(device).startswith("cuda") for device in devices):
+        import torch
+
+        torch.cuda.empty_cache()
+        torch.cuda.synchronize()
+
+
+class _Entry:
+    def __init__(self, model, size):
+        self.model = model
+        self.size = size
+        self.users = 0
+        self.lock = threading.RLock()
+
+
+class ModelRegistry:
+    """
+    Process-wide registry that keeps loaded models resident across requests.
+
+    Models are keyed by (model name, device, dtype) and evicted least recently
+    used first once the total estimated size exceeds the memory budget.
+    """
+
+    def __init__(self, memory_budget_gb=None):
+        """
+        Args:
+            memory_budget_gb (float): Memory budget in GB for all resident models.
+                `None` means unlimited.
+        """
+        self.memory_budget_gb = memory_budget_gb
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @property
+    def memory_budget_bytes(self):
+        if self.memory_budget_gb is None:
+            return None
+        return int(self.memory_budget_gb * 1024**3)
+
+    def configure(self, memory_budget_gb=None):
+        """Change the memory budget and evict models that no longer fit."""
+        with self._lock:
+            self.memory_budget_gb = memory_budget_gb
+            evicted = self._evict_to_fit(0)
+        self._release_all(evicted)
+
+    def _used_bytes(self):
+        return sum(entry.size for entry in self._entries.values())
+
+    def _evict_to_fit(self, incoming_bytes, keep=None):
+        """Pop LRU entries until `incoming_bytes` fits. Caller must hold `_lock`."""
+        budget = self.memory_budget_bytes
+        evicted = []
+        if budget is None:
+            return evicted
+        for key in list(self._entries):
+            if self._used_bytes() + incoming_bytes <= budget:
+                break
+            entry = self._entries[key]
+            if key == keep or entry.users > 0:
+                continue
+            del self._entries[key]
+            self._stats["evictions"] += 1
+            evicted.append((key, entry))
+        return evicted
+
+    def _release_all(self, evicted):
+        """Drop the evicted models. Clears `evicted`, which holds the last references."""
+        if not evicted:
+            return
+        devices = set()
+        for key, entry in evicted:
+            print(f"Evicting model: {key[0]} ({key[1]}, {key[2]})")
+            entry.model = None
+            devices.add(key[1])
+        evicted.clear()
+        _release(devices)
+
+    def _expected_bytes(self, key):
+        """Size of a model before it is loaded: last measured, else estimated."""
+        if key in self._sizes:
+            return self._sizes[key]
+        params = _ESTIMATED_PARAMS.get(key[0], 0)
+        return int(params * (4 if key[2] == "float32" else 2))
+
+    def _get_entry(self, model_name, device, dtype, loader):
+        key = (model_name, str(device), str(dtype))
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    entry.users += 1
+                    return key, entry
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = threading.Event()
+                    self._loading[key] = loading
+                    self._stats["misses"] += 1
+                    break
+            # Another thread is loading the same model, wait for it and retry.
+            loading.wait()
+
+        try:
+            # Make room first, so the old and new weights are never resident at once
+            with self._lock:
+                evicted = self._evict_to_fit(self._expected_bytes(key))
+            self._release_all(evicted)
+            with telemetry.span(
+                "model.load", model=model_name, device=str(device), dtype=str(dtype)
+            ) as span:
+                model = loader()
+                entry = _Entry(model, _estimate_model_bytes(model))
+                span.set(size_bytes=entry.size)
+            with self._lock:
+                # Re-check with the measured size, the estimate may be off
+                evicted = self._evict_to_fit(entry.size)
+                self._sizes[key] = entry.size
+                entry.users += 1
+                self._entries[key] = entry
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+        self._release_all(evicted)
+        return key, entry
+
+    def get(self, model_name, device, dtype, loader):
+        """
+        Return a resident model, loading it with `loader` on a miss.
+
+        Args:
+            model_name (str): Model name, e.g. 'musicgen-small' or 'llava-0.5b'.
+            device (str): Device the model lives on.
+            dtype (str): Weight dtype the model was loaded with.
+            loader (callable): Zero-argument function that loads the model.
+
+        Returns:
+            The loaded model.
+        """
+        key, entry = self._get_entry(model_name, device, dtype, loader)
+        with self._lock:
+            model = entry.model
+            entry.users -= 1
+        return model
+
+    @contextmanager
+    def use(self, model_name, device, dtype, loader):
+        """
+        Context manager that returns a resident model for exclusive use.
+
+        The model is protected from eviction while in use, and concurrent users of
+        the same model are serialized since generation mutates model state
+        (e.g. `set_generation_params`).
+        """
+        key, entry = self._get_entry(model_name, device, dtype, loader)
+        try:
+            with entry.lock:
+                yield entry.model
+        finally:
+            with self._lock:
+                entry.users -= 1
+                evicted = self._evict_to_fit(0)
+            self._release_all(evicted)
+
+    def evict(self, model_name=None):
+        """Evict all idle models, or only those with the given name."""
+        with self._lock:
+            evicted = []
+            for key in list(self._entries):
+                entry = self._entries[key]
+                if entry.users > 0 or model_name not in (None, key[0]):
+                    continue
+                del self._entries[key]
+                self._stats["evictions"] += 1
+                evicted.append((key, entry))
+        self._release_all(evicted)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss/eviction counters, resident models and memory usage.
+        """
+        with self._lock:
+            return {
+                **self._stats,
+                "resident": [list(key) for key in self._entries],
+                "used_gb": round(self._used_bytes() / 1024**3, 3),
+                "budget_gb": self.memory_budget_gb,
+            }
+
+    def report(self):
+        stats = self.stats()
+        print(
+            f"Model registry: hits={stats['hits']} misses={stats['misses']} "
+            f"evictions={stats['evictions']} resident={len(stats['resident'])} "
+            f"used={stats['used_gb']}GB budget={stats['budget_gb']}GB"
+        )
+
+
+def _budget_from_env():
+    value = os.environ.get("MANGA2MUSIC_MODEL_MEMORY_GB")
+    return float(value) if value else None
+
+
+registry = ModelRegistry(memory_budget_gb=_budget_from_env())
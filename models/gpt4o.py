@@ -1,18 +1,83 @@
+import asyncio
 import json
 import base64
 import os
+import random
+import time
 import pytz
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from openai import OpenAI
+from openai import (
+    APIConnectionError,
+    AsyncOpenAI,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
 
+from image_payload import BASE_TOKENS, optimize_image
+from telemetry import telemetry
 
-class GPT4o(OpenAI):
-    def __init__(self, model="gpt-4o"):
-        super().__init__()
+# Rough per-image token cost used for rate limiting (a 1024x1024 page at high detail).
+IMAGE_TOKEN_ESTIMATE = 765
+# Completion budget assumed for rate limiting until the real usage is known.
+COMPLETION_TOKEN_ESTIMATE = 500
+
+GPT_MODES = ["two-step", "structured"]
+CATEGORIES = [
+    "comedy",
+    "humor",
+    "romance",
+    "sci-fi",
+    "horror",
+    "action",
+    "drama",
+    "conversation",
+]
+# Schema of the single-call mode. The analysis fields come before the music
+# description so the model still reasons about the scene before describing music.
+STRUCTURED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "music_description",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "category": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": CATEGORIES},
+                },
+                "emotion": {"type": "string"},
+                "focus": {"type": "string", "enum": ["dialogue", "visuals"]},
+                "plot": {"type": "string"},
+                "music_description": {"type": "string"},
+            },
+            "required": [
+                "category",
+                "emotion",
+                "focus",
+                "plot",
+                "music_description",
+            ],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+class _GPT4oMixin:
+    """Prompt and message construction shared by the sync and async clients."""
+
+    def _setup(self, model, detail="high", jpeg_quality=85, optimize_images=True):
         self.model = model
+        self.detail = detail
+        self.jpeg_quality = jpeg_quality
+        self.optimize_images = optimize_images
         self._prompt_path = "prompt.json"
         self.timezone = pytz.timezone("Asia/Taipei")
+        self.usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
 
     def _get_prompt(self):
         with open(self._prompt_path, "r") as prompt_file:
@@ -23,20 +88,77 @@ class GPT4o(OpenAI):
 
         return first_prompt, second_prompt
 
+    def _get_structured_prompt(self):
+        with open(self._prompt_path, "r") as prompt_file:
+            data = json.load(prompt_file)
+
+        return data["gpt_structured_prompt"]
+
+    def _record_usage(self, response):
+        """Accumulate request and token counts of a completed request."""
+        self.usage["requests"] += 1
+        if response.usage is not None:
+            prompt_tokens = response.usage.prompt_tokens
+            completion_tokens = response.usage.completion_tokens
+            self.usage["prompt_tokens"] += prompt_tokens
+            self.usage["completion_tokens"] += completion_tokens
+            telemetry.annotate(
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+            )
+            telemetry.count("tokens", prompt_tokens, model=self.model, kind="prompt")
+            telemetry.count(
+                "tokens", completion_tokens, model=self.model, kind="completion"
+            )
+
+    @telemetry.traced("image.encode")
     def _encode_image(self, image_path):
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
+        if not self.optimize_images:
+            with open(image_path, "rb") as image_file:
+                data = image_file.read()
+            stats = {"bytes_before": len(data), "bytes_after": len(data)}
+            return base64.b64encode(data).decode("utf-8"), stats
 
-    def _analyze_images(self, image_paths):
-        base64_images = [self._encode_image(_image_path) for _image_path in image_paths]
-        first_prompt, _ = self._get_prompt()
+        data, stats = optimize_image(
+            image_path, detail=self.detail, quality=self.jpeg_quality
+        )
+        telemetry.annotate(**stats)
+        return base64.b64encode(data).decode("utf-8"), stats
+
+    def _encode_images(self, image_paths):
+        """Encode pages in a thread pool and log the payload savings."""
+        with ThreadPoolExecutor(max_workers=min(8, len(image_paths))) as executor:
+            encoded = list(executor.map(self._encode_image, image_paths))
+
+        bytes_before = sum(stats["bytes_before"] for _, stats in encoded)
+        bytes_after = sum(stats["bytes_after"] for _, stats in encoded)
+        message = (
+            f"Image payload: {len(image_paths)} pages, "
+            f"{bytes_before / 1024:.0f}KB -> {bytes_after / 1024:.0f}KB"
+        )
+        if self.optimize_images:
+            tokens_before = sum(stats["tokens_before"] for _, stats in encoded)
+            tokens_after = sum(stats["tokens_after"] for _, stats in encoded)
+            message += f", ~{tokens_before} -> ~{tokens_after} image tokens"
+        print(message)
+
+        return [base64_image for base64_image, _ in encoded]
+
+    def _analysis_messages(self, image_paths, structured=False):
+        base64_images = self._encode_images(image_paths)
+        if structured:
+            first_prompt = self._get_structured_prompt()
+        else:
+            first_prompt, _ = self._get_prompt()
 
         content = []
         for _base64_image in base64_images:
             content.append(
                 {
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{_base64_image}"},
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{_base64_image}",
+                        "detail": self.detail,
+                    },
                 }
             )
         content.append(
@@ -46,49 +168,269 @@ class GPT4o(OpenAI):
             }
         )
 
-        response = self.chat.completions.create(
-            model=self.model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": content,
-                }
-            ],
-        )
+        return [
+            {
+                "role": "user",
+                "content": content,
+            }
+        ]
 
-        return response.choices[0].message.content
+    def _description_messages(self, image_analysis):
+        _, second_prompt = self._get_prompt()
+
+        content = f"{second_prompt} {image_analysis}"
 
-    def _save_artifact(self, analysis_content):
+        return [
+            {
+                "role": "user",
+                "content": content,
+            },
+        ]
+
+    def _parse_structured(self, content):
+        """Split a structured response into the analysis text and the description."""
+        result = json.loads(content)
+        image_analysis = (
+            f"1. Category: {', '.join(result['category'])}\n"
+            f"2. Emotion: {result['emotion']}\n"
+            f"3. Focus: {result['focus']}\n"
+            f"4. Plot: {result['plot']}"
+        )
+        return image_analysis, result["music_description"]
+
+    def _save_artifact(self, analysis_content, name=None):
         artifacts_dir = Path("artifacts")
         artifacts_dir.mkdir(exist_ok=True)
 
         # Generate a timestamp-based filename
         timestamp = datetime.now(self.timezone).strftime("%Y%m%d_%H%M%S")
-        artifact_file = artifacts_dir / f"artifact_{timestamp}.txt"
+        suffix = f"_{name}" if name else ""
+        artifact_file = artifacts_dir / f"artifact_{timestamp}{suffix}.txt"
 
         with open(artifact_file, "w") as file:
             file.write(analysis_content)
 
         print(f"Artifact saved to {artifact_file}")
 
-    def generate_music_description(self, image_paths, save_artifact=False):
+
+class GPT4o(_GPT4oMixin, OpenAI):
+    def __init__(
+        self, model="gpt-4o", detail="high", jpeg_quality=85, optimize_images=True
+    ):
+        super().__init__()
+        self._setup(model, detail, jpeg_quality, optimize_images)
+
+    def _create(self, messages, **kwargs):
+        with telemetry.span("api.call", model=self.model):
+            response = self.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                **kwargs,
+            )
+            self._record_usage(response)
+        return response
+
+    def _analyze_images(self, image_paths):
+        response = self._create(self._analysis_messages(image_paths))
+
+        return response.choices[0].message.content
+
+    def generate_music_description(
+        self, image_paths, save_artifact=False, mode="two-step"
+    ):
+        """
+        Generate a music description for a series of manga pages.
+
+        Args:
+            image_paths (list): Paths to the manga images.
+            save_artifact (bool): Whether to save the image analysis to `artifacts/`.
+            mode (str): 'two-step' analyzes the pages and describes the music in two
+                requests, 'structured' returns both from one request with a JSON schema.
+
+        Returns:
+            str: The music description.
+        """
+        if mode == "structured":
+            response = self._create(
+                self._analysis_messages(image_paths, structured=True),
+                response_format=STRUCTURED_RESPONSE_FORMAT,
+            )
+            image_analysis, description = self._parse_structured(
+                response.choices[0].message.content
+            )
+            if save_artifact:
+                self._save_artifact(image_analysis)
+            return description
+
         image_analysis = self._analyze_images(image_paths)
 
         if save_artifact:
             self._save_artifact(image_analysis)
 
-        _, second_prompt = self._get_prompt()
+        response = self._create(self._description_messages(image_analysis))
 
-        content = f"{second_prompt} {image_analysis}"
+        return response.choices[0].message.content
 
-        response = self.chat.completions.create(
+    def stream_music_description(
+        self, image_paths, save_artifact=False, mode="two-step"
+    ):
+        """
+        Like `generate_music_description`, but yield the description as it is generated.
+
+        In 'two-step' mode the analysis request completes first and the description
+        request is streamed. In 'structured' mode the description is only known once
+        the JSON response is complete, so it is yielded in one piece.
+        """
+        if mode == "structured":
+            yield self.generate_music_description(image_paths, save_artifact, mode)
+            return
+
+        image_analysis = self._analyze_images(image_paths)
+
+        if save_artifact:
+            self._save_artifact(image_analysis)
+
+        start = time.perf_counter()
+        stream = self.chat.completions.create(
             model=self.model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": content,
-                },
-            ],
+            messages=self._description_messages(image_analysis),
+            stream=True,
+            stream_options={"include_usage": True},
         )
+        usage = {}
+        for chunk in stream:
+            if chunk.usage is not None:
+                self._record_usage(chunk)
+                usage = {
+                    "prompt_tokens": chunk.usage.prompt_tokens,
+                    "completion_tokens": chunk.usage.completion_tokens,
+                }
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        # The stream yields to its caller, so the call is recorded once it ends
+        telemetry.record(
+            "api.call",
+            time.perf_counter() - start,
+            model=self.model,
+            stream=True,
+            **usage,
+        )
+
+
+def _estimate_tokens(messages):
+    """Estimate the total tokens of a chat request for rate limiting."""
+    tokens = COMPLETION_TOKEN_ESTIMATE
+    for message in messages:
+        content = message["content"]
+        parts = [content] if isinstance(content, str) else content
+        for part in parts:
+            if isinstance(part, str):
+                tokens += len(part) // 4
+            elif part["type"] == "text":
+                tokens += len(part["text"]) // 4
+            elif part["image_url"].get("detail") == "low":
+                tokens += BASE_TOKENS
+            else:
+                tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+
+class AsyncGPT4o(_GPT4oMixin, AsyncOpenAI):
+    """
+    Async variant of `GPT4o` for describing many chapters concurrently.
+
+    Requests go through an optional `RateLimiter` and are retried with jittered
+    exponential backoff on rate limits (429), server errors (5xx) and connection
+    errors. The endpoint can be pointed at any OpenAI-compatible server with the
+    `OPENAI_BASE_URL` environment variable.
+    """
+
+    def __init__(
+        self,
+        model="gpt-4o",
+        detail="high",
+        jpeg_quality=85,
+        optimize_images=True,
+        rate_limiter=None,
+        max_retries=6,
+        backoff_base=1.0,
+        backoff_max=60.0,
+    ):
+        # Retries are handled here so they also go through the rate limiter.
+        super().__init__(max_retries=0)
+        self._setup(model, detail, jpeg_quality, optimize_images)
+        self.rate_limiter = rate_limiter
+        self.retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def _backoff(self, attempt, error):
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Full jitter avoids synchronized retries from concurrent chapters.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def _create(self, messages, **kwargs):
+        estimated_tokens = _estimate_tokens(messages)
+        for attempt in range(self.retries + 1):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(estimated_tokens)
+            span = telemetry.span("api.call", model=self.model, attempt=attempt)
+            try:
+                with span:
+                    response = await self.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        **kwargs,
+                    )
+                    self._record_usage(response)
+            except (RateLimitError, InternalServerError, APIConnectionError) as e:
+                if attempt == self.retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                print(f"{type(e).__name__}, retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+                continue
+
+            if self.rate_limiter is not None and response.usage is not None:
+                self.rate_limiter.record_usage(
+                    estimated_tokens, response.usage.total_tokens
+                )
+            return response
+
+    async def generate_music_description(
+        self, image_paths, save_artifact=False, name=None, mode="two-step"
+    ):
+        structured = mode == "structured"
+        # Reading and encoding pages is blocking, keep it off the event loop.
+        messages = await asyncio.to_thread(
+            self._analysis_messages, image_paths, structured
+        )
+
+        if structured:
+            response = await self._create(
+                messages, response_format=STRUCTURED_RESPONSE_FORMAT
+            )
+            image_analysis, description = self._parse_structured(
+                response.choices[0].message.content
+            )
+            if save_artifact:
+                self._save_artifact(image_analysis, name)
+            return description
+
+        response = await self._create(messages)
+        image_analysis = response.choices[0].message.content
+
+        if save_artifact:
+            self._save_artifact(image_analysis, name)
+
+        response = await self._create(self._description_messages(image_analysis))
 
         return response.choices[0].message.content
@@ -6,58 +6,225 @@ from llava.mm_utils import (
 from llava.constants import (
     IMAGE_TOKEN_INDEX,
     DEFAULT_IMAGE_TOKEN,
+    DEFAULT_IMAGE_PATCH_TOKEN,
+    DEFAULT_IM_START_TOKEN,
+    DEFAULT_IM_END_TOKEN,
 )
 from llava.conversation import conv_templates
 
 from PIL import Image
+from transformers import DynamicCache, GenerationConfig, LogitsProcessorList
+from transformers.generation.logits_process import (
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
 import copy
+import time
 import torch
 import warnings
 import json
 
+from cpu_inference import cpu_inference, resolve_device
+from telemetry import telemetry
+
+# Generation config fields `model.generate` honours but `LLAVA._decode` does not
+# implement. A checkpoint setting any of them is rejected instead of silently
+# decoding differently from `model.generate`.
+_UNSUPPORTED_GENERATION_FIELDS = (
+    "num_beams",
+    "num_beam_groups",
+    "penalty_alpha",
+    "min_length",
+    "min_new_tokens",
+    "no_repeat_ngram_size",
+    "encoder_no_repeat_ngram_size",
+    "bad_words_ids",
+    "sequence_bias",
+    "suppress_tokens",
+    "begin_suppress_tokens",
+    "forced_bos_token_id",
+    "forced_eos_token_id",
+    "forced_decoder_ids",
+    "exponential_decay_length_penalty",
+    "renormalize_logits",
+    "guidance_scale",
+    "stop_strings",
+    "watermarking_config",
+)
+# Fields that only change sampled decoding
+_UNSUPPORTED_SAMPLING_FIELDS = ("min_p", "typical_p", "epsilon_cutoff", "eta_cutoff")
+from vision_cache import vision_cache
+
 warnings.filterwarnings("ignore")
 
 
 class LLAVA:
     def __init__(
-        self, pretrained_model="lmms-lab/llava-next-interleave-qwen-0.5b", device="cuda"
+        self,
+        pretrained_model="lmms-lab/llava-next-interleave-qwen-0.5b",
+        device="auto",
+        feature_cache=True,
     ):
-        self.device = device
+        self.device = resolve_device(device)
         self.model_name = "llava_qwen"
         self.device_map = "auto"
+        self.dtype = torch.float16
+        torch_dtype = "float16"
+        if self.device == "cpu":
+            # float16 kernels are slow or missing on CPU, and so is flash attention
+            self.device_map = "cpu"
+            self.dtype = (
+                torch.bfloat16 if cpu_inference.level == "bf16" else torch.float32
+            )
+            # The builder takes no float32, see `_load_float32`
+            torch_dtype = "bfloat16" if self.dtype == torch.bfloat16 else None
 
         # Load model configuration
         self.llava_model_args = {"multimodal": True}
         self.overwrite_config = {"image_aspect_ratio": "pad"}
         self.llava_model_args["overwrite_config"] = self.overwrite_config
+        self.llava_model_args["torch_dtype"] = torch_dtype
+        if self.device == "cpu":
+            self.llava_model_args["attn_implementation"] = "sdpa"
 
         # Load the model and tokenizer
-        self.tokenizer, self.model, self.image_processor, self.max_length = (
-            load_pretrained_model(
-                pretrained_model,
-                None,
-                self.model_name,
-                device_map=self.device_map,
-                **self.llava_model_args,
+        if torch_dtype is None:
+            self.tokenizer, self.model, self.image_processor, self.max_length = (
+                self._load_float32(pretrained_model)
             )
-        )
-        self.model = self.model.to(self.device)
+        else:
+            self.tokenizer, self.model, self.image_processor, self.max_length = (
+                load_pretrained_model(
+                    pretrained_model,
+                    None,
+                    self.model_name,
+                    device_map=self.device_map,
+                    **self.llava_model_args,
+                )
+            )
+        self.model = self.model.to(device=self.device, dtype=self.dtype)
         self.model.eval()
+        if self.device == "cpu":
+            cpu_inference.optimize_llava(self.model)
 
         # Load conversation template
         self.conv_template = "qwen_1_5"
 
         self._prompt_path = "prompt.json"
 
+        # Pages are cached per model revision and preprocessing settings
+        self.feature_cache = feature_cache
+        self._revision = {
+            "model": pretrained_model,
+            "commit": getattr(self.model.config, "_commit_hash", None),
+            "image_aspect_ratio": self.overwrite_config["image_aspect_ratio"],
+            "dtype": str(self.dtype),
+        }
+        self._feature_keys = None
+        # Key/value cache of the prompt tokens in front of the first page
+        self._prefix = None
+        if feature_cache:
+            self._install_feature_cache()
+
+    def _load_float32(self, pretrained_model):
+        """
+        Load the model in float32 on CPU, like `load_pretrained_model` does for
+        float16 and bfloat16.
+
+        The builder accepts no other dtype, and loading float16 weights to upcast
+        them afterwards holds both copies in memory at once.
+        """
+        from llava.model.language_model.llava_qwen import (
+            LlavaQwenConfig,
+            LlavaQwenForCausalLM,
+        )
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(pretrained_model)
+        config = LlavaQwenConfig.from_pretrained(pretrained_model)
+        for key, value in self.overwrite_config.items():
+            setattr(config, key, value)
+        model = LlavaQwenForCausalLM.from_pretrained(
+            pretrained_model,
+            low_cpu_mem_usage=True,
+            attn_implementation=self.llava_model_args["attn_implementation"],
+            config=config,
+            torch_dtype=torch.float32,
+            device_map=self.device_map,
+        )
+
+        if getattr(model.config, "mm_use_im_patch_token", True):
+            tokenizer.add_tokens([DEFAULT_IMAGE_PATCH_TOKEN], special_tokens=True)
+        if getattr(model.config, "mm_use_im_start_end", False):
+            tokenizer.add_tokens(
+                [DEFAULT_IM_START_TOKEN, DEFAULT_IM_END_TOKEN], special_tokens=True
+            )
+        model.resize_token_embeddings(len(tokenizer))
+
+        vision_tower = model.get_vision_tower()
+        if not vision_tower.is_loaded:
+            vision_tower.load_model(device_map=self.device_map)
+        max_length = getattr(model.config, "max_sequence_length", 2048)
+        return tokenizer, model, vision_tower.image_processor, max_length
+
+    def _install_feature_cache(self):
+        """Serve the projected vision embeddings of cached pages from disk."""
+        encode_images = self.model.encode_images
+
+        @telemetry.traced("image.encode")
+        def cached_encode_images(images):
+            keys = self._feature_keys
+            self._feature_keys = None
+            # Only the batch of pages loaded by `_load_images` can be matched to keys
+            if keys is None or images.shape[0] != len(keys):
+                return encode_images(images)
+
+            features = [vision_cache.load(key, "features") for key in keys]
+            misses = [i for i, feature in enumerate(features) if feature is None]
+            telemetry.annotate(pages=len(keys), cached=len(keys) - len(misses))
+            if misses:
+                encoded = encode_images(images[misses])
+                for i, feature in zip(misses, encoded):
+                    features[i] = feature
+                    vision_cache.save(keys[i], "features", feature)
+            return torch.stack(
+                [
+                    feature.to(device=images.device, dtype=self.model.dtype)
+                    for feature in features
+                ]
+            )
+
+        self.model.encode_images = cached_encode_images
+
+    @telemetry.traced("image.load")
     def _load_images(self, image_paths):
         """Load images from file paths and process them into tensors."""
+        # Opening an image only reads its header; pixels are decoded on a cache miss
         images = [Image.open(image_path) for image_path in image_paths]
-        image_tensors = process_images(images, self.image_processor, self.model.config)
+        keys = [None] * len(images)
+        image_tensors = [None] * len(images)
+        if self.feature_cache:
+            keys = [vision_cache.make_key(path, self._revision) for path in image_paths]
+            image_tensors = [vision_cache.load(key, "pixels") for key in keys]
+
+        misses = [i for i, tensor in enumerate(image_tensors) if tensor is None]
+        telemetry.annotate(pages=len(images), cached=len(images) - len(misses))
+        if misses:
+            processed = process_images(
+                [images[i] for i in misses], self.image_processor, self.model.config
+            )
+            for i, tensor in zip(misses, processed):
+                image_tensors[i] = tensor
+                if self.feature_cache:
+                    vision_cache.save(keys[i], "pixels", tensor.to(torch.float16))
+
         image_tensors = [
-            _image.to(dtype=torch.float16, device=self.device)
-            for _image in image_tensors
+            _image.to(dtype=self.dtype, device=self.device) for _image in image_tensors
         ]
         image_sizes = [image.size for image in images]
+        self._feature_keys = keys if self.feature_cache else None
         return image_tensors, image_sizes
 
     def _get_prompt(self):
@@ -66,13 +233,11 @@ class LLAVA:
 
         return data["llava_prompt"]
 
-    def generate_music_description(self, image_paths):
-        """Generate a description based on the given series of images."""
-        # Load and process images
-        image_tensors, image_sizes = self._load_images(image_paths)
+    def _tokenize_prompt(self, num_images):
+        """Build the interleaved text-image prompt ids for `num_images` pages."""
         prompt = self._get_prompt()
         # Prepare interleaved text-image input
-        image_tokens = f"{DEFAULT_IMAGE_TOKEN}" * len(image_paths)
+        image_tokens = f"{DEFAULT_IMAGE_TOKEN}" * num_images
         question = f"{image_tokens} {prompt}"
 
         # Initialize conversation
@@ -81,24 +246,329 @@ class LLAVA:
         conv.append_message(conv.roles[1], None)
         prompt_question = conv.get_prompt()
 
-        # Prepare input for the model
-        input_ids = (
-            tokenizer_image_token(
-                prompt_question, self.tokenizer, IMAGE_TOKEN_INDEX, return_tensors="pt"
-            )
-            .unsqueeze(0)
-            .to(self.device)
+        return tokenizer_image_token(
+            prompt_question, self.tokenizer, IMAGE_TOKEN_INDEX, return_tensors="pt"
         )
 
-        # Generate response
+    def _prepare_inputs(self, image_paths):
+        """Build the interleaved text-image prompt and image tensors for the model."""
+        image_tensors, image_sizes = self._load_images(image_paths)
+        input_ids = self._tokenize_prompt(len(image_paths)).unsqueeze(0).to(self.device)
+        return input_ids, image_tensors, image_sizes
+
+    def _prefix_cache(self, prefix_ids):
+        """Return the key/value cache of the prompt tokens before the first page."""
+        key = tuple(prefix_ids.tolist())
+        if self._prefix is not None and self._prefix[0] == key:
+            return self._prefix[1], True
         with torch.no_grad():
-            cont = self.model.generate(
-                input_ids,
-                images=image_tensors,
-                image_sizes=image_sizes,
-                do_sample=True,
-                temperature=0.7,
-                max_new_tokens=4096,
+            output = self.model(
+                input_ids=prefix_ids.unsqueeze(0).to(self.device),
+                past_key_values=DynamicCache(),
+                use_cache=True,
             )
-        text_outputs = self.tokenizer.batch_decode(cont, skip_special_tokens=True)
-        return text_outputs[0]
+        self._prefix = (key, output.past_key_values)
+        return output.past_key_values, False
+
+    def _check_generation_config(self, do_sample):
+        """Raise if the generation config asks for processing `_decode` lacks."""
+        config = self.model.generation_config
+        default = GenerationConfig()
+        fields = _UNSUPPORTED_GENERATION_FIELDS
+        if do_sample:
+            fields += _UNSUPPORTED_SAMPLING_FIELDS
+        unsupported = [
+            name
+            for name in fields
+            if getattr(config, name, None) != getattr(default, name, None)
+        ]
+        if unsupported:
+            raise ValueError(
+                "LLaVA decoding does not support the generation config fields "
+                + ", ".join(f"{name}={getattr(config, name)!r}" for name in unsupported)
+            )
+
+    def _logits_processor(self, do_sample, temperature):
+        """Build the logits processing `model.generate` applies with these settings."""
+        config = self.model.generation_config
+        processors = LogitsProcessorList()
+        if config.repetition_penalty not in (None, 1.0):
+            processors.append(
+                RepetitionPenaltyLogitsProcessor(config.repetition_penalty)
+            )
+        if do_sample:
+            processors.append(TemperatureLogitsWarper(temperature))
+            if config.top_k:
+                processors.append(TopKLogitsWarper(config.top_k))
+            if config.top_p is not None and config.top_p < 1.0:
+                processors.append(TopPLogitsWarper(config.top_p))
+        return processors
+
+    def _stop_token_ids(self):
+        eos = self.model.generation_config.eos_token_id
+        stop_ids = set(eos if isinstance(eos, list) else [eos])
+        stop_ids.add(self.tokenizer.eos_token_id)
+        stop_ids.discard(None)
+        return torch.tensor(sorted(stop_ids), device=self.device)
+
+    def _decode(
+        self,
+        prompts,
+        image_path_lists,
+        do_sample=True,
+        temperature=0.7,
+        max_new_tokens=4096,
+    ):
+        """
+        Prefill a batch of prompts and decode them together, one step at a time.
+
+        The conversation template puts the same system and user header tokens in
+        front of the first page of every prompt. Their key/value cache is computed
+        once per loaded model and copied into each call, so prefill only runs the
+        pages and the instruction. The rest of each prompt is left-padded after
+        the shared prefix, and decoding stops once every sequence has emitted a
+        stop token or `max_new_tokens` is reached.
+
+        Only the repetition penalty, temperature, top-k and top-p settings of the
+        model's generation config are applied, and a config setting anything else
+        that changes the output raises a ValueError.
+
+        Yields:
+            torch.Tensor: The [B] tokens decoded at each step.
+        """
+        self._check_generation_config(do_sample)
+        start = time.perf_counter()
+        pad_token_id = self.tokenizer.pad_token_id
+        if pad_token_id is None:
+            pad_token_id = self.tokenizer.eos_token_id
+        batch_size = len(prompts)
+
+        first_image = (prompts[0] == IMAGE_TOKEN_INDEX).nonzero()[0].item()
+        prefix_length = first_image
+        cache, prefix_hit = self._prefix_cache(prompts[0][:prefix_length])
+        cache = copy.deepcopy(cache)
+        if batch_size > 1:
+            cache.batch_repeat_interleave(batch_size)
+
+        # Splice the page embeddings into the prompts, right-padded
+        length = max(prompt.shape[0] for prompt in prompts)
+        input_ids = torch.full((batch_size, length), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((batch_size, length), dtype=torch.long)
+        for i, prompt in enumerate(prompts):
+            input_ids[i, : prompt.shape[0]] = prompt
+            attention_mask[i, : prompt.shape[0]] = 1
+        # Images are matched to image tokens in order across the whole batch
+        image_tensors, image_sizes = self._load_images(
+            [path for image_paths in image_path_lists for path in image_paths]
+        )
+        padding_side = getattr(self.model.config, "tokenizer_padding_side", "right")
+        self.model.config.tokenizer_padding_side = "right"
+        try:
+            with torch.no_grad():
+                _, _, attention_mask, _, embeds, _ = (
+                    self.model.prepare_inputs_labels_for_multimodal(
+                        input_ids.to(self.device),
+                        None,
+                        attention_mask.to(self.device),
+                        None,
+                        None,
+                        image_tensors,
+                        image_sizes=image_sizes,
+                    )
+                )
+        finally:
+            self.model.config.tokenizer_padding_side = padding_side
+
+        # Left-pad the part after the prefix, so every sequence ends at the same step
+        lengths = attention_mask.sum(dim=1).tolist()
+        rest_length = max(lengths) - prefix_length
+        rest = embeds.new_zeros((batch_size, rest_length, embeds.shape[-1]))
+        rest_mask = torch.zeros(
+            (batch_size, rest_length), dtype=torch.long, device=self.device
+        )
+        for i, length in enumerate(lengths):
+            rest[i, rest_length - (length - prefix_length) :] = embeds[
+                i, prefix_length:length
+            ]
+            rest_mask[i, rest_length - (length - prefix_length) :] = 1
+        attention_mask = torch.cat(
+            [
+                torch.ones(
+                    (batch_size, prefix_length), dtype=torch.long, device=self.device
+                ),
+                rest_mask,
+            ],
+            dim=1,
+        )
+        position_ids = prefix_length + (rest_mask.cumsum(dim=1) - 1).clamp(min=0)
+
+        processors = self._logits_processor(do_sample, temperature)
+        stop_ids = self._stop_token_ids()
+        generated = torch.empty((batch_size, 0), dtype=torch.long, device=self.device)
+        finished = torch.zeros(batch_size, dtype=torch.bool, device=self.device)
+        prefill_s = decode_start = None
+        try:
+            with torch.no_grad():
+                output = self.model(
+                    inputs_embeds=rest,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=cache,
+                    use_cache=True,
+                )
+                prefill_s = time.perf_counter() - start
+                decode_start = time.perf_counter()
+                positions = position_ids[:, -1:]
+                for _ in range(max_new_tokens):
+                    scores = processors(generated, output.logits[:, -1].float())
+                    if do_sample:
+                        probs = torch.nn.functional.softmax(scores, dim=-1)
+                        tokens = torch.multinomial(probs, num_samples=1).squeeze(1)
+                    else:
+                        tokens = scores.argmax(dim=-1)
+                    tokens = torch.where(finished, pad_token_id, tokens)
+                    generated = torch.cat([generated, tokens[:, None]], dim=1)
+                    yield tokens
+                    finished |= torch.isin(tokens, stop_ids)
+                    if finished.all():
+                        break
+
+                    attention_mask = torch.cat(
+                        [attention_mask, attention_mask.new_ones((batch_size, 1))],
+                        dim=1,
+                    )
+                    positions = positions + 1
+                    output = self.model(
+                        input_ids=tokens[:, None],
+                        attention_mask=attention_mask,
+                        position_ids=positions,
+                        past_key_values=cache,
+                        use_cache=True,
+                    )
+        finally:
+            if prefill_s is not None:
+                decode_s = time.perf_counter() - decode_start
+                decoded = generated.shape[1] * batch_size
+                print(
+                    f"LLaVA prefill: {max(lengths)} tokens x {batch_size} in "
+                    f"{prefill_s:.2f}s (prompt prefix of {prefix_length} tokens "
+                    f"{'reused' if prefix_hit else 'computed'}); decode: "
+                    f"{decoded} tokens at {decoded / max(decode_s, 1e-9):.1f} tokens/s"
+                )
+                prompt_tokens = sum(lengths)
+                telemetry.record(
+                    "llava.generate",
+                    time.perf_counter() - start,
+                    model=self._revision["model"],
+                    batch_size=batch_size,
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=decoded,
+                    prefill_s=prefill_s,
+                    decode_s=decode_s,
+                )
+                telemetry.count(
+                    "tokens",
+                    prompt_tokens,
+                    model=self._revision["model"],
+                    kind="prompt",
+                )
+                telemetry.count(
+                    "tokens", decoded, model=self._revision["model"], kind="completion"
+                )
+
+    def generate_music_descriptions(
+        self,
+        image_path_lists,
+        batch_size=4,
+        do_sample=True,
+        temperature=0.7,
+        max_new_tokens=4096,
+        on_text=None,
+    ):
+        """
+        Generate the descriptions of several chapters, decoding chapters together.
+
+        Chapters are sorted by page count and prompt length before batching, so
+        the chapters in a batch need little padding. With `do_sample=False` each
+        description matches `generate_music_description` on the same pages.
+
+        Args:
+            image_path_lists (list): One list of page paths per chapter.
+            batch_size (int): Maximum number of chapters decoded together.
+            do_sample (bool): Whether to sample instead of decoding greedily.
+            temperature (float): Sampling temperature.
+            max_new_tokens (int): Maximum length of each description in tokens.
+            on_text (callable): Called as `on_text(i, text)` whenever the text
+                decoded so far for chapter `i` grows.
+
+        Returns:
+            list: The description of each chapter, in input order.
+        """
+        prompts = [self._tokenize_prompt(len(paths)) for paths in image_path_lists]
+        order = sorted(
+            range(len(prompts)),
+            key=lambda i: (len(image_path_lists[i]), prompts[i].shape[0]),
+        )
+
+        descriptions = [None] * len(prompts)
+        for start in range(0, len(order), batch_size):
+            batch = order[start : start + batch_size]
+            steps = []
+            for step in self._decode(
+                [prompts[i] for i in batch],
+                [image_path_lists[i] for i in batch],
+                do_sample,
+                temperature,
+                max_new_tokens,
+            ):
+                steps.append(step)
+                if on_text is None:
+                    continue
+                texts = self.tokenizer.batch_decode(
+                    torch.stack(steps, dim=1), skip_special_tokens=True
+                )
+                for i, text in zip(batch, texts):
+                    # Hold back incomplete multi-byte characters until the next token
+                    if text != descriptions[i] and not text.endswith("\ufffd"):
+                        descriptions[i] = text
+                        on_text(i, text)
+            tokens = (
+                torch.stack(steps, dim=1)
+                if steps
+                else torch.empty((len(batch), 0), dtype=torch.long)
+            )
+            texts = self.tokenizer.batch_decode(tokens, skip_special_tokens=True)
+            for i, text in zip(batch, texts):
+                descriptions[i] = text
+        return descriptions
+
+    def generate_music_description(
+        self, image_paths, do_sample=True, temperature=0.7, max_new_tokens=4096
+    ):
+        """Generate a description based on the given series of images."""
+        return self.generate_music_descriptions(
+            [image_paths],
+            do_sample=do_sample,
+            temperature=temperature,
+            max_new_tokens=max_new_tokens,
+        )[0]
+
+    def stream_music_description(
+        self, image_paths, do_sample=True, temperature=0.7, max_new_tokens=4096
+    ):
+        """Like `generate_music_description`, but yield text as it is decoded."""
+        tokens = []
+        text = ""
+        for step in self._decode(
+            [self._tokenize_prompt(len(image_paths))],
+            [image_paths],
+            do_sample,
+            temperature,
+            max_new_tokens,
+        ):
+            tokens.append(step[0].item())
+            decoded = self.tokenizer.decode(tokens, skip_special_tokens=True)
+            # Hold back incomplete multi-byte characters until the next token
+            if len(decoded) > len(text) and not decoded.endswith("\ufffd"):
+                yield decoded[len(text) :]
+                text = decoded
@@ -0,0 +1,235 @@
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageOps, ImageStat
+
+HASH_SIZE = 8
+# The hash is taken from the lowest frequencies of a DCT of a small thumbnail
+_DCT_SIZE = HASH_SIZE * 4
+
+
+def _dct_matrix(size):
+    k = np.arange(size)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / size)
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def perceptual_hash(image):
+    """
+    Compute the 64-bit perceptual hash (pHash) of an image.
+
+    Re-scans, recompressed copies and slightly shifted or resized versions of a
+    page hash to values a few bits apart.
+
+    Args:
+        image (PIL.Image.Image): Image to hash.
+
+    Returns:
+        int: The hash.
+    """
+    thumbnail = image.convert("L").resize(
+        (_DCT_SIZE, _DCT_SIZE), Image.Resampling.LANCZOS
+    )
+    pixels = np.asarray(thumbnail, dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # The DC term only encodes overall brightness
+    bits = low[1:] > np.median(low[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def is_blank(image, threshold=6.0, ink_fraction=0.002):
+    """
+    Check whether a page is (nearly) blank.
+
+    Args:
+        image (PIL.Image.Image): Image to check.
+        threshold (float): Maximum gray-level standard deviation of a blank page.
+        ink_fraction (float): Maximum fraction of pixels that differ clearly from
+            the paper color on a blank page.
+
+    Returns:
+        bool: Whether the page is blank.
+    """
+    gray = image.convert("L")
+    gray.thumbnail((256, 256))
+    if ImageStat.Stat(gray).stddev[0] <= threshold:
+        return True
+    histogram = gray.histogram()
+    paper = max(range(256), key=histogram.__getitem__)
+    ink = sum(count for level, count in enumerate(histogram) if abs(level - paper) > 64)
+    return ink <= ink_fraction * sum(histogram)
+
+
+class PageIndex:
+    """
+    Persistent index of page hashes, so unchanged pages are not decoded again.
+
+    Entries are keyed by the absolute page path and invalidated when the file's
+    size or modification time changes, so a re-run only hashes the pages that
+    were added or edited since the last one. The index is a JSON lines file that
+    new entries are appended to, with later lines overriding earlier ones for the
+    same page. It is only rewritten when stale lines outnumber the live entries.
+    """
+
+    def __init__(self, index_path="./cache/pages.jsonl"):
+        """
+        Args:
+            index_path (str): JSON lines file to store the index in.
+        """
+        self.index_path = Path(index_path)
+        self._lock = threading.Lock()
+        self._entries = None
+        self._lines = 0
+        self._pending = []
+
+    def _load(self):
+        """Read the index. Caller must hold `_lock`."""
+        if self._entries is not None:
+            return
+        self._entries = {}
+        self._lines = 0
+        try:
+            with open(self.index_path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by an interrupted append
+                        continue
+                    self._entries[entry.pop("path")] = entry
+                    self._lines += 1
+        except FileNotFoundError:
+            pass
+
+    def get(self, path):
+        """
+        Return the hash and blank flag of a page, computing them on a miss.
+
+        Args:
+            path (str): Path to the page image.
+
+        Returns:
+            tuple: The perceptual hash, whether the page is blank, and whether the
+                entry came from the index.
+        """
+        key = str(Path(path).resolve())
+        stat = os.stat(path)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return int(entry["hash"], 16), entry["blank"], True
+
+        with Image.open(path) as image:
+            image = ImageOps.exif_transpose(image)
+            page_hash = perceptual_hash(image)
+            blank = is_blank(image)
+        with self._lock:
+            self._entries[key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "hash": f"{page_hash:016x}",
+                "blank": blank,
+            }
+            self._pending.append(key)
+        return page_hash, blank, False
+
+    def save(self):
+        """Append the entries added since the last save to the index file."""
+        with self._lock:
+            if not self._pending:
+                return
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            if self._lines + len(self._pending) > 2 * len(self._entries):
+                self._rewrite()
+            else:
+                lines = "".join(
+                    json.dumps({"path": key, **self._entries[key]}) + "\n"
+                    for key in self._pending
+                )
+                with open(self.index_path, "a") as f:
+                    f.write(lines)
+                self._lines += len(self._pending)
+            self._pending = []
+
+    def _rewrite(self):
+        """Replace the index file with one line per entry. Caller must hold `_lock`."""
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.index_path.parent, suffix=".tmp", delete=False
+        ) as f:
+            for key, entry in self._entries.items():
+                f.write(json.dumps({"path": key, **entry}) + "\n")
+        os.replace(f.name, self.index_path)
+        self._lines = len(self._entries)
+
+
+def dedup_pages(image_paths, max_distance=4, drop_blank=True, index=None):
+    """
+    Drop duplicate, near-identical and blank pages before they reach the model.
+
+    A page is a duplicate when its perceptual hash is within `max_distance` bits
+    of a page kept before it, so the first occurrence is kept and page order is
+    preserved.
+
+    Args:
+        image_paths (list): Paths of the pages, in reading order.
+        max_distance (int): Maximum Hamming distance between duplicate hashes.
+        drop_blank (bool): Whether to drop (nearly) blank pages.
+        index (PageIndex): Hash index to use (default: the shared `page_index`).
+
+    Returns:
+        list: The paths of the pages to keep, in their original order.
+    """
+    index = index or page_index
+    kept = []
+    kept_hashes = []
+    skipped = {"duplicate": 0, "blank": 0}
+    skipped_bytes = 0
+    indexed = 0
+    for path in image_paths:
+        page_hash, blank, cached = index.get(path)
+        indexed += cached
+        if drop_blank and blank:
+            reason = "blank"
+        elif any(hamming_distance(page_hash, h) <= max_distance for h in kept_hashes):
+            reason = "duplicate"
+        else:
+            kept.append(path)
+            kept_hashes.append(page_hash)
+            continue
+        skipped[reason] += 1
+        skipped_bytes += os.path.getsize(path)
+    index.save()
+
+    if not kept:
+        # Never send an empty request, even for a folder of blank pages
+        kept = list(image_paths[:1])
+    skipped_pages = len(image_paths) - len(kept)
+    if skipped_pages:
+        print(
+            f"Skipped {skipped_pages}/{len(image_paths)} pages "
+            f"({skipped['duplicate']} duplicate, {skipped['blank']} blank, "
+            f"{skipped_bytes / 1024**2:.1f}MB); {indexed} hashes reused from the index"
+        )
+    return kept
+
+
+page_index = PageIndex(
+    index_path=os.environ.get("MANGA2MUSIC_CACHE_DIR", "./cache") + "/pages.jsonl"
+)
@@ -0,0 +1,405 @@
+import queue
+import threading
+import time
+from pathlib import Path
+from audio_writer import AudioWriter
+from description2music import generate_music_batch, save_audio
+from manga2description import generate_descriptions_from_manga, list_chapters
+from cpu_inference import cpu_inference, resolve_device
+from model_registry import registry
+from telemetry import telemetry
+
+# Marks the end of the description queue. Each music worker puts it back for the next.
+_DONE = object()
+
+
+class StageStats:
+    """Time accounting of one pipeline stage, shared by its workers."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.failed = 0
+        self.busy_s = 0.0
+        self.starved_s = 0.0
+        self.blocked_s = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items=0, failed=0, busy_s=0.0, starved_s=0.0, blocked_s=0.0):
+        with self._lock:
+            self.items += items
+            self.failed += failed
+            self.busy_s += busy_s
+            self.starved_s += starved_s
+            self.blocked_s += blocked_s
+
+    def as_dict(self, wall_s):
+        """
+        Returns:
+            dict: Item counts and the fraction of the stage's worker time spent
+                working, waiting for input (starved) and waiting for room in the
+                output queue (blocked).
+        """
+        capacity = max(wall_s * self.workers, 1e-9)
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "failed": self.failed,
+            "busy": round(self.busy_s / capacity, 3),
+            "starved": round(self.starved_s / capacity, 3),
+            "blocked": round(self.blocked_s / capacity, 3),
+        }
+
+    def report(self, wall_s):
+        stats = self.as_dict(wall_s)
+        print(
+            f"{self.name}: {stats['items']} done, {stats['failed']} failed, "
+            f"{stats['workers']} workers, busy {stats['busy']:.0%}, "
+            f"starved {stats['starved']:.0%}, blocked {stats['blocked']:.0%}"
+        )
+
+
+def _describe_worker(chapters, descriptions, stats, output_path, model, **kwargs):
+    while True:
+        try:
+            chapter = chapters.get_nowait()
+        except queue.Empty:
+            return
+
+        start = time.perf_counter()
+        try:
+            description_file = generate_descriptions_from_manga(
+                chapter, output_path, model, **kwargs
+            )
+            with open(description_file, "r") as f:
+                description = f.read()
+        except Exception as e:
+            print(f"Failed to describe {chapter}: {e}")
+            stats.add(failed=1, busy_s=time.perf_counter() - start)
+            continue
+        busy_s = time.perf_counter() - start
+
+        # Blocks while the music stage is behind
+        start = time.perf_counter()
+        descriptions.put((chapter, description))
+        stats.add(items=1, busy_s=busy_s, blocked_s=time.perf_counter() - start)
+
+
+def _music_worker(
+    descriptions,
+    writer,
+    stats,
+    output_path,
+    model_name,
+    duration,
+    audio_format,
+    device,
+    batch_size,
+):
+    done = False
+    while not done:
+        start = time.perf_counter()
+        batch = [descriptions.get()]
+        starved_s = time.perf_counter() - start
+
+        # Take whatever else is already waiting, up to the batch size
+        while len(batch) < batch_size:
+            try:
+                batch.append(descriptions.get_nowait())
+            except queue.Empty:
+                break
+        if _DONE in batch:
+            batch.remove(_DONE)
+            descriptions.put(_DONE)
+            done = True
+        if not batch:
+            stats.add(starved_s=starved_s)
+            break
+
+        start = time.perf_counter()
+        try:
+            results = generate_music_batch(
+                (model_name, duration, device),
+                [[description] for _, description in batch],
+            )
+        except Exception as e:
+            print(f"Failed to generate music for {len(batch)} chapters: {e}")
+            stats.add(
+                failed=len(batch),
+                busy_s=time.perf_counter() - start,
+                starved_s=starved_s,
+            )
+            continue
+        busy_s = time.perf_counter() - start
+
+        # Blocks while the writer is behind
+        start = time.perf_counter()
+        for (chapter, _), (sr, musics) in zip(batch, results):
+            output_file = Path(output_path) / f"{Path(chapter).name}.{audio_format}"
+            writer.submit(musics[0], sr, output_file, audio_format)
+        stats.add(
+            items=len(batch),
+            busy_s=busy_s,
+            starved_s=starved_s,
+            blocked_s=time.perf_counter() - start,
+        )
+
+
+def run_pipeline(
+    library_path,
+    output_path,
+    description_model,
+    music_model,
+    duration,
+    audio_format,
+    device="cuda",
+    description_workers=2,
+    music_workers=1,
+    queue_size=4,
+    batch_size=4,
+    writer_workers=2,
+    gpt_mode="two-step",
+    use_cache=True,
+):
+    """
+    Turn every chapter of a manga library into music with Stage 1 and Stage 2 overlapped.
+
+    Description workers describe chapters and put them on a bounded queue, while
+    music workers take the descriptions that are ready in batches and hand the
+    generated audio to a background writer. The queue bound keeps a fast stage
+    from running ahead of a slow one. Per-stage utilization is printed at the end:
+    a stage that is mostly busy while the other is starved or blocked is the
+    bottleneck.
+
+    Args:
+        library_path (str): Path to the folder containing one sub-folder of images per chapter.
+        output_path (str): Path to the output folder (descriptions and music go to sub-folders).
+        description_model (str): Model to use for descriptions ('gpt-4o', 'gpt-4o-mini', 'llava-7b', 'llava-0.5b').
+        music_model (str): Size of the MusicGen model ('musicgen-small', 'musicgen-medium', 'musicgen-large').
+        duration (int): Length of the generated music in seconds.
+        audio_format (str): Audio format to save the music ('wav', 'mp3', 'ogg', 'flac').
+        device (str): Device to run the local models on ('cuda' or 'cpu').
+        description_workers (int): Number of chapters described concurrently.
+        music_workers (int): Number of music generation workers.
+        queue_size (int): Maximum number of descriptions waiting for the music stage.
+        batch_size (int): Maximum number of descriptions per `model.generate` call.
+        writer_workers (int): Number of background workers encoding and writing audio (0 to write serially).
+        gpt_mode (str): GPT pipeline ('two-step', or 'structured' for a single request).
+        use_cache (bool): Whether to look up and store results in the description cache.
+
+    Returns:
+        dict: Paths to the generated music files and the per-stage stats.
+    """
+    chapters = list_chapters(library_path)
+    print(f"Found {len(chapters)} chapters in {library_path}")
+
+    chapter_queue = queue.Queue()
+    for chapter in chapters:
+        chapter_queue.put(chapter)
+    description_queue = queue.Queue(maxsize=queue_size)
+
+    description_stats = StageStats("Descriptions", description_workers)
+    music_stats = StageStats("Music", music_workers)
+    music_dir = Path(output_path) / "music"
+    music_dir.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    with AudioWriter(save_audio, workers=writer_workers) as writer:
+        describers = [
+            threading.Thread(
+                target=_describe_worker,
+                args=(
+                    chapter_queue,
+                    description_queue,
+                    description_stats,
+                    Path(output_path) / "descriptions",
+                    description_model,
+                ),
+                kwargs={"device": device, "gpt_mode": gpt_mode, "use_cache": use_cache},
+            )
+            for _ in range(description_workers)
+        ]
+        generators = [
+            threading.Thread(
+                target=_music_worker,
+                args=(
+                    description_queue,
+                    writer,
+                    music_stats,
+                    music_dir,
+                    music_model,
+                    duration,
+                    audio_format,
+                    device,
+                    batch_size,
+                ),
+            )
+            for _ in range(music_workers)
+        ]
+        for thread in describers + generators:
+            thread.start()
+        for thread in describers:
+            thread.join()
+        description_queue.put(_DONE)
+        for thread in generators:
+            thread.join()
+        generated_files = writer.wait()
+    wall_s = time.perf_counter() - start
+
+    print(f"Pipeline finished {len(generated_files)} chapters in {wall_s:.1f}s")
+    description_stats.report(wall_s)
+    music_stats.report(wall_s)
+    return {
+        "generated_files": generated_files,
+        "wall_clock_s": wall_s,
+        "stages": [description_stats.as_dict(wall_s), music_stats.as_dict(wall_s)],
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert a manga library to music with overlapped stages"
+    )
+    parser.add_argument(
+        "--library-path",
+        type=str,
+        required=True,
+        help="Path to folder containing one folder of manga images per chapter",
+    )
+    parser.add_argument(
+        "--output-path", type=str, default="./output", help="Path to output folder"
+    )
+    parser.add_argument(
+        "--description-model",
+        type=str,
+        choices=["gpt-4o", "gpt-4o-mini", "llava-7b", "llava-0.5b"],
+        default="gpt-4o-mini",
+    )
+    parser.add_argument(
+        "--music-model",
+        type=str,
+        choices=["musicgen-small", "musicgen-medium", "musicgen-large"],
+        default="musicgen-medium",
+    )
+    parser.add_argument(
+        "--duration",
+        type=int,
+        default=10,
+        help="Length of the generated music in seconds",
+    )
+    parser.add_argument(
+        "--audio-format",
+        type=str,
+        choices=["wav", "mp3", "ogg", "flac"],
+        default="wav",
+        help="Audio format to save the music",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="auto",
+        help="Device to run the models on ('cuda', 'cpu', or 'auto' to use CUDA when available)",
+    )
+    parser.add_argument(
+        "--cpu-optimization",
+        type=str,
+        choices=["none", "int8", "bf16", "auto"],
+        default=None,
+        help="Weight optimization on CPU (default: auto, bf16 where supported, otherwise int8)",
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Compile the decoder step with torch.compile on CPU",
+    )
+    parser.add_argument(
+        "--telemetry",
+        type=str,
+        default=None,
+        help="Append timing, token and memory spans of each stage to this JSON lines file",
+    )
+    parser.add_argument(
+        "--gpt-mode",
+        type=str,
+        choices=["two-step", "structured"],
+        default="two-step",
+        help="GPT pipeline: two requests, or one request with structured output",
+    )
+    parser.add_argument(
+        "--description-workers",
+        type=int,
+        default=2,
+        help="Number of chapters described concurrently",
+    )
+    parser.add_argument(
+        "--music-workers",
+        type=int,
+        default=1,
+        help="Number of music generation workers",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=4,
+        help="Maximum number of descriptions waiting for music generation",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=4,
+        help="Maximum number of descriptions per music generation batch",
+    )
+    parser.add_argument(
+        "--writer-workers",
+        type=int,
+        default=2,
+        help="Number of background workers encoding and writing audio (0 to write serially)",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Disable the description cache"
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        help="Memory budget in GB for resident models (default: unlimited)",
+    )
+    args = parser.parse_args()
+
+    args.device = resolve_device(args.device)
+    cpu_inference.configure(optimization=args.cpu_optimization, compile=args.compile)
+    if args.telemetry is not None:
+        telemetry.configure(path=args.telemetry)
+    if args.memory_budget is not None:
+        registry.configure(memory_budget_gb=args.memory_budget)
+
+    try:
+        run_pipeline(
+            args.library_path,
+            args.output_path,
+            args.description_model,
+            args.music_model,
+            args.duration,
+            args.audio_format,
+            device=args.device,
+            description_workers=args.description_workers,
+            music_workers=args.music_workers,
+            queue_size=args.queue_size,
+            batch_size=args.batch_size,
+            writer_workers=args.writer_workers,
+            gpt_mode=args.gpt_mode,
+            use_cache=not args.no_cache,
+        )
+    except ValueError as e:
+        print(f"Error: {e}")
+    finally:
+        registry.report()
+        telemetry.report()
+
+
+if __name__ == "__main__":
+    main()
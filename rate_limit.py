@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket refilled continuously at a per-minute rate.
+
+    The bucket holds at most one minute's worth of tokens, so bursts are bounded
+    by the configured limit.
+    """
+
+    def __init__(self, rate_per_minute):
+        """
+        Args:
+            rate_per_minute (float): Number of tokens added to the bucket per minute.
+        """
+        self.rate_per_minute = rate_per_minute
+        self.capacity = rate_per_minute
+        self._level = rate_per_minute
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._level = min(
+            self.capacity, self._level + elapsed * self.rate_per_minute / 60
+        )
+
+    async def acquire(self, amount=1):
+        """Wait until `amount` tokens are available and take them."""
+        amount = min(amount, self.capacity)
+        # The lock keeps waiters first-come, first-served.
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return
+                missing = amount - self._level
+                await asyncio.sleep(missing * 60 / self.rate_per_minute)
+
+    def adjust(self, delta):
+        """Take `delta` extra tokens from the bucket, or refund them if negative."""
+        self._refill()
+        self._level = min(self.capacity, self._level - delta)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for an API client."""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        """
+        Args:
+            requests_per_minute (float): Maximum requests per minute (`None` for no limit).
+            tokens_per_minute (float): Maximum tokens per minute (`None` for no limit).
+        """
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, estimated_tokens):
+        """Wait for one request slot and `estimated_tokens` tokens."""
+        if self.requests is not None:
+            await self.requests.acquire(1)
+        if self.tokens is not None:
+            await self.tokens.acquire(estimated_tokens)
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Correct the token bucket once the real usage of a request is known."""
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
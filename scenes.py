@@ -0,0 +1,394 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from audio_writer import AudioWriter
+from description2music import generate_music_batch, save_audio
+from manga2description import GPT_MODELS, describe_image_lists_llava, describe_images
+from cpu_inference import cpu_inference, resolve_device
+from model_registry import registry
+from page_dedup import dedup_pages
+from telemetry import telemetry
+
+CLIP_MODEL = ("ViT-B-32", "laion2b_s34b_b79k")
+
+
+class _ClipEncoder:
+    """open_clip image encoder used to embed pages."""
+
+    def __init__(self, model_name, pretrained, device):
+        import open_clip
+
+        self.model, _, self.preprocess = open_clip.create_model_and_transforms(
+            model_name, pretrained=pretrained, device=device
+        )
+        self.model.eval()
+        self.device = device
+
+    def embed(self, image_paths, batch_size=16):
+        import torch
+        from PIL import Image
+
+        embeddings = []
+        for start in range(0, len(image_paths), batch_size):
+            images = []
+            for path in image_paths[start : start + batch_size]:
+                with Image.open(path) as image:
+                    images.append(self.preprocess(image.convert("RGB")))
+            with torch.no_grad():
+                features = self.model.encode_image(torch.stack(images).to(self.device))
+            features = torch.nn.functional.normalize(features.float(), dim=-1)
+            embeddings.append(features.cpu().numpy())
+        return np.concatenate(embeddings)
+
+
+def embed_pages(image_paths, device="cuda"):
+    """
+    Embed manga pages with the resident CLIP image encoder.
+
+    Args:
+        image_paths (list): Paths of the pages.
+        device (str): Device to run the encoder on ('cuda' or 'cpu').
+
+    Returns:
+        np.ndarray: Normalized [N, D] page embeddings.
+    """
+    name, pretrained = CLIP_MODEL
+    with registry.use(
+        f"open-clip-{name}",
+        device,
+        "float32",
+        lambda: _ClipEncoder(name, pretrained, device),
+    ) as encoder:
+        return encoder.embed(image_paths)
+
+
+def segment_scenes(embeddings, threshold=0.75, min_pages=2, max_pages=8):
+    """
+    Split a chapter into scenes at the pages where the content changes.
+
+    A new scene starts when a page is less than `threshold` similar to the mean of
+    the current scene. Scenes are capped at `max_pages` so each description has a
+    bounded context, and scenes shorter than `min_pages` are merged into the
+    previous one.
+
+    Args:
+        embeddings (np.ndarray): Normalized [N, D] page embeddings in reading order.
+        threshold (float): Minimum cosine similarity of a page to its scene.
+        min_pages (int): Minimum number of pages in a scene.
+        max_pages (int): Maximum number of pages in a scene.
+
+    Returns:
+        list of tuple: The (start, end) page index range of each scene, end excluded.
+    """
+    scenes = []
+    start = 0
+    for i in range(1, len(embeddings)):
+        centroid = embeddings[start:i].mean(axis=0)
+        similarity = float(embeddings[i] @ centroid) / max(
+            float(np.linalg.norm(centroid)), 1e-8
+        )
+        if similarity < threshold or i - start >= max_pages:
+            scenes.append((start, i))
+            start = i
+    scenes.append((start, len(embeddings)))
+
+    merged = []
+    for start, end in scenes:
+        if merged and end - start < min_pages:
+            previous_start, _ = merged[-1]
+            if end - previous_start <= max_pages:
+                merged[-1] = (previous_start, end)
+                continue
+        merged.append((start, end))
+    return merged
+
+
+def generate_scene_cues(
+    manga_path,
+    output_path,
+    description_model,
+    music_model,
+    duration,
+    audio_format,
+    device="cuda",
+    threshold=0.75,
+    min_pages=2,
+    max_pages=8,
+    max_in_flight=4,
+    batch_size=4,
+    writer_workers=2,
+    gpt_mode="two-step",
+    use_cache=True,
+    dedup=True,
+    llava_batch_size=4,
+):
+    """
+    Split a chapter into scenes and render a soundtrack cue for each one.
+
+    Pages are embedded with CLIP and segmented with `segment_scenes`. Each scene
+    is described on its own, so context length and memory stay bounded however
+    long the chapter is. GPT scenes are described concurrently; LLaVA scenes are
+    decoded in batches on the resident model. Cues are generated in batches and a
+    `manifest.json` mapping page ranges to audio files is written to `output_path`.
+
+    Args:
+        manga_path (str): Path to the folder containing manga images.
+        output_path (str): Path to the output folder.
+        description_model (str): Model to use for descriptions ('gpt-4o', 'gpt-4o-mini', 'llava-7b', 'llava-0.5b').
+        music_model (str): Size of the MusicGen model ('musicgen-small', 'musicgen-medium', 'musicgen-large').
+        duration (int): Length of each cue in seconds.
+        audio_format (str): Audio format to save the cues ('wav', 'mp3', 'ogg', 'flac').
+        device (str): Device to run the local models on ('cuda' or 'cpu').
+        threshold (float): Minimum cosine similarity of a page to its scene.
+        min_pages (int): Minimum number of pages in a scene.
+        max_pages (int): Maximum number of pages in a scene.
+        max_in_flight (int): Maximum number of scenes described concurrently with GPT.
+        batch_size (int): Maximum number of cues per `model.generate` call.
+        writer_workers (int): Number of background workers encoding and writing audio (0 to write serially).
+        gpt_mode (str): GPT pipeline ('two-step', or 'structured' for a single request).
+        use_cache (bool): Whether to look up and store results in the description cache.
+        dedup (bool): Whether to skip duplicate and blank pages.
+        llava_batch_size (int): Maximum number of scenes decoded together by LLaVA.
+
+    Returns:
+        str: The path to the manifest.
+    """
+    image_paths = sorted(Path(manga_path).glob("*.jpg"))
+    if not image_paths:
+        raise ValueError(f"No images found in {manga_path}!")
+    if dedup:
+        image_paths = dedup_pages(image_paths)
+
+    start = time.perf_counter()
+    scenes = segment_scenes(
+        embed_pages(image_paths, device), threshold, min_pages, max_pages
+    )
+    print(
+        f"Split {len(image_paths)} pages into {len(scenes)} scenes "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+    chapter = Path(manga_path).name
+    scene_pages = [image_paths[start:end] for start, end in scenes]
+
+    names = [f"{chapter} scene {index + 1}" for index in range(len(scenes))]
+    if description_model in GPT_MODELS:
+
+        def describe(index):
+            return describe_images(
+                scene_pages[index],
+                description_model,
+                names[index],
+                use_cache=use_cache,
+                gpt_mode=gpt_mode,
+            )
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            descriptions = list(executor.map(describe, range(len(scenes))))
+    else:
+        descriptions = describe_image_lists_llava(
+            scene_pages,
+            description_model,
+            names,
+            device=device,
+            use_cache=use_cache,
+            batch_size=llava_batch_size,
+        )
+
+    output_folder = Path(output_path) / chapter
+    output_folder.mkdir(parents=True, exist_ok=True)
+    with AudioWriter(save_audio, workers=writer_workers) as writer:
+        for start in range(0, len(scenes), batch_size):
+            batch = descriptions[start : start + batch_size]
+            results = generate_music_batch(
+                (music_model, duration, device), [[text] for text in batch]
+            )
+            for index, (sr, musics) in enumerate(results, start):
+                output_file = output_folder / f"scene_{index + 1:03d}.{audio_format}"
+                writer.submit(musics[0], sr, output_file, audio_format)
+        audio_files = writer.wait()
+
+    manifest = {
+        "chapter": chapter,
+        "description_model": description_model,
+        "music_model": music_model,
+        "duration": duration,
+        "scenes": [
+            {
+                "scene": index + 1,
+                "first_page": scene_pages[index][0].name,
+                "last_page": scene_pages[index][-1].name,
+                "pages": [path.name for path in scene_pages[index]],
+                "description": descriptions[index],
+                "audio": str(audio_files[index]),
+            }
+            for index in range(len(scenes))
+        ],
+    }
+    manifest_path = output_folder / "manifest.json"
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+    print(f"Manifest saved to {manifest_path}")
+    return str(manifest_path)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert a manga chapter to one soundtrack cue per scene"
+    )
+    parser.add_argument(
+        "--manga-path",
+        type=str,
+        default="./samples",
+        help="Path to folder containing manga images",
+    )
+    parser.add_argument(
+        "--output-path", type=str, default="./output", help="Path to output folder"
+    )
+    parser.add_argument(
+        "--description-model",
+        type=str,
+        choices=["gpt-4o", "gpt-4o-mini", "llava-7b", "llava-0.5b"],
+        default="gpt-4o-mini",
+    )
+    parser.add_argument(
+        "--music-model",
+        type=str,
+        choices=["musicgen-small", "musicgen-medium", "musicgen-large"],
+        default="musicgen-medium",
+    )
+    parser.add_argument(
+        "--duration", type=int, default=10, help="Length of each cue in seconds"
+    )
+    parser.add_argument(
+        "--audio-format",
+        type=str,
+        choices=["wav", "mp3", "ogg", "flac"],
+        default="wav",
+        help="Audio format to save the cues",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="auto",
+        help="Device to run the models on ('cuda', 'cpu', or 'auto' to use CUDA when available)",
+    )
+    parser.add_argument(
+        "--cpu-optimization",
+        type=str,
+        choices=["none", "int8", "bf16", "auto"],
+        default=None,
+        help="Weight optimization on CPU (default: auto, bf16 where supported, otherwise int8)",
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Compile the decoder step with torch.compile on CPU",
+    )
+    parser.add_argument(
+        "--telemetry",
+        type=str,
+        default=None,
+        help="Append timing, token and memory spans of each stage to this JSON lines file",
+    )
+    parser.add_argument(
+        "--scene-threshold",
+        type=float,
+        default=0.75,
+        help="Minimum similarity of a page to its scene before a new scene starts",
+    )
+    parser.add_argument(
+        "--min-pages", type=int, default=2, help="Minimum number of pages per scene"
+    )
+    parser.add_argument(
+        "--max-pages", type=int, default=8, help="Maximum number of pages per scene"
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=4,
+        help="Maximum number of scenes described concurrently with GPT",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=4,
+        help="Maximum number of cues per music generation batch",
+    )
+    parser.add_argument(
+        "--llava-batch-size",
+        type=int,
+        default=4,
+        help="Maximum number of scenes decoded together by LLaVA",
+    )
+    parser.add_argument(
+        "--writer-workers",
+        type=int,
+        default=2,
+        help="Number of background workers encoding and writing audio (0 to write serially)",
+    )
+    parser.add_argument(
+        "--gpt-mode",
+        type=str,
+        choices=["two-step", "structured"],
+        default="two-step",
+        help="GPT pipeline: two requests, or one request with structured output",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Disable the description cache"
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Keep duplicate and blank pages",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        help="Memory budget in GB for resident models (default: unlimited)",
+    )
+    args = parser.parse_args()
+
+    args.device = resolve_device(args.device)
+    cpu_inference.configure(optimization=args.cpu_optimization, compile=args.compile)
+    if args.telemetry is not None:
+        telemetry.configure(path=args.telemetry)
+    if args.memory_budget is not None:
+        registry.configure(memory_budget_gb=args.memory_budget)
+
+    try:
+        generate_scene_cues(
+            args.manga_path,
+            args.output_path,
+            args.description_model,
+            args.music_model,
+            args.duration,
+            args.audio_format,
+            device=args.device,
+            threshold=args.scene_threshold,
+            min_pages=args.min_pages,
+            max_pages=args.max_pages,
+            max_in_flight=args.max_in_flight,
+            batch_size=args.batch_size,
+            writer_workers=args.writer_workers,
+            gpt_mode=args.gpt_mode,
+            use_cache=not args.no_cache,
+            dedup=not args.no_dedup,
+            llava_batch_size=args.llava_batch_size,
+        )
+    except ValueError as e:
+        print(f"Error: {e}")
+    finally:
+        registry.report()
+        telemetry.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class _Job:
+    def __init__(self, key, payload, size):
+        self.key = key
+        self.payload = payload
+        self.size = size
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class BatchScheduler:
+    """
+    Job queue that coalesces concurrent requests into batches.
+
+    Jobs submitted with the same key (e.g. model name and duration) are collected
+    for up to `max_wait` seconds, or until `max_batch_size` is reached, and run by
+    a single worker thread with one `run_batch` call. Each caller gets a future
+    resolving to the result for its own job.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait=0.1, name="scheduler"):
+        """
+        Args:
+            run_batch (callable): Function called as `run_batch(key, payloads)` that
+                returns one result per payload, in order. A result that is an
+                exception is raised to the caller of that job only.
+            max_batch_size (int): Maximum total size of the jobs in one batch. A
+                single job larger than this still runs, on its own.
+            max_wait (float): Maximum seconds the oldest job waits for others to join.
+            name (str): Name used in reports.
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self._queue = []
+        self._condition = threading.Condition()
+        self._worker = None
+        self._closed = False
+        self._stats = {
+            "jobs": 0,
+            "batches": 0,
+            "batched_size": 0,
+            "max_queue_depth": 0,
+            "wait_s": 0.0,
+        }
+
+    def submit(self, key, payload, size=1):
+        """
+        Queue a job.
+
+        Args:
+            key (hashable): Jobs with equal keys may be batched together.
+            payload: Job input passed to `run_batch`.
+            size (int): Number of batch slots the job takes (e.g. its bulk count).
+
+        Returns:
+            concurrent.futures.Future: Resolves to the result of the job.
+        """
+        job = _Job(key, payload, size)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._worker.start()
+            self._queue.append(job)
+            self._stats["max_queue_depth"] = max(
+                self._stats["max_queue_depth"], len(self._queue)
+            )
+            self._condition.notify()
+        return job.future
+
+    def _queued_size(self, key):
+        return sum(job.size for job in self._queue if job.key == key)
+
+    def _next_batch(self):
+        """Wait for a batch to be ready and take it off the queue."""
+        with self._condition:
+            while not self._queue:
+                if self._closed:
+                    return None
+                self._condition.wait()
+
+            # Batch around the oldest job so no key starves
+            oldest = self._queue[0]
+            deadline = oldest.enqueued + self.max_wait
+            while self._queued_size(oldest.key) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    break
+                self._condition.wait(remaining)
+
+            batch = []
+            batch_size = 0
+            for job in list(self._queue):
+                if job.key != oldest.key:
+                    continue
+                if batch and batch_size + job.size > self.max_batch_size:
+                    break
+                batch.append(job)
+                batch_size += job.size
+                self._queue.remove(job)
+
+            now = time.monotonic()
+            self._stats["jobs"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["batched_size"] += batch_size
+            self._stats["wait_s"] += sum(now - job.enqueued for job in batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            jobs = [job for job in batch if job.future.set_running_or_notify_cancel()]
+            if not jobs:
+                continue
+            try:
+                results = self.run_batch(jobs[0].key, [job.payload for job in jobs])
+            except BaseException as e:
+                for job in jobs:
+                    job.future.set_exception(e)
+                continue
+            for job, result in zip(jobs, results):
+                if isinstance(result, BaseException):
+                    job.future.set_exception(result)
+                else:
+                    job.future.set_result(result)
+
+    def close(self):
+        """Stop the worker once the queued jobs are done."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Queue depth, job/batch counters, mean batch size, batch fill
+                (mean batch size over `max_batch_size`) and mean queueing delay.
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._queue)
+        batches = max(1, stats["batches"])
+        stats["mean_batch_size"] = round(stats["batched_size"] / batches, 2)
+        stats["batch_fill"] = round(
+            stats["batched_size"] / (batches * self.max_batch_size), 3
+        )
+        stats["mean_wait_s"] = round(stats.pop("wait_s") / max(1, stats["jobs"]), 3)
+        return stats
+
+    def report(self):
+        stats = self.stats()
+        print(
+            f"{self.name}: queue_depth={stats['queue_depth']} "
+            f"max_queue_depth={stats['max_queue_depth']} jobs={stats['jobs']} "
+            f"batches={stats['batches']} mean_batch_size={stats['mean_batch_size']} "
+            f"batch_fill={stats['batch_fill']:.0%} mean_wait={stats['mean_wait_s']}s"
+        )
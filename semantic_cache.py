@@ -0,0 +1,239 @@
+import json
+import os
+import shutil
+import statistics
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from model_registry import registry
+
+
+class _TextEncoder:
+    """Mean-pooled T5 encoder used to embed descriptions."""
+
+    def __init__(self, name):
+        from transformers import AutoTokenizer, T5EncoderModel
+
+        self.tokenizer = AutoTokenizer.from_pretrained(name)
+        self.model = T5EncoderModel.from_pretrained(name).eval()
+
+    def embed(self, text):
+        import torch
+
+        inputs = self.tokenizer(
+            [text], return_tensors="pt", truncation=True, max_length=512
+        )
+        with torch.no_grad():
+            hidden = self.model(**inputs).last_hidden_state[0]
+        mask = inputs["attention_mask"][0].unsqueeze(-1).to(hidden.dtype)
+        embedding = (hidden * mask).sum(0) / mask.sum().clamp(min=1)
+        embedding = torch.nn.functional.normalize(embedding, dim=0)
+        return embedding.numpy().astype(np.float32)
+
+
+class SemanticCache:
+    """
+    Persistent nearest-neighbour cache of generated music, keyed by description meaning.
+
+    Descriptions are embedded with a local T5 encoder and stored in a flat float32
+    index that is memory-mapped for search, next to a `meta.jsonl` file holding the
+    description, generation settings and stored audio of each row. Both files are
+    only ever appended to, so adding an entry does not rewrite the index. A lookup
+    is a hit when the most similar description with the same model and duration,
+    and at least as many samples, clears the cosine similarity `threshold`.
+    """
+
+    def __init__(
+        self, cache_dir="./cache/semantic", encoder_name="t5-base", threshold=0.97
+    ):
+        """
+        Args:
+            cache_dir (str): Folder to store the index and audio in.
+            encoder_name (str): Hugging Face name of the T5 encoder.
+            threshold (float): Minimum cosine similarity of a hit.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.encoder_name = encoder_name
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._index = None
+        self._meta = None
+        # Latencies of the recent lookups only, so a long-running server stays bounded
+        self._latencies = deque(maxlen=1000)
+        self._stats = {"lookups": 0, "hits": 0, "false_hits": 0}
+
+    @property
+    def _index_dir(self):
+        return self.cache_dir / self.encoder_name.replace("/", "--")
+
+    def embed(self, text):
+        """Return the normalized embedding of a description."""
+        encoder = registry.get(
+            self.encoder_name,
+            "cpu",
+            "float32",
+            lambda: _TextEncoder(self.encoder_name),
+        )
+        return encoder.embed(text)
+
+    def _load(self):
+        """Memory-map the index and read the metadata. Caller must hold `_lock`."""
+        if self._meta is not None:
+            return
+        meta_path = self._index_dir / "meta.jsonl"
+        self._meta = []
+        if meta_path.exists():
+            with open(meta_path, "r") as f:
+                self._meta = [json.loads(line) for line in f if line.strip()]
+        self._map_index()
+
+    def _map_index(self):
+        index_path = self._index_dir / "index.f32"
+        if not self._meta:
+            self._index = None
+            return
+        dim = self._meta[0]["dim"]
+        # Rows past the metadata are from an interrupted add and are ignored
+        self._index = np.memmap(
+            index_path, dtype=np.float32, mode="r", shape=(len(self._meta), dim)
+        )
+
+    def lookup(self, description, model_name, duration, bulk_count=1):
+        """
+        Find stored music for a description with the same meaning.
+
+        Args:
+            description (str): Text description to look up.
+            model_name (str): MusicGen model name the music must come from.
+            duration (float): Length the music must have.
+            bulk_count (int): Number of samples needed.
+
+        Returns:
+            tuple: The matching entry (a dict with `id`, `description`,
+                `similarity` and `files`) or `None`, and the description embedding,
+                which can be passed to `add` after a miss.
+        """
+        start = time.perf_counter()
+        embedding = self.embed(description)
+        match = None
+        with self._lock:
+            self._load()
+            if self._index is not None:
+                similarities = np.asarray(self._index @ embedding)
+                for row in np.argsort(-similarities):
+                    if similarities[row] < self.threshold:
+                        break
+                    entry = self._meta[row]
+                    if (
+                        entry["model_name"] == model_name
+                        and entry["duration"] == duration
+                        and len(entry["files"]) >= bulk_count
+                    ):
+                        match = {**entry, "similarity": float(similarities[row])}
+                        break
+
+            self._stats["lookups"] += 1
+            self._stats["hits"] += match is not None
+            self._latencies.append(time.perf_counter() - start)
+
+        if match is not None:
+            print(
+                f"Semantic cache hit {match['id']} "
+                f"(similarity {match['similarity']:.3f}): {match['description'][:80]}"
+            )
+        return match, embedding
+
+    def add(self, embedding, description, model_name, duration, files):
+        """
+        Append generated music to the cache.
+
+        Args:
+            embedding (np.ndarray): Description embedding returned by `lookup`.
+            description (str): Text description the music was generated from.
+            model_name (str): MusicGen model name.
+            duration (float): Length of the music in seconds.
+            files (list): Paths of the generated music files, copied into the cache.
+
+        Returns:
+            int: Id of the new entry.
+        """
+        with self._lock:
+            self._load()
+            entry_id = len(self._meta)
+            audio_dir = self._index_dir / "audio" / str(entry_id)
+            audio_dir.mkdir(parents=True, exist_ok=True)
+            stored = []
+            for i, path in enumerate(files):
+                stored_path = audio_dir / f"{i}{Path(path).suffix}"
+                shutil.copyfile(path, stored_path)
+                stored.append(str(stored_path))
+
+            entry = {
+                "id": entry_id,
+                "description": description,
+                "model_name": model_name,
+                "duration": duration,
+                "files": stored,
+                "dim": int(embedding.shape[0]),
+                "created": time.time(),
+            }
+            # The index row goes first, so metadata never points past the index
+            with open(self._index_dir / "index.f32", "ab") as f:
+                f.write(np.ascontiguousarray(embedding, dtype=np.float32).tobytes())
+            with open(self._index_dir / "meta.jsonl", "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._meta.append(entry)
+            self._map_index()
+        return entry_id
+
+    def flag_false_hit(self, entry_id, description=None):
+        """
+        Record that a hit served music that did not fit the description.
+
+        Args:
+            entry_id (int): Id of the entry that was served.
+            description (str): The description that was looked up.
+        """
+        with self._lock:
+            self._stats["false_hits"] += 1
+            self._index_dir.mkdir(parents=True, exist_ok=True)
+            with open(self._index_dir / "false_hits.jsonl", "a") as f:
+                record = {"id": entry_id, "description": description}
+                f.write(json.dumps(record) + "\n")
+
+    def stats(self):
+        """
+        Returns:
+            dict: Lookup/hit/false-hit counters, hit rate, index size and lookup
+                latency (mean and p50 in milliseconds over the last 1000 lookups).
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._meta) if self._meta is not None else None
+            latencies = list(self._latencies)
+        stats["hit_rate"] = (
+            round(stats["hits"] / stats["lookups"], 3) if stats["lookups"] else 0.0
+        )
+        if latencies:
+            stats["latency_mean_ms"] = round(1000 * statistics.mean(latencies), 2)
+            stats["latency_p50_ms"] = round(1000 * statistics.median(latencies), 2)
+        return stats
+
+    def report(self):
+        stats = self.stats()
+        if not stats["lookups"]:
+            return
+        print(
+            f"Semantic cache: lookups={stats['lookups']} hits={stats['hits']} "
+            f"false_hits={stats['false_hits']} hit_rate={stats['hit_rate']:.0%} "
+            f"entries={stats['entries']} latency={stats['latency_mean_ms']}ms"
+        )
+
+
+semantic_cache = SemanticCache(
+    cache_dir=os.environ.get("MANGA2MUSIC_CACHE_DIR", "./cache") + "/semantic"
+)
@@ -0,0 +1,302 @@
+import functools
+import itertools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+# Innermost open span of the current thread or asyncio task.
+_current = ContextVar("manga2music_span", default=None)
+
+
+class _NoopSpan:
+    """Span returned while telemetry is disabled."""
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, telemetry, name, attributes):
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+        self.id = next(telemetry._ids)
+        self.parent = None
+        self.start = None
+
+    def set(self, **attributes):
+        """Attach attributes to the span, e.g. token counts known at the end."""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.parent = _current.get()
+        _current.set(self)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration_s = time.perf_counter() - self.start
+        # Restore the parent rather than resetting a token, since generators may
+        # resume a span in another thread
+        _current.set(self.parent)
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc_value}"
+        self.telemetry._finish(
+            self.name,
+            self.id,
+            self.parent.id if self.parent is not None else None,
+            self.wall_start,
+            duration_s,
+            self.attributes,
+        )
+        return False
+
+
+def peak_rss_bytes():
+    """Return the peak resident set size of the process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def cuda_peak_bytes():
+    """Return the peak CUDA memory allocated by torch, or `None` without CUDA."""
+    # Never import torch just to sample memory
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return None
+    if not torch.cuda.is_initialized():
+        return None
+    return torch.cuda.max_memory_allocated()
+
+
+class Telemetry:
+    """
+    Stage-level spans and metrics for the whole pipeline.
+
+    A span times one stage (image load and encode, API call, model load,
+    generation, audio write) and carries attributes such as token counts or the
+    real-time factor. A span opened inside another, including in an asyncio task
+    it started, records it as its parent.
+    Every finished span samples the peak RSS and peak CUDA memory of the process.
+
+    Finished spans are appended to a JSON lines file, when one is set, and
+    aggregated into Prometheus-style metrics served by `serve`. While disabled,
+    `span` returns a shared no-op object and nothing is timed or sampled.
+    """
+
+    def __init__(self, path=None, enabled=False):
+        """
+        Args:
+            path (str): JSON lines file to append finished spans to (`None` to only
+                aggregate metrics).
+            enabled (bool): Whether to record spans. Setting `path` enables it.
+        """
+        self.path = path
+        self.enabled = enabled or path is not None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._spans = defaultdict(lambda: [0, 0.0])
+        self._counters = defaultdict(float)
+        self._memory = {"peak_rss_bytes": 0, "cuda_peak_bytes": None}
+        self._server = None
+
+    def configure(self, path=None, enabled=True):
+        """Enable or disable recording, and set the JSON lines file."""
+        if path is not None:
+            self.path = path
+        self.enabled = enabled
+
+    def span(self, name, **attributes):
+        """
+        Context manager timing one stage.
+
+        Args:
+            name (str): Stage name, e.g. 'music.generate'.
+            **attributes: Attributes recorded with the span.
+
+        Returns:
+            A span whose `set` method adds attributes before it closes.
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, attributes)
+
+    def traced(self, name):
+        """Decorator that runs the function in a span called `name`."""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Span(self, name, {}):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def annotate(self, **attributes):
+        """Attach attributes to the innermost open span."""
+        if not self.enabled:
+            return
+        span = _current.get()
+        if span is not None:
+            span.set(**attributes)
+
+    def record(self, name, duration_s, **attributes):
+        """
+        Record a span that has already finished.
+
+        For stages timed by their own code, such as generators, which cannot hold
+        a span open across their callers.
+        """
+        if not self.enabled:
+            return
+        parent = _current.get()
+        self._finish(
+            name,
+            next(self._ids),
+            parent.id if parent is not None else None,
+            time.time() - duration_s,
+            duration_s,
+            attributes,
+        )
+
+    def count(self, metric, value=1, **labels):
+        """
+        Add `value` to a counter, e.g. `count("tokens", 120, model="gpt-4o", kind="prompt")`.
+        """
+        if not self.enabled:
+            return
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def _sample_memory(self):
+        peak_rss = peak_rss_bytes()
+        cuda_peak = cuda_peak_bytes()
+        with self._lock:
+            self._memory["peak_rss_bytes"] = peak_rss
+            self._memory["cuda_peak_bytes"] = cuda_peak
+        return peak_rss, cuda_peak
+
+    def _finish(self, name, span_id, parent_id, start, duration_s, attributes):
+        peak_rss, cuda_peak = self._sample_memory()
+        with self._lock:
+            stats = self._spans[name]
+            stats[0] += 1
+            stats[1] += duration_s
+        if self.path is None:
+            return
+        event = {
+            "name": name,
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "start": start,
+            "duration_s": duration_s,
+            "thread": threading.current_thread().name,
+            "attributes": attributes,
+            "peak_rss_bytes": peak_rss,
+            "cuda_peak_bytes": cuda_peak,
+        }
+        line = json.dumps(event, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+    def prometheus(self):
+        """
+        Returns:
+            str: The metrics in the Prometheus text exposition format.
+        """
+        self._sample_memory()
+        with self._lock:
+            spans = {name: list(stats) for name, stats in self._spans.items()}
+            counters = dict(self._counters)
+            memory = dict(self._memory)
+
+        lines = [
+            "# HELP manga2music_span_seconds Time spent in each pipeline stage.",
+            "# TYPE manga2music_span_seconds summary",
+        ]
+        for name, (count, total) in sorted(spans.items()):
+            lines.append(f'manga2music_span_seconds_count{{span="{name}"}} {count}')
+            lines.append(f'manga2music_span_seconds_sum{{span="{name}"}} {total}')
+        for metric in sorted({metric for metric, _ in counters}):
+            lines.append(f"# TYPE manga2music_{metric}_total counter")
+            for (name, labels), value in sorted(counters.items()):
+                if name != metric:
+                    continue
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"manga2music_{metric}_total{{{label_text}}} {value}")
+        for metric, value in memory.items():
+            if value is None:
+                continue
+            lines.append(f"# TYPE manga2music_{metric} gauge")
+            lines.append(f"manga2music_{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9090):
+        """
+        Serve the metrics at `http://0.0.0.0:<port>/metrics` from a background thread.
+
+        Args:
+            port (int): Port to listen on.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.enabled = True
+        self._server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"Serving metrics at http://0.0.0.0:{port}/metrics")
+
+    def stats(self):
+        with self._lock:
+            return {name: tuple(stats) for name, stats in self._spans.items()}
+
+    def report(self):
+        stats = self.stats()
+        if not stats:
+            return
+        stages = ", ".join(
+            f"{name}={count}x/{total:.1f}s"
+            for name, (count, total) in sorted(stats.items())
+        )
+        print(f"Telemetry: {stages}; peak RSS {peak_rss_bytes() / 1024**3:.2f}GB")
+
+
+telemetry = Telemetry(path=os.environ.get("MANGA2MUSIC_TELEMETRY") or None)
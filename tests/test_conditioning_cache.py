@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from conditioning_cache import ConditioningCache
+
+PAD, EOS = 0, 1
+TEXTS = ["calm piano", "", "heroic brass over pounding drums", "calm piano"]
+
+
+class TinyT5Conditioner:
+    """
+    Text conditioner with the interface of audiocraft's `T5Conditioner`, on a
+    small randomly initialized T5 encoder and a word-level tokenizer.
+    """
+
+    def __init__(self):
+        torch.manual_seed(0)
+        config = transformers.T5Config(
+            vocab_size=32,
+            d_model=16,
+            d_kv=4,
+            d_ff=32,
+            num_layers=2,
+            num_heads=4,
+        )
+        # float64, so the comparisons below are exact up to rounding
+        self.t5 = transformers.T5EncoderModel(config).double().eval()
+        self.output_proj = torch.nn.Linear(16, 8).double()
+        self.tokenized = []
+
+    def tokenize(self, texts):
+        entries = [text or "" for text in texts]
+        ids = [
+            [2 + sum(map(ord, word)) % 30 for word in text.split()] + [EOS]
+            for text in entries
+        ]
+        length = max(map(len, ids))
+        input_ids = torch.full((len(ids), length), PAD)
+        mask = torch.zeros((len(ids), length), dtype=torch.long)
+        for i, row in enumerate(ids):
+            input_ids[i, : len(row)] = torch.tensor(row)
+            mask[i, : len(row)] = 1
+        # Empty descriptions are masked out entirely
+        for i, text in enumerate(entries):
+            if text == "":
+                mask[i] = 0
+        self.tokenized.append(entries)
+        return {"input_ids": input_ids, "attention_mask": mask}
+
+    def forward(self, inputs):
+        mask = inputs["attention_mask"]
+        with torch.no_grad():
+            embeds = self.t5(**inputs).last_hidden_state
+            embeds = self.output_proj(embeds)
+        return embeds * mask.unsqueeze(-1), mask
+
+
+def fake_musicgen(conditioner):
+    provider = SimpleNamespace(conditioners={"description": conditioner})
+    return SimpleNamespace(
+        lm=SimpleNamespace(condition_provider=provider), device="cpu"
+    )
+
+
+def install(cache):
+    conditioner = TinyT5Conditioner()
+    cache.install(fake_musicgen(conditioner), "musicgen-tiny")
+    return conditioner
+
+
+def encode(conditioner, texts):
+    return conditioner.forward(conditioner.tokenize(texts))
+
+
+def test_cached_conditioning_matches_uncached():
+    expected_embeds, expected_mask = encode(TinyT5Conditioner(), TEXTS)
+
+    cache = ConditioningCache()
+    conditioner = install(cache)
+    for _ in range(2):
+        embeds, mask = encode(conditioner, TEXTS)
+        torch.testing.assert_close(embeds, expected_embeds)
+        assert torch.equal(mask, expected_mask)
+
+
+def test_each_text_is_encoded_once():
+    cache = ConditioningCache()
+    conditioner = install(cache)
+    encode(conditioner, TEXTS)
+    encode(conditioner, TEXTS[:1])
+
+    # Duplicates within a batch and across batches are hits
+    assert conditioner.tokenized == [
+        ["calm piano", "", "heroic brass over pounding drums"]
+    ]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 3, 3)
+
+
+def test_least_recently_used_texts_are_dropped():
+    cache = ConditioningCache(max_entries=2)
+    conditioner = install(cache)
+    encode(conditioner, ["calm piano", "heroic brass"])
+    encode(conditioner, ["calm piano"])
+    encode(conditioner, ["eerie strings"])
+
+    encode(conditioner, ["calm piano", "heroic brass"])
+    assert conditioner.tokenized[-1] == ["heroic brass"]
+
+
+def test_installing_twice_keeps_one_cache_layer():
+    cache = ConditioningCache()
+    conditioner = install(cache)
+    forward = conditioner.forward
+
+    cache.install(fake_musicgen(conditioner), "musicgen-tiny")
+    assert conditioner.forward is forward
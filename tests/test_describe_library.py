@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("pytz")
+pytest.importorskip("PIL")
+
+from benchmarks.mock_openai_server import start_mock_server
+from manga2description import generate_descriptions_from_library
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def library(tmp_path):
+    # Pages are sent as-is without image optimization, so any bytes will do
+    for chapter in range(6):
+        chapter_path = tmp_path / "library" / f"chapter{chapter}"
+        chapter_path.mkdir(parents=True)
+        for page in range(2):
+            (chapter_path / f"{page:03d}.jpg").write_bytes(b"page")
+    return tmp_path / "library"
+
+
+@pytest.fixture
+def mock_server(request, monkeypatch):
+    server = start_mock_server(latency=0.2, jitter=0.0, **request.param)
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+    # prompt.json is read relative to the working directory
+    monkeypatch.chdir(ROOT)
+    yield server
+    server.shutdown()
+
+
+def describe(library, output_path, max_in_flight):
+    return generate_descriptions_from_library(
+        library,
+        output_path,
+        "gpt-4o-mini",
+        use_cache=False,
+        max_in_flight=max_in_flight,
+        optimize_images=False,
+        dedup=False,
+    )
+
+
+@pytest.mark.parametrize("mock_server", [{}], indirect=True)
+def test_in_flight_requests_are_bounded(library, tmp_path, mock_server):
+    output_files = describe(library, tmp_path / "out", max_in_flight=2)
+
+    assert len(output_files) == 6
+    # Two requests per chapter in two-step mode
+    assert mock_server.stats["requests"] == 12
+    assert mock_server.stats["max_in_flight"] == 2
+
+
+@pytest.mark.parametrize("mock_server", [{"fail_first": 3}], indirect=True)
+def test_rate_limited_requests_are_retried(library, tmp_path, mock_server):
+    output_files = describe(library, tmp_path / "out", max_in_flight=4)
+
+    assert len(output_files) == 6
+    assert mock_server.stats["rate_limited"] == 3
+    assert mock_server.stats["requests"] == 12 + 3
+    assert mock_server.stats["max_in_flight"] <= 4
+    for output_file in output_files:
+        assert "orchestral" in Path(output_file).read_text()
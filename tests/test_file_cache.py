@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from file_cache import FileCache
+
+KB = 1024
+
+
+class BlobCache(FileCache):
+    pattern = "*/*.bin"
+
+    def put(self, name, size):
+        path = self.cache_dir / name[:2] / f"{name}.bin"
+        self._write(path, lambda tmp_path: tmp_path.write_bytes(b"x" * size))
+        return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BlobCache(tmp_path, max_size_mb=10 * KB / 1024**2)
+
+
+def files(cache):
+    return sorted(path.stem for path in cache.cache_dir.glob("*/*"))
+
+
+def age(path, seconds):
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime - seconds, stat.st_mtime - seconds))
+
+
+def test_size_is_tracked_without_listing(cache, monkeypatch):
+    cache.put("a0", KB)
+    scans = []
+    scan = cache._scan
+    monkeypatch.setattr(cache, "_scan", lambda: scans.append(1) or scan())
+
+    cache.put("b0", 2 * KB)
+    # Replacing a file only counts the difference
+    cache.put("b0", 3 * KB)
+
+    assert scans == []
+    assert cache._size == 4 * KB
+
+
+def test_least_recently_used_files_are_evicted(cache):
+    for i, name in enumerate(["a0", "b0", "c0"]):
+        age(cache.put(name, 3 * KB), 100 - i)
+    # Using "a0" makes "b0" the least recently used file
+    cache._touch(cache.cache_dir / "a0" / "a0.bin")
+
+    cache.put("d0", 3 * KB)
+
+    # Eviction goes down to 90% of the bound
+    assert files(cache) == ["a0", "c0", "d0"]
+    assert cache._size == 9 * KB
+
+
+def test_size_is_recounted_after_the_folder_changes(cache, tmp_path):
+    cache.put("a0", 4 * KB)
+    cache.cache_dir = tmp_path / "other"
+    cache.put("b0", 8 * KB)
+
+    assert cache._size == 8 * KB
+    assert files(cache) == ["b0"]
+
+
+def test_temporary_files_are_ignored(cache):
+    path = cache.put("a0", KB)
+    path.with_suffix(".1.2.tmp").write_bytes(b"x" * 100 * KB)
+    # Count the files again on the next write
+    cache.cache_dir = cache.cache_dir
+
+    cache.put("b0", KB)
+
+    assert cache._size == 2 * KB
+    assert files(cache) == ["a0", "a0.1.2", "b0"]
@@ -0,0 +1,282 @@
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+pytest.importorskip("llava")
+
+from llava.constants import IMAGE_TOKEN_INDEX
+
+from models.llava import LLAVA
+
+PAD, EOS = 0, 1
+MAX_NEW_TOKENS = 12
+TEMPERATURE = 0.7
+# Every prompt starts with the same header tokens before its first page
+PREFIX = [5, 6, 7]
+INSTRUCTION = [10, 11, 12]
+
+
+class TinyLlavaQwen(transformers.Qwen2ForCausalLM):
+    """Qwen2 language model that splices projected page features into prompts."""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.projector = torch.nn.Linear(config.hidden_size, config.hidden_size)
+        self.post_init()
+
+    def prepare_inputs_labels_for_multimodal(
+        self,
+        input_ids,
+        position_ids,
+        attention_mask,
+        past_key_values,
+        labels,
+        images,
+        image_sizes=None,
+    ):
+        # Pages are matched to image tokens in order across the batch, and the
+        # result is padded on the side set in the config, like LLaVA-NeXT
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        embed_tokens = self.get_input_embeddings()
+        images = iter(images)
+        rows = []
+        for ids, mask in zip(input_ids, attention_mask):
+            parts = [
+                (
+                    self.projector(next(images))
+                    if token == IMAGE_TOKEN_INDEX
+                    else embed_tokens(token[None])
+                )
+                for token in ids[mask.bool()]
+            ]
+            rows.append(torch.cat(parts))
+        left = getattr(self.config, "tokenizer_padding_side", "right") == "left"
+        length = max(row.shape[0] for row in rows)
+        embeds = rows[0].new_zeros((len(rows), length, rows[0].shape[-1]))
+        new_mask = torch.zeros((len(rows), length), dtype=torch.long)
+        for i, row in enumerate(rows):
+            start = length - row.shape[0] if left else 0
+            embeds[i, start : start + row.shape[0]] = row
+            new_mask[i, start : start + row.shape[0]] = 1
+        return None, position_ids, new_mask, past_key_values, embeds, labels
+
+    @torch.no_grad()
+    def generate(self, inputs=None, images=None, image_sizes=None, **kwargs):
+        # Like LLaVA, generate from the spliced embeddings when given pages
+        if images is None:
+            return super().generate(inputs, **kwargs)
+        _, _, attention_mask, _, embeds, _ = self.prepare_inputs_labels_for_multimodal(
+            inputs, None, kwargs.pop("attention_mask", None), None, None, images
+        )
+        return super().generate(
+            inputs_embeds=embeds, attention_mask=attention_mask, **kwargs
+        )
+
+
+def detokenize(tokens, skip_special_tokens=False):
+    special = (PAD, EOS) if skip_special_tokens else ()
+    return " ".join(str(token) for token in tokens if token not in special)
+
+
+def tokenize_prompt(num_images):
+    return torch.tensor(PREFIX + [IMAGE_TOKEN_INDEX] * num_images + INSTRUCTION)
+
+
+@pytest.fixture
+def llava():
+    torch.manual_seed(0)
+    config = transformers.Qwen2Config(
+        vocab_size=64,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        attn_implementation="eager",
+    )
+    # float64, so padding cannot flip a greedy choice through rounding
+    model = TinyLlavaQwen(config).double().eval()
+    model.generation_config.eos_token_id = EOS
+    model.generation_config.pad_token_id = PAD
+    pages = {f"page{i}": torch.randn(4, 32, dtype=torch.float64) for i in range(8)}
+
+    # The wrapper without loading a checkpoint
+    llava = LLAVA.__new__(LLAVA)
+    llava.device = "cpu"
+    llava.model = model
+    llava.tokenizer = SimpleNamespace(
+        pad_token_id=PAD,
+        eos_token_id=EOS,
+        decode=detokenize,
+        batch_decode=lambda rows, skip_special_tokens=False: [
+            detokenize(row, skip_special_tokens) for row in rows.tolist()
+        ],
+    )
+    llava._tokenize_prompt = tokenize_prompt
+    llava._load_images = lambda paths: (
+        [pages[path] for path in paths],
+        [(8, 8)] * len(paths),
+    )
+    llava._prefix = None
+    llava._revision = {"model": "tiny-llava"}
+    return llava
+
+
+def until_eos(tokens):
+    return tokens[: tokens.index(EOS) + 1] if EOS in tokens else tokens
+
+
+def reference(llava, chapters, do_sample=False):
+    """`model.generate` over the whole left-padded prompts, with no prefix cache."""
+    length = max(prompt.shape[0] for prompt, _ in chapters)
+    input_ids = torch.full((len(chapters), length), PAD)
+    attention_mask = torch.zeros((len(chapters), length), dtype=torch.long)
+    for i, (prompt, _) in enumerate(chapters):
+        input_ids[i, length - prompt.shape[0] :] = prompt
+        attention_mask[i, length - prompt.shape[0] :] = 1
+    images, image_sizes = llava._load_images(
+        [page for _, pages in chapters for page in pages]
+    )
+    llava.model.config.tokenizer_padding_side = "left"
+    try:
+        tokens = llava.model.generate(
+            input_ids,
+            attention_mask=attention_mask,
+            images=images,
+            image_sizes=image_sizes,
+            do_sample=do_sample,
+            temperature=TEMPERATURE,
+            max_new_tokens=MAX_NEW_TOKENS,
+            pad_token_id=PAD,
+        )
+    finally:
+        llava.model.config.tokenizer_padding_side = "right"
+    return [until_eos(row) for row in tokens.tolist()]
+
+
+# Chapters of mixed page counts, out of page count order
+PAGE_LISTS = [["page0", "page1", "page2"], ["page3"], ["page4", "page5"], ["page6"]]
+
+
+def test_mixed_length_batches_keep_chapter_order(llava):
+    expected = [
+        detokenize(
+            reference(llava, [(tokenize_prompt(len(pages)), pages)])[0],
+            skip_special_tokens=True,
+        )
+        for pages in PAGE_LISTS
+    ]
+
+    # Batches of one-page chapters, then of a two- and a three-page chapter
+    descriptions = llava.generate_music_descriptions(
+        PAGE_LISTS, batch_size=2, do_sample=False, max_new_tokens=MAX_NEW_TOKENS
+    )
+    assert descriptions == expected
+
+
+def test_batched_descriptions_match_single_chapters(llava):
+    expected = [
+        llava.generate_music_description(
+            pages, do_sample=False, max_new_tokens=MAX_NEW_TOKENS
+        )
+        for pages in PAGE_LISTS
+    ]
+
+    descriptions = llava.generate_music_descriptions(
+        PAGE_LISTS, do_sample=False, max_new_tokens=MAX_NEW_TOKENS
+    )
+    assert descriptions == expected
+
+
+def chapter(*parts):
+    """Build a prompt and its pages; 'page<n>' parts are pages, ints are text tokens."""
+    ids = list(PREFIX)
+    pages = []
+    for part in parts:
+        if isinstance(part, str):
+            ids.append(IMAGE_TOKEN_INDEX)
+            pages.append(part)
+        else:
+            ids.append(part)
+    return torch.tensor(ids), pages
+
+
+CHAPTERS = [
+    chapter("page0", 10, 11, 12),
+    chapter("page1", "page2", 13),
+    chapter("page3", 14, "page4", 15, 16, 17, 18, 19),
+]
+
+
+def decode(llava, chapters, do_sample=False):
+    steps = list(
+        llava._decode(
+            [prompt for prompt, _ in chapters],
+            [pages for _, pages in chapters],
+            do_sample=do_sample,
+            temperature=TEMPERATURE,
+            max_new_tokens=MAX_NEW_TOKENS,
+        )
+    )
+    return [until_eos(row) for row in torch.stack(steps, dim=1).tolist()]
+
+
+def test_single_chapter_matches_generate(llava):
+    assert decode(llava, CHAPTERS[:1]) == reference(llava, CHAPTERS[:1])
+
+
+def test_padded_batch_matches_generate(llava):
+    expected = [reference(llava, [chapter])[0] for chapter in CHAPTERS]
+
+    assert decode(llava, CHAPTERS) == expected
+
+
+def test_seeded_sampling_matches_generate(llava):
+    torch.manual_seed(1)
+    expected = reference(llava, CHAPTERS, do_sample=True)
+
+    torch.manual_seed(1)
+    assert decode(llava, CHAPTERS, do_sample=True) == expected
+
+
+def test_prefix_cache_matches_uncached(llava):
+    expected = [reference(llava, [chapter])[0] for chapter in CHAPTERS]
+
+    # The first call computes the prefix cache, the others reuse it
+    assert decode(llava, CHAPTERS) == expected
+    assert llava._prefix[0] == tuple(PREFIX)
+    prefix = llava._prefix[1]
+    assert decode(llava, CHAPTERS[1:]) == expected[1:]
+    assert decode(llava, CHAPTERS) == expected
+    assert llava._prefix[1] is prefix
+
+
+def test_unsupported_generation_config_is_rejected(llava):
+    llava.model.generation_config.no_repeat_ngram_size = 2
+    with pytest.raises(ValueError, match="no_repeat_ngram_size"):
+        decode(llava, CHAPTERS[:1])
+
+
+def test_sampling_fields_only_matter_when_sampling(llava):
+    expected = reference(llava, CHAPTERS[:1])
+    llava.model.generation_config.min_p = 0.1
+
+    assert decode(llava, CHAPTERS[:1]) == expected
+    with pytest.raises(ValueError, match="min_p"):
+        decode(llava, CHAPTERS[:1], do_sample=True)
+
+
+def test_streamed_text_follows_each_chapter(llava):
+    streamed = {}
+    descriptions = llava.generate_music_descriptions(
+        PAGE_LISTS,
+        batch_size=2,
+        do_sample=False,
+        max_new_tokens=MAX_NEW_TOKENS,
+        on_text=streamed.__setitem__,
+    )
+
+    assert [streamed.get(i, "") for i in range(len(PAGE_LISTS))] == descriptions
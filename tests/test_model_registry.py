@@ -0,0 +1,115 @@
+import pytest
+
+from model_registry import ModelRegistry
+
+KB = 1024
+# Budgets are given in GB
+BUDGET_GB = 2 * KB / 1024**3
+
+
+class FakeTensor:
+    def __init__(self, size):
+        self.size = size
+
+    def data_ptr(self):
+        return id(self)
+
+    def numel(self):
+        return self.size
+
+    def element_size(self):
+        return 1
+
+
+class FakeModel:
+    """Holds `size` bytes of parameters, as measured by the registry."""
+
+    def __init__(self, size):
+        self.weight = FakeTensor(size)
+
+    def parameters(self):
+        return [self.weight]
+
+    def buffers(self):
+        return []
+
+
+@pytest.fixture
+def registry():
+    return ModelRegistry(memory_budget_gb=BUDGET_GB)
+
+
+def load(registry, name, size=KB, loads=None):
+    def loader():
+        if loads is not None:
+            loads.append(name)
+        return FakeModel(size)
+
+    return registry.get(name, "cpu", "float32", loader)
+
+
+def resident(registry):
+    return [name for name, _, _ in registry.stats()["resident"]]
+
+
+def test_models_stay_resident(registry):
+    loads = []
+    model = load(registry, "a", loads=loads)
+
+    assert load(registry, "a", loads=loads) is model
+    assert loads == ["a"]
+    stats = registry.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 0)
+
+
+def test_least_recently_used_model_is_evicted(registry):
+    load(registry, "a")
+    load(registry, "b")
+    # Using "a" again makes "b" the least recently used
+    load(registry, "a")
+    load(registry, "c")
+
+    assert resident(registry) == ["a", "c"]
+    assert registry.stats()["evictions"] == 1
+
+
+def test_models_in_use_are_not_evicted(registry):
+    with registry.use("a", "cpu", "float32", lambda: FakeModel(KB)):
+        load(registry, "b")
+        load(registry, "c")
+        assert resident(registry) == ["a", "c"]
+
+    # Over budget models are only kept until they are no longer in use
+    with registry.use("d", "cpu", "float32", lambda: FakeModel(KB)):
+        with registry.use("c", "cpu", "float32", lambda: FakeModel(KB)):
+            load(registry, "e")
+            assert resident(registry) == ["d", "c", "e"]
+        # "c" was used less recently than "e"
+        assert resident(registry) == ["d", "e"]
+
+
+def test_lowering_the_budget_evicts(registry):
+    load(registry, "a")
+    load(registry, "b")
+
+    registry.configure(memory_budget_gb=BUDGET_GB / 2)
+
+    assert resident(registry) == ["b"]
+
+
+def test_unlimited_budget_never_evicts():
+    registry = ModelRegistry(memory_budget_gb=None)
+    for name in "abcd":
+        load(registry, name, size=1024 * KB)
+
+    assert resident(registry) == list("abcd")
+
+
+def test_evict_by_name(registry):
+    load(registry, "a")
+    load(registry, "b")
+
+    registry.evict("a")
+    assert resident(registry) == ["b"]
+    registry.evict()
+    assert resident(registry) == []
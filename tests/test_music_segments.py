@@ -0,0 +1,109 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("audiocraft")
+
+from description2music import iter_music_segments
+
+SAMPLE_RATE = 32
+FRAME_RATE = 4
+# Offset the model adds to its rendering of the context, to tell it apart
+CONTEXT_OFFSET = 1000.0
+
+
+class RampMusicGen:
+    """
+    Generates a ramp holding each sample's position in the music.
+
+    Continuations start with the context they were given, like MusicGen, plus
+    `context_offset`, followed by the ramp from where the context ended.
+    """
+
+    name = "musicgen-ramp"
+    sample_rate = SAMPLE_RATE
+    frame_rate = FRAME_RATE
+    max_duration = 4
+
+    def __init__(self, context_offset=0.0):
+        self.context_offset = context_offset
+        self.duration = None
+        self.continuations = []
+
+    def set_generation_params(self, duration):
+        self.duration = duration
+
+    def _samples(self):
+        return int(self.duration * self.sample_rate)
+
+    def generate(self, descriptions, progress=False):
+        ramp = torch.arange(self._samples(), dtype=torch.float32)
+        return ramp.expand(len(descriptions), 1, -1).clone()
+
+    def generate_continuation(self, prompt, prompt_sample_rate, descriptions, progress):
+        assert prompt_sample_rate == self.sample_rate
+        self.continuations.append(prompt.shape[-1])
+        length = self._samples() - prompt.shape[-1]
+        start = prompt[..., -1:] + 1
+        continuation = start + torch.arange(length, dtype=torch.float32)
+        return torch.cat([prompt + self.context_offset, continuation], dim=-1)
+
+
+def segments(model, duration, **kwargs):
+    kwargs = {"segment_duration": 4, "context_duration": 1, "crossfade": 0.5, **kwargs}
+    chunks = list(iter_music_segments(model, ["calm piano"] * 2, duration, **kwargs))
+    return chunks, torch.cat(chunks, dim=-1)
+
+
+def test_segments_add_up_to_duration():
+    model = RampMusicGen()
+    chunks, audio = segments(model, duration=10)
+
+    assert audio.shape == (2, 1, 10 * SAMPLE_RATE)
+    # Each continuation is given one second of context
+    assert model.continuations == [SAMPLE_RATE, SAMPLE_RATE]
+    # With a faithful context, crossfading changes nothing
+    expected = torch.arange(10 * SAMPLE_RATE, dtype=torch.float32)
+    torch.testing.assert_close(audio[0, 0], expected)
+    torch.testing.assert_close(audio[1, 0], expected)
+    assert all(chunk.shape[-1] > 0 for chunk in chunks)
+
+
+def test_crossfade_blends_into_the_continuation():
+    model = RampMusicGen(context_offset=CONTEXT_OFFSET)
+    _, audio = segments(model, duration=10)
+
+    crossfade = SAMPLE_RATE // 2
+    fade_in = torch.linspace(0, 1, crossfade)
+    expected = torch.arange(10 * SAMPLE_RATE, dtype=torch.float32)
+    # The first segment holds 4s, each continuation adds 3s after its context
+    for end in (4 * SAMPLE_RATE, 7 * SAMPLE_RATE):
+        expected[end - crossfade : end] += CONTEXT_OFFSET * fade_in
+    torch.testing.assert_close(audio[0, 0], expected)
+
+
+def test_short_music_is_generated_at_once():
+    model = RampMusicGen()
+    chunks, audio = segments(model, duration=3)
+
+    assert len(chunks) == 1
+    assert model.continuations == []
+    assert audio.shape[-1] == 3 * SAMPLE_RATE
+
+
+def test_last_partial_frame_is_not_generated():
+    model = RampMusicGen()
+    # 4.1s leaves less than one token frame after the first segment
+    _, audio = segments(model, duration=4.1)
+
+    assert model.continuations == []
+    assert audio.shape[-1] == 4 * SAMPLE_RATE
+
+
+@pytest.mark.parametrize(
+    "context_duration, crossfade", [(1, 0), (1, 2), (4, 0.5), (5, 0.5)]
+)
+def test_invalid_overlap_is_rejected(context_duration, crossfade):
+    with pytest.raises(ValueError):
+        segments(
+            RampMusicGen(), 10, context_duration=context_duration, crossfade=crossfade
+        )
@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+from PIL import Image
+
+from page_dedup import PageIndex, dedup_pages, hamming_distance, perceptual_hash
+
+
+def panels(seed, size=512):
+    """A page of random gray panels, with enough structure for a stable hash."""
+    rng = np.random.default_rng(seed)
+    grid = rng.integers(0, 256, (8, 8)).astype(np.uint8)
+    return Image.fromarray(np.kron(grid, np.ones((size // 8, size // 8), np.uint8)))
+
+
+@pytest.fixture
+def pages(tmp_path):
+    page = panels(0)
+    paths = {
+        "page": tmp_path / "01.png",
+        "rescan": tmp_path / "02.jpg",
+        "resized": tmp_path / "03.png",
+        "other": tmp_path / "04.png",
+        "blank": tmp_path / "05.png",
+    }
+    page.save(paths["page"])
+    page.save(paths["rescan"], quality=60)
+    page.resize((460, 460), Image.Resampling.BILINEAR).save(paths["resized"])
+    panels(1).save(paths["other"])
+    Image.new("L", (512, 512), 250).save(paths["blank"])
+    return {name: str(path) for name, path in paths.items()}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return PageIndex(index_path=tmp_path / "pages.json")
+
+
+def page_hash(path):
+    with Image.open(path) as image:
+        return perceptual_hash(image)
+
+
+def test_near_duplicates_hash_within_the_default_threshold(pages):
+    original = page_hash(pages["page"])
+
+    assert hamming_distance(original, page_hash(pages["rescan"])) <= 4
+    assert hamming_distance(original, page_hash(pages["resized"])) <= 4
+    # Unrelated pages differ in about half of the 64 bits
+    assert hamming_distance(original, page_hash(pages["other"])) > 16
+
+
+def test_duplicates_and_blank_pages_are_dropped(pages, index):
+    kept = dedup_pages(list(pages.values()), index=index)
+
+    assert kept == [pages["page"], pages["other"]]
+
+
+def test_thresholds_can_keep_every_page(pages, index):
+    kept = dedup_pages(list(pages.values()), max_distance=-1, index=index)
+    assert kept == [pages[name] for name in ("page", "rescan", "resized", "other")]
+
+    kept = dedup_pages(
+        list(pages.values()), max_distance=-1, drop_blank=False, index=index
+    )
+    assert kept == list(pages.values())
+
+
+def test_first_occurrence_is_kept(pages, index):
+    kept = dedup_pages(
+        [pages["other"], pages["page"], pages["rescan"], pages["resized"]],
+        index=index,
+    )
+
+    assert kept == [pages["other"], pages["page"]]
+
+
+def test_folder_of_blank_pages_keeps_one_page(pages, index):
+    assert dedup_pages([pages["blank"]] * 3, index=index) == [pages["blank"]]
+
+
+def test_index_reuses_hashes_until_a_page_changes(pages, index, tmp_path):
+    dedup_pages(list(pages.values()), index=index)
+
+    reloaded = PageIndex(index_path=tmp_path / "pages.json")
+    assert all(reloaded.get(path)[2] for path in pages.values())
+
+    panels(2).save(pages["other"])
+    stat = os.stat(pages["other"])
+    # Make sure the edit is seen even on filesystems with coarse timestamps
+    os.utime(pages["other"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    page_hash, _, cached = reloaded.get(pages["other"])
+    assert not cached
+    assert page_hash == perceptual_hash(panels(2))
+
+
+def test_index_appends_new_entries_and_compacts_stale_ones(pages, index, tmp_path):
+    index_path = tmp_path / "pages.json"
+    dedup_pages(list(pages.values()), index=index)
+    lines = index_path.read_text().splitlines()
+    assert len(lines) == len(pages)
+
+    # Nothing changed, nothing is written
+    dedup_pages(list(pages.values()), index=index)
+    assert index_path.read_text().splitlines() == lines
+
+    panels(2).save(pages["other"])
+    stat = os.stat(pages["other"])
+    os.utime(pages["other"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    index.get(pages["other"])
+    index.save()
+    # The changed page is appended, earlier lines are kept as they are
+    assert index_path.read_text().splitlines()[: len(lines)] == lines
+    assert PageIndex(index_path=index_path).get(pages["other"])[2]
+
+    for _ in range(len(pages)):
+        stat = os.stat(pages["other"])
+        os.utime(pages["other"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        index.get(pages["other"])
+        index.save()
+    # Once stale lines outnumber the entries, the file is rewritten
+    assert len(index_path.read_text().splitlines()) <= 2 * len(pages)
+    assert list(tmp_path.glob("*.tmp")) == []
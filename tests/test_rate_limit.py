@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    """Monotonic clock that only advances while the bucket sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(
+        rate_limit, "asyncio", SimpleNamespace(Lock=asyncio.Lock, sleep=clock.sleep)
+    )
+    return clock
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_burst_up_to_capacity_then_wait(clock):
+    async def scenario():
+        bucket = TokenBucket(60)
+        for _ in range(60):
+            await bucket.acquire()
+        assert clock.sleeps == []
+        # One token per second
+        await bucket.acquire(3)
+
+    run(scenario())
+    assert clock.sleeps == [pytest.approx(3.0)]
+
+
+def test_refill_is_capped_at_capacity(clock):
+    async def scenario():
+        bucket = TokenBucket(60)
+        await bucket.acquire(60)
+        clock.now += 600
+        await bucket.acquire(60)
+        await bucket.acquire(1)
+
+    run(scenario())
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_requests_larger_than_capacity_are_clamped(clock):
+    async def scenario():
+        bucket = TokenBucket(10)
+        await bucket.acquire(1000)
+
+    run(scenario())
+    assert clock.sleeps == []
+
+
+def test_adjust_charges_and_refunds(clock):
+    async def scenario():
+        bucket = TokenBucket(60)
+        await bucket.acquire(30)
+        # The request used 60 tokens instead of 30, leaving none
+        bucket.adjust(30)
+        await bucket.acquire(6)
+        assert clock.sleeps == [pytest.approx(6.0)]
+        # Refunds never overfill the bucket
+        bucket.adjust(-1000)
+        await bucket.acquire(60)
+
+    run(scenario())
+    assert clock.sleeps == [pytest.approx(6.0)]
+
+
+def test_rate_limiter_records_actual_usage(clock):
+    async def scenario():
+        limiter = RateLimiter(requests_per_minute=120, tokens_per_minute=600)
+        await limiter.acquire(500)
+        limiter.record_usage(500, 560)
+        await limiter.acquire(100)
+        # Unknown usage leaves the estimate in place
+        limiter.record_usage(100, None)
+
+    run(scenario())
+    # 40 tokens were left after the correction, 60 more refill in 6 seconds
+    assert clock.sleeps == [pytest.approx(6.0)]
+
+
+def test_unlimited_rate_limiter_never_waits(clock):
+    async def scenario():
+        limiter = RateLimiter()
+        for _ in range(100):
+            await limiter.acquire(10**6)
+
+    run(scenario())
+    assert clock.sleeps == []
@@ -0,0 +1,63 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("audiocraft")
+
+from scenes import segment_scenes
+
+
+def pages(*scenes):
+    """Page embeddings where pages of the same letter show the same scene."""
+    letters = sorted(set("".join(scenes)))
+    basis = np.eye(len(letters))
+    return np.stack([basis[letters.index(letter)] for letter in "".join(scenes)])
+
+
+def test_scenes_split_where_the_content_changes():
+    assert segment_scenes(pages("aaa", "bbbb", "cc")) == [(0, 3), (3, 7), (7, 9)]
+
+
+def test_scenes_are_capped_at_max_pages():
+    scenes = segment_scenes(pages("a" * 20), max_pages=8)
+
+    assert scenes == [(0, 8), (8, 16), (16, 20)]
+
+
+def test_short_scenes_are_merged_into_the_previous_one():
+    scenes = segment_scenes(pages("aaa", "b", "ccc"), min_pages=2)
+
+    assert scenes == [(0, 4), (4, 7)]
+
+
+def test_merging_never_exceeds_max_pages():
+    # Merging the single "b" page would make a scene of four pages
+    scenes = segment_scenes(pages("aaa", "b", "ccc"), min_pages=2, max_pages=3)
+
+    assert scenes == [(0, 3), (3, 4), (4, 7)]
+
+
+def test_a_short_first_scene_is_kept():
+    assert segment_scenes(pages("a", "bbb"), min_pages=2) == [(0, 1), (1, 4)]
+
+
+@pytest.mark.parametrize("min_pages, max_pages", [(1, 1), (2, 3), (2, 8), (3, 5)])
+def test_scenes_cover_the_chapter_within_bounds(min_pages, max_pages):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(40, 16))
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    scenes = segment_scenes(
+        embeddings, threshold=0.2, min_pages=min_pages, max_pages=max_pages
+    )
+
+    assert scenes[0][0] == 0 and scenes[-1][1] == 40
+    assert all(end == start for (_, end), (start, _) in zip(scenes, scenes[1:]))
+    assert all(0 < end - start <= max_pages for start, end in scenes)
+    # A scene is only shorter than `min_pages` where merging would exceed
+    # `max_pages`, or when it is the first one
+    for (previous_start, _), (start, end) in zip(scenes, scenes[1:]):
+        assert end - start >= min_pages or end - previous_start > max_pages
+
+
+def test_single_page_chapter():
+    assert segment_scenes(np.zeros((1, 4))) == [(0, 1)]
@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("audiocraft")
+
+from cpu_inference import cpu_inference
+from description2music import generate_music_batch, generate_music_from_text
+from model_registry import registry
+from scheduler import BatchScheduler
+
+MODEL_NAME = "musicgen-fake"
+
+
+class FakeMusicGen:
+    """Returns quiet noise and records the descriptions of every generate call."""
+
+    name = MODEL_NAME
+    sample_rate = 32000
+
+    def __init__(self):
+        self.duration = None
+        self.calls = []
+
+    def set_generation_params(self, duration):
+        self.duration = duration
+
+    def generate(self, descriptions, progress=False):
+        self.calls.append(list(descriptions))
+        return 0.1 * torch.rand(len(descriptions), 1, self.sample_rate * self.duration)
+
+
+@pytest.fixture
+def model():
+    model = FakeMusicGen()
+    registry.get(MODEL_NAME, "cpu", cpu_inference.dtype_name(), lambda: model)
+    yield model
+    registry.evict(MODEL_NAME)
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = BatchScheduler(generate_music_batch, max_batch_size=4, max_wait=0.5)
+    yield scheduler
+    scheduler.close()
+
+
+def test_scheduled_requests_are_written(model, scheduler, tmp_path):
+    requests = [("calm piano", 2), ("heroic brass", 1)]
+
+    def run(request):
+        description, bulk_count = request
+        return generate_music_from_text(
+            description,
+            tmp_path / description.replace(" ", "_"),
+            MODEL_NAME,
+            duration=1,
+            audio_format="wav",
+            bulk_count=bulk_count,
+            device="cpu",
+            scheduler=scheduler,
+        )
+
+    with ThreadPoolExecutor(len(requests)) as executor:
+        results = list(executor.map(run, requests))
+
+    # Both requests ran in one batch
+    assert len(model.calls) == 1
+    assert sorted(model.calls[0]) == ["calm piano", "calm piano", "heroic brass"]
+    for (description, bulk_count), files in zip(requests, results):
+        assert len(files) == bulk_count
+        for path in map(Path, files):
+            assert path.parent.name == description.replace(" ", "_")
+            assert path.stat().st_size > 44
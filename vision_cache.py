@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from description_cache import hash_file
+from file_cache import FileCache
+
+
+class VisionFeatureCache(FileCache):
+    """
+    On-disk cache of LLaVA page tensors, memory-mapped on load.
+
+    Two kinds of tensors are stored per page: the processed pixel tensor
+    (`"pixels"`, the output of `process_images`) and the projected vision
+    embeddings (`"features"`, the output of the vision tower and projector).
+    Entries are keyed by the image content hash and the model revision, so
+    editing a prompt reuses every page while swapping a page or the model does
+    not. Tensors are stored as `.npy` files and loaded with copy-on-write memory
+    mapping, so a hit reads no more of the file than the model touches. The cache
+    is bounded in size and evicts least recently used files first.
+    """
+
+    pattern = "*/*.npy"
+
+    def __init__(self, cache_dir="./cache/vision", max_size_mb=4096):
+        """
+        Args:
+            cache_dir (str): Folder to store cached tensors in.
+            max_size_mb (float): Maximum total size of the cache in MB.
+        """
+        super().__init__(cache_dir, max_size_mb)
+        self._stats = {"hits": 0, "misses": 0}
+
+    def make_key(self, image_path, revision):
+        """
+        Compute the cache key of one page.
+
+        Args:
+            image_path (str): Path to the page image.
+            revision (dict): Model name, revision and preprocessing settings.
+
+        Returns:
+            str: Hex digest identifying the page for this model.
+        """
+        payload = {"image": hash_file(image_path), "revision": revision}
+        encoded = json.dumps(payload, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _path(self, key, kind):
+        return self.cache_dir / key[:2] / f"{key}.{kind}.npy"
+
+    def load(self, key, kind):
+        """
+        Return a cached tensor, or `None` on a miss.
+
+        Args:
+            key (str): Cache key from `make_key`.
+            kind (str): Tensor kind ('pixels' or 'features').
+
+        Returns:
+            torch.Tensor: CPU tensor backed by the memory-mapped file.
+        """
+        import torch
+
+        path = self._path(key, kind)
+        try:
+            array = np.load(path, mmap_mode="c")
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        self._touch(path)
+        with self._lock:
+            self._stats["hits"] += 1
+        return torch.from_numpy(array)
+
+    def save(self, key, kind, tensor):
+        """Store a tensor under `key` and evict files over the size bound."""
+        import torch
+
+        if tensor.dtype == torch.bfloat16:
+            # NumPy has no bfloat16; float32 holds it exactly
+            tensor = tensor.float()
+        array = tensor.detach().cpu().numpy()
+
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+
+        self._write(self._path(key, kind), write)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def report(self):
+        stats = self.stats()
+        if not stats["hits"] + stats["misses"]:
+            return
+        print(f"Vision cache: hits={stats['hits']} misses={stats['misses']}")
+
+
+vision_cache = VisionFeatureCache(
+    cache_dir=os.environ.get("MANGA2MUSIC_CACHE_DIR", "./cache") + "/vision"
+)
@@ -0,0 +1,226 @@
+import itertools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+def _delete_param(cfg, full_name):
+    """Drop a dotted key from an OmegaConf config, if present."""
+    from omegaconf import open_dict
+
+    *parents, name = full_name.split(".")
+    for part in parents:
+        if part not in cfg:
+            return
+        cfg = cfg[part]
+    if name in cfg:
+        with open_dict(cfg):
+            del cfg[name]
+
+
+class WeightCache:
+    """
+    On-disk safetensors copies of MusicGen checkpoints, memory-mapped on load.
+
+    audiocraft ships MusicGen as pickled `state_dict.bin` and
+    `compression_state_dict.bin` files, which `torch.load` unpickles and reads
+    in full on every start. The first load converts both checkpoints to
+    safetensors, with the model config kept in the file metadata. Later loads
+    map the files instead, so no pickle runs and pages that are already in the
+    OS page cache, for example after a container restart, are not read again.
+    The models are built on the meta device and adopt the mapped tensors as
+    their parameters, so no random initialization runs and, on CPU, the weights
+    are never copied out of the mapping.
+    """
+
+    def __init__(self, cache_dir="./cache/weights"):
+        """
+        Args:
+            cache_dir (str): Folder to store converted checkpoints in.
+        """
+        self.cache_dir = Path(cache_dir)
+        self._lock = threading.Lock()
+
+    def _path(self, model_name, part):
+        return self.cache_dir / model_name / f"{part}.safetensors"
+
+    def _convert(self, model_name, part):
+        """Convert one audiocraft checkpoint to safetensors."""
+        from audiocraft.models import loaders
+        from safetensors.torch import save_file
+
+        load_ckpt = {
+            "lm": loaders.load_lm_model_ckpt,
+            "compression": loaders.load_compression_model_ckpt,
+        }[part]
+        print(f"Converting {model_name} {part} weights to safetensors...")
+        pkg = load_ckpt(f"facebook/{model_name}")
+        if "pretrained" in pkg:
+            metadata = {"pretrained": pkg["pretrained"]}
+            state = {}
+        else:
+            metadata = {"xp.cfg": json.dumps(pkg["xp.cfg"])}
+            # safetensors refuses tensors sharing storage
+            state = {
+                name: tensor.detach().clone().contiguous()
+                for name, tensor in pkg["best_state"].items()
+            }
+        path = self._path(model_name, part)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        save_file(state, str(tmp_path), metadata=metadata)
+        os.replace(tmp_path, path)
+
+    def _load(self, model_name, part):
+        """Return the state dict and metadata of one checkpoint, on CPU."""
+        from safetensors import safe_open
+
+        path = self._path(model_name, part)
+        with self._lock:
+            if not path.exists():
+                self._convert(model_name, part)
+        # The tensors are views of the memory-mapped file
+        with safe_open(str(path), framework="pt") as f:
+            metadata = f.metadata()
+            state = {name: f.get_tensor(name) for name in f.keys()}
+        return state, metadata
+
+    def _build(self, build, cfg, state):
+        """
+        Build a model with `build` and make the tensors of `state` its weights.
+
+        The model is built on the meta device, which allocates and initializes
+        nothing, and `load_state_dict(assign=True)` replaces its meta tensors with
+        those of `state`, moved to `cfg.device`. On CPU, tensors stored in the
+        dtype the model computes in are used as they are, without a copy. A model
+        holding tensors that are not in `state` is built on `cfg.device` and loaded
+        by copy instead.
+        """
+        import torch
+
+        device = cfg.device
+        cfg.device = "meta"
+        try:
+            with torch.device("meta"):
+                model = build()
+        finally:
+            cfg.device = device
+        dtypes = {name: tensor.dtype for name, tensor in model.state_dict().items()}
+        state = {
+            name: tensor.to(device=device, dtype=dtypes.get(name, tensor.dtype))
+            for name, tensor in state.items()
+        }
+        model.load_state_dict(state, assign=True)
+        tensors = itertools.chain(model.parameters(), model.buffers())
+        if not any(tensor.is_meta for tensor in tensors):
+            return model
+        print(f"{type(model).__name__} has tensors outside its checkpoint, copying")
+        model = build()
+        model.load_state_dict(state)
+        return model
+
+    def _build_lm(self, cfg, condition_provider):
+        """
+        Build the MusicGen language model of `cfg` around `condition_provider`.
+
+        Mirrors `builders.get_lm_model`, which builds the conditioners itself.
+        """
+        import torch
+        from audiocraft.models import builders
+        from audiocraft.models.lm import LMModel
+        from audiocraft.utils.utils import dict_from_config
+        from omegaconf import OmegaConf
+
+        if cfg.lm_model != "transformer_lm":
+            raise KeyError(f"Unexpected LM model {cfg.lm_model}")
+        kwargs = dict_from_config(cfg.transformer_lm)
+        n_q = kwargs["n_q"]
+        q_modeling = kwargs.pop("q_modeling", None)
+        pattern_cfg = cfg.codebooks_pattern
+        if pattern_cfg.modeling is None:
+            pattern_cfg = OmegaConf.create(
+                {"modeling": q_modeling, "delay": {"delays": list(range(n_q))}}
+            )
+        fuser = builders.get_condition_fuser(cfg)
+        if len(fuser.fuse2cond["cross"]) > 0:
+            kwargs["cross_attention"] = True
+        guidance = dict_from_config(cfg.classifier_free_guidance)
+        return LMModel(
+            pattern_provider=builders.get_codebooks_pattern_provider(n_q, pattern_cfg),
+            condition_provider=condition_provider,
+            fuser=fuser,
+            cfg_dropout=guidance["training_dropout"],
+            cfg_coef=guidance["inference_coef"],
+            attribute_dropout=dict_from_config(cfg.attribute_dropout),
+            dtype=getattr(torch, cfg.dtype),
+            device=cfg.device,
+            **kwargs,
+        )
+
+    def load_musicgen(self, model_name, device="cuda"):
+        """
+        Build a MusicGen model from the converted checkpoints.
+
+        Mirrors `MusicGen.get_pretrained`, which builds the same modules from the
+        pickled checkpoints, except that the modules take the checkpoint tensors
+        as their weights (see `_build`).
+
+        Args:
+            model_name (str): Model name ('musicgen-small', 'musicgen-medium', 'musicgen-large').
+            device (str): Device to load the model on ('cuda' or 'cpu').
+
+        Returns:
+            MusicGen: The loaded model.
+        """
+        from audiocraft.models import CompressionModel, MusicGen, builders
+        from omegaconf import OmegaConf
+
+        start = time.perf_counter()
+        state, metadata = self._load(model_name, "lm")
+        cfg = OmegaConf.create(json.loads(metadata["xp.cfg"]))
+        cfg.device = str(device)
+        cfg.dtype = "float32" if cfg.device == "cpu" else "float16"
+        # Training-only settings `MusicGen.get_pretrained` drops as well
+        _delete_param(cfg, "conditioners.self_wav.chroma_stem.cache_path")
+        _delete_param(cfg, "conditioners.args.merge_text_conditions_p")
+        _delete_param(cfg, "conditioners.args.drop_desc_p")
+        # The T5 text encoder is loaded from Hugging Face and kept out of the LM
+        # state dict, so the conditioners are built on the device beforehand
+        provider = builders.get_conditioner_provider(cfg.transformer_lm.dim, cfg)
+        provider = provider.to(cfg.device)
+        lm = self._build(lambda: self._build_lm(cfg, provider), cfg, state)
+        lm.eval()
+        lm.cfg = cfg
+        del state
+
+        state, metadata = self._load(model_name, "compression")
+        if "pretrained" in metadata:
+            compression_model = CompressionModel.get_pretrained(
+                metadata["pretrained"], device=device
+            )
+        else:
+            cfg = OmegaConf.create(json.loads(metadata["xp.cfg"]))
+            cfg.device = str(device)
+            compression_model = self._build(
+                lambda: builders.get_compression_model(cfg), cfg, state
+            )
+            compression_model.eval()
+        del state
+
+        if "self_wav" in lm.condition_provider.conditioners:
+            lm.condition_provider.conditioners["self_wav"].match_len_on_eval = True
+            lm.condition_provider.conditioners["self_wav"]._use_masking = False
+        print(f"Loaded {model_name} weights in {time.perf_counter() - start:.1f}s")
+        return MusicGen(f"facebook/{model_name}", compression_model, lm)
+
+    def clear(self):
+        """Remove every converted checkpoint."""
+        for path in self.cache_dir.glob("*/*.safetensors"):
+            path.unlink(missing_ok=True)
+
+
+weight_cache = WeightCache(
+    cache_dir=os.environ.get("MANGA2MUSIC_CACHE_DIR", "./cache") + "/weights"
+)
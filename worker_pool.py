@@ -0,0 +1,239 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from cpu_inference import physical_cores, cpu_inference
+
+
+def _core_subsets(workers, cores_per_worker=None):
+    """Split the cores available to the process into one subset per worker."""
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    # Leave hyper-thread siblings idle, like the single-process thread setup
+    cores = cores[: physical_cores()]
+    cores_per_worker = cores_per_worker or max(1, len(cores) // workers)
+    return [
+        cores[(i * cores_per_worker) % len(cores) :][:cores_per_worker]
+        for i in range(workers)
+    ]
+
+
+def _worker(model, model_name, cores, level, compile, tasks, results):
+    """Generate music for the shards taken from `tasks` until a `None` arrives."""
+    import torch
+
+    from conditioning_cache import conditioning_cache
+
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    cpu_inference.setup_threads(intra_op=len(cores), inter_op=1)
+    # Only ever 'none' or 'bf16', which keep the shared float32 weights
+    cpu_inference.configure(optimization=level, compile=compile)
+    cpu_inference.optimize_musicgen(model)
+    conditioning_cache.install(model, model_name)
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, descriptions, duration, seed = task
+        try:
+            model.set_generation_params(duration=duration)
+            if seed is not None:
+                torch.manual_seed(seed)
+            with torch.no_grad():
+                musics = model.generate(descriptions).cpu().numpy()
+            # Hand the audio back through shared memory instead of the result pipe
+            buffer = shared_memory.SharedMemory(create=True, size=musics.nbytes)
+            np.ndarray(musics.shape, musics.dtype, buffer=buffer.buf)[:] = musics
+            results.put((job_id, (buffer.name, musics.shape, str(musics.dtype)), None))
+            buffer.close()
+        except Exception as e:
+            results.put((job_id, None, f"{type(e).__name__}: {e}"))
+
+
+class MusicWorkerPool:
+    """
+    Pool of CPU worker processes generating music with one shared copy of MusicGen.
+
+    The model is loaded once in the parent, its tensors are moved to shared memory
+    and the worker processes map the same pages, so RAM holds one copy of the
+    weights however many workers run. Each worker is pinned to its own subset of
+    cores with a matching thread count, and returns generated audio through a
+    shared-memory buffer rather than pickling it through a pipe. Shards are taken
+    from a common queue, so a slow shard does not hold up the other workers.
+
+    Dynamically quantized int8 weights are packed in a form that cannot be placed
+    in shared memory, so the workers run float32 weights, with bfloat16 autocast
+    where the CPU optimization level is 'bf16'. If a worker dies, the shard it
+    held is lost, so every pending future fails and the pool accepts no more work.
+    """
+
+    def __init__(self, model_name, workers=None, cores_per_worker=None):
+        """
+        Args:
+            model_name (str): MusicGen model name ('musicgen-small', 'musicgen-medium', 'musicgen-large').
+            workers (int): Number of worker processes (default: one per 4 physical cores).
+            cores_per_worker (int): Cores pinned to each worker (default: an even split).
+        """
+        self.model_name = model_name
+        self.workers = workers or max(1, physical_cores() // 4)
+        self.cores = _core_subsets(self.workers, cores_per_worker)
+        self.sample_rate = None
+        self._processes = []
+        self._futures = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._closing = False
+        self._broken = None
+
+    def start(self):
+        import torch.multiprocessing as mp
+
+        from weight_cache import weight_cache
+
+        print(
+            f"Starting {self.workers} music workers on cores "
+            f"{', '.join(f'{c[0]}-{c[-1]}' for c in self.cores)}"
+        )
+        level = cpu_inference.level
+        if level == "int8":
+            print("int8 weights cannot be shared between workers, using float32")
+            level = "none"
+        model = weight_cache.load_musicgen(self.model_name, device="cpu")
+        model.lm.share_memory()
+        model.compression_model.share_memory()
+        self.sample_rate = model.sample_rate
+
+        # Spawned workers receive the shared tensors by handle, not by copy
+        context = mp.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        for cores in self.cores:
+            process = context.Process(
+                target=_worker,
+                args=(
+                    model,
+                    self.model_name,
+                    cores,
+                    level,
+                    cpu_inference.compile,
+                    self._tasks,
+                    self._results,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        return self
+
+    def _collect(self):
+        while True:
+            # Checked on every pass, so a steady stream of results from the other
+            # workers cannot hide a dead one
+            self._check_workers()
+            try:
+                job_id, result, error = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if job_id is None:
+                return
+            with self._lock:
+                # Gone if it was failed when a worker died
+                future = self._futures.pop(job_id, None)
+            if error is not None:
+                if future is not None:
+                    future.set_exception(RuntimeError(error))
+                continue
+            name, shape, dtype = result
+            buffer = shared_memory.SharedMemory(name=name)
+            try:
+                audio = np.ndarray(shape, dtype, buffer=buffer.buf).copy()
+            finally:
+                buffer.close()
+                buffer.unlink()
+            if future is not None:
+                future.set_result(audio)
+
+    def _check_workers(self):
+        """Fail every pending future once a worker has exited unexpectedly."""
+        if self._closing or self._broken is not None:
+            return
+        dead = [process for process in self._processes if not process.is_alive()]
+        if not dead:
+            return
+        with self._lock:
+            self._broken = (
+                f"Music worker {dead[0].pid} exited with code {dead[0].exitcode}"
+            )
+            futures = list(self._futures.values())
+            self._futures.clear()
+        print(f"{self._broken}, failing {len(futures)} pending shards")
+        for future in futures:
+            future.set_exception(RuntimeError(self._broken))
+
+    def submit(self, descriptions, duration, seed=None):
+        """
+        Queue one shard of descriptions for the next free worker.
+
+        Returns:
+            Future: Resolves to a [B, C, T] float32 array of audio.
+        """
+        future = Future()
+        with self._lock:
+            if self._broken is not None:
+                raise RuntimeError(self._broken)
+            job_id = self._next_id
+            self._next_id += 1
+            self._futures[job_id] = future
+        self._tasks.put((job_id, list(descriptions), duration, seed))
+        return future
+
+    def map(self, descriptions, duration, shard_size=1, seed=None):
+        """
+        Generate music for every description, sharded across the workers.
+
+        Args:
+            descriptions (list): Text descriptions.
+            duration (int): Length of the generated music in seconds.
+            shard_size (int): Number of descriptions per `model.generate` call.
+            seed (int): Random seed (`None` for unseeded). Each shard is seeded with
+                `seed` plus the index of its first description.
+
+        Yields:
+            np.ndarray: The [C, T] audio of each description, in input order.
+        """
+        futures = [
+            self.submit(
+                descriptions[start : start + shard_size],
+                duration,
+                None if seed is None else seed + start,
+            )
+            for start in range(0, len(descriptions), shard_size)
+        ]
+        for future in futures:
+            yield from future.result()
+
+    def close(self):
+        self._closing = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join()
+        self._results.put((None, None, None))
+        self._collector.join()
+        self._processes = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()